@@ -1,20 +1,44 @@
 import argparse
-import csv
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
 from datetime import date
 import logging
+import multiprocessing
 import sys
 import os
+import threading
 import numpy as np
 from src.analysis_context import (
     load_plan_and_machine_config,
     parse_ptn_with_optional_mu_correction,
 )
-from src.calculator import calculate_differences_for_layer
-from src.point_gamma_workflow import calculate_point_gamma_for_layer
-from src.report_generator import generate_report
-from src.report_csv_exporter import export_report_csv
+from src.calculator import (
+    calculate_differences_for_layer,
+    prepare_difference_intermediates,
+)
+from src.fluence_gamma import (
+    calculate_fluence_gamma_for_layer,
+    fluence_gamma_report_config,
+    prepare_fluence_gamma_intermediates,
+)
+from src.layer_cache import layer_cache_from_config
+from src.point_gamma_workflow import (
+    calculate_point_gamma_for_layer,
+    prepare_combined_intermediates,
+    prepare_point_gamma_intermediates,
+    split_combined_intermediates,
+)
+from src.report_csv_exporter import export_point_gamma_report_csv, export_report_csv
 from src.config_loader import parse_yaml_config
-from src.planrange_parser import parse_planrange_for_directory
+from src.debug_dump import DebugDumpWriter, debug_dump_path
+from src.delivery_index import (
+    delivery_index_cache_dir,
+    load_delivery_index,
+)
+from src.pipeline_profiler import pipeline_profiler_from_config
+from src.ptn_prefetch import PtnPrefetcher
+from src import run_profile
+from src.run_profile import LayerProfile, RunProfile, memory_tracker_from_config
 
 logger = logging.getLogger(__name__)
 
@@ -33,8 +57,22 @@ def _normalize_report_paths(report_paths):
     return normalized
 
 
+def generate_report(*args, **kwargs):
+    """``src.report_generator.generate_report``, imported on first use.
+
+    Keeps matplotlib out of CSV-only runs and of every module importing main.
+    """
+    from src.report_generator import generate_report as _generate_report
+
+    return _generate_report(*args, **kwargs)
+
+
 def find_ptn_files(directory: str, *, sort_paths: bool = False) -> list[str]:
-    """Return PTN files under ``directory`` with optional deterministic ordering."""
+    """Return PTN files under ``directory`` with optional deterministic ordering.
+
+    Kept as public API only; ``run_analysis`` takes its PTN files from the
+    directory index (``src.delivery_index``).
+    """
     ptn_files = []
     for root, _, files in os.walk(directory):
         for file_name in files:
@@ -50,6 +88,65 @@ def _analysis_mode(config):
     return str(config.get("ANALYSIS_MODE", "trajectory")).lower()
 
 
+def _prepare_layer_intermediates(analysis_mode, layer_data, log_data, config):
+    if analysis_mode == "point_gamma":
+        return prepare_point_gamma_intermediates(layer_data, log_data, config)
+    if analysis_mode == "fluence_gamma":
+        return prepare_fluence_gamma_intermediates(layer_data, log_data, config)
+    if analysis_mode == "both":
+        return prepare_combined_intermediates(layer_data, log_data, config)
+    return prepare_difference_intermediates(layer_data, log_data, config)
+
+
+def _calculate_combined_layer(
+    layer_data,
+    log_data,
+    config,
+    save_to_csv=False,
+    csv_filename="",
+    intermediates=None,
+    **layer_kwargs,
+):
+    """Trajectory and point-gamma results from one set of intermediates.
+
+    Debug output (CSV or dump sink) describes the trajectory pass.
+    """
+    with run_profile.stage("calculator"):
+        if intermediates is None:
+            intermediates = prepare_combined_intermediates(layer_data, log_data, config)
+        if "error" in intermediates:
+            return {"error": intermediates["error"]}, None
+        trajectory, point_gamma = split_combined_intermediates(intermediates)
+        trajectory_results = calculate_differences_for_layer(
+            layer_data,
+            log_data,
+            save_to_csv=save_to_csv,
+            csv_filename=csv_filename,
+            config=config,
+            intermediates=trajectory,
+            **layer_kwargs,
+        )
+    with run_profile.stage("gamma"):
+        point_gamma_results = calculate_point_gamma_for_layer(
+            layer_data,
+            log_data,
+            config,
+            intermediates=point_gamma,
+        )
+    return trajectory_results, point_gamma_results
+
+
+def _point_gamma_report_data(report_data, analysis_mode):
+    """Report data holding the point-gamma layers of this run."""
+    if analysis_mode != "both":
+        return report_data
+    return {
+        "_patient_id": report_data.get("_patient_id", ""),
+        "_patient_name": report_data.get("_patient_name", ""),
+        **report_data.get("_point_gamma", {}),
+    }
+
+
 def _resolve_machine_gamma_config(app_config, machine_name):
     analysis_config = dict(app_config)
     normalization_map = analysis_config.get("GAMMA_NORMALIZATION_FACTOR_BY_MACHINE", {})
@@ -69,65 +166,13 @@ def derive_report_name(log_dir, today=None):
     return f"PTN_report_{case_id}_{report_date.isoformat()}"
 
 
-def collect_ptn_delivery_groups(log_dir):
-    groups = []
+def collect_ptn_delivery_groups(log_dir, cache_dir=None):
+    """Group the PTN files under ``log_dir`` by delivery directory.
 
-    direct_ptn_files = sorted(
-        os.path.join(log_dir, entry.name)
-        for entry in os.scandir(log_dir)
-        if entry.is_file() and entry.name.endswith(".ptn")
-    )
-    if direct_ptn_files:
-        groups.append(
-            {
-                "source_dir": log_dir,
-                "ptn_files": direct_ptn_files,
-                "planrange_lookup": parse_planrange_for_directory(log_dir),
-                "beam_number": read_planinfo_beam_number(log_dir),
-            }
-        )
-
-    subdirs = sorted(
-        (entry.path for entry in os.scandir(log_dir) if entry.is_dir()),
-        key=os.path.basename,
-    )
-    for subdir in subdirs:
-        ptn_files = sorted(find_ptn_files(subdir))
-        if not ptn_files:
-            continue
-        groups.append(
-            {
-                "source_dir": subdir,
-                "ptn_files": ptn_files,
-                "planrange_lookup": parse_planrange_for_directory(subdir),
-                "beam_number": read_planinfo_beam_number(subdir),
-            }
-        )
-
-    return groups
-
-
-def read_planinfo_beam_number(directory):
-    planinfo_path = os.path.join(directory, "PlanInfo.txt")
-    if not os.path.isfile(planinfo_path):
-        return None
-
-    try:
-        with open(planinfo_path, "r", encoding="utf-8") as handle:
-            reader = csv.reader(handle)
-            for row in reader:
-                if len(row) < 2:
-                    continue
-                if row[0].strip() == "DICOM_BEAM_NUMBER":
-                    value = row[1].strip()
-                    if value:
-                        return int(value)
-    except (OSError, ValueError) as exc:
-        logger.warning(
-            "Failed to read PlanInfo beam number from %s: %s", planinfo_path, exc
-        )
-
-    return None
+    ``cache_dir`` enables the on-disk directory index, so repeated runs on an
+    unchanged case directory skip the directory walk.
+    """
+    return load_delivery_index(log_dir, cache_dir=cache_dir).delivery_groups(log_dir)
 
 
 def match_delivery_groups_to_beams(plan_beams, delivery_groups):
@@ -170,22 +215,311 @@ def match_delivery_groups_to_beams(plan_beams, delivery_groups):
     return matched
 
 
-def run_analysis(log_dir, dcm_file, output_dir, report_name=None):
+def _beam_layer_tasks(beam_number, beam_data, matched_group):
+    """``(beam_number, layer_index, ptn_file)`` per plan layer of one beam.
+
+    Plan layers are paired with the group's PTN files in order; pairing stops
+    at the first layer without a PTN file.
     """
-    Runs the analysis on the given DICOM and PTN files and generates plot images.
+    beam_name = beam_data.get("name", f"Beam {beam_number}")
+    ptn_file_iter = iter(matched_group["ptn_files"])
+    tasks = []
+    for layer_index in beam_data.get("layers", {}):
+        ptn_file = next(ptn_file_iter, None)
+        if ptn_file is None:
+            logger.warning(
+                f"No more PTN files to process for layer {layer_index} of beam {beam_name}."
+            )
+            break
+        tasks.append((beam_number, layer_index, ptn_file))
+    return tasks
+
+
+def _analyze_layer(context, beam_number, layer_index, ptn_file, raw_data=None):
+    """Parse, correct and analyze one PTN file against its plan layer.
+
+    ``raw_data`` is a future holding the file's words when it was read ahead
+    by ``PtnPrefetcher``.
+
+    Returns ``(outcome, layer_profile)``.  ``outcome`` is
+    ``(analysis_results, point_gamma_results, debug_columns)``, or ``None``
+    when the layer is skipped; the reason is logged here.  ``debug_columns``
+    is set when the binary debug dump is enabled and is written by the
+    caller, so the dump order does not depend on which process analyzed the
+    layer.  ``layer_profile`` is the layer's ``LayerProfile.to_dict()``.
     """
-    app_config_path = os.path.join(os.path.dirname(__file__) or ".", "config.yaml")
-    if not os.path.exists(app_config_path):
-        raise FileNotFoundError(f"App config file not found: {app_config_path}")
+    layer_profile = LayerProfile(
+        beam_number, layer_index, ptn_file, memory=context["memory_tracker"]
+    )
+    with layer_profile.activate():
+        outcome = _analyze_layer_outcome(
+            context, beam_number, layer_index, ptn_file, raw_data
+        )
+    return outcome, layer_profile.to_dict()
+
+
+def _layer_stage(analysis_mode):
+    return "gamma" if analysis_mode in ("point_gamma", "fluence_gamma") else "calculator"
+
+
+def _analyze_layer_outcome(context, beam_number, layer_index, ptn_file, raw_data):
+    beam_data = context["beams"][beam_number]
+    beam_name = beam_data.get("name", f"Beam {beam_number}")
+    layer_data = beam_data["layers"][layer_index]
+    planrange_lookup = context["planrange_lookups"][beam_number]
+    analysis_config = context["analysis_config"]
+    analysis_mode = context["analysis_mode"]
+    layer_cache = context["layer_cache"]
+
+    intermediates = None
+    cache_key = None
+    if layer_cache is not None:
+        cache_key = layer_cache.key(
+            ptn_file=ptn_file,
+            plan_layer=layer_data,
+            machine_config=context["config"],
+            analysis_config=analysis_config,
+            analysis_mode=analysis_mode,
+            range_info=planrange_lookup.get(os.path.abspath(ptn_file)),
+        )
+        intermediates = layer_cache.load(cache_key)
+
+    log_data_raw = None
+    if intermediates is None:
+        try:
+            parse_kwargs = {}
+            if raw_data is not None:
+                with run_profile.stage("ptn_read"):
+                    parse_kwargs["raw_data"] = raw_data.result()
+            log_data_raw = parse_ptn_with_optional_mu_correction(
+                ptn_file,
+                context["config"],
+                planrange_lookup,
+                **parse_kwargs,
+            )
+            if not log_data_raw:
+                logger.warning(f"Could not parse PTN file or it is empty: {ptn_file}")
+                return None
+        except (KeyError, ValueError, IOError) as e:
+            logger.error(f"Error parsing PTN file {ptn_file}: {e}")
+            return None
+        run_profile.count(
+            samples=len(log_data_raw.get("x", ())),
+            nbytes=_ptn_file_size(ptn_file, parse_kwargs.get("raw_data")),
+        )
 
+    debug_columns = []
     try:
-        app_config = parse_yaml_config(app_config_path)
+        save_csv_for_this_layer = (
+            context["save_debug_csv"] and not context["use_debug_dump"]
+        )
+        csv_filepath = ""
+        layer_kwargs = {}
+        layer_number = layer_index // 2 + 1
+        if save_csv_for_this_layer:
+            csv_filepath = os.path.join(
+                context["output_dir"],
+                f"debug_data_beam_{beam_number}_layer_{layer_number}.csv",
+            )
+        if context["use_debug_dump"]:
+            layer_kwargs["debug_sink"] = debug_columns.append
+        if layer_cache is not None:
+            if intermediates is None:
+                with run_profile.stage(_layer_stage(analysis_mode)):
+                    intermediates = _prepare_layer_intermediates(
+                        analysis_mode,
+                        layer_data,
+                        log_data_raw,
+                        analysis_config,
+                    )
+                if "error" not in intermediates:
+                    layer_cache.store(cache_key, intermediates)
+            layer_kwargs["intermediates"] = intermediates
+
+        point_gamma_results = None
+        if analysis_mode == "both":
+            analysis_results, point_gamma_results = _calculate_combined_layer(
+                layer_data,
+                log_data_raw,
+                analysis_config,
+                save_to_csv=save_csv_for_this_layer,
+                csv_filename=csv_filepath,
+                **layer_kwargs,
+            )
+        elif analysis_mode == "point_gamma":
+            with run_profile.stage("gamma"):
+                analysis_results = calculate_point_gamma_for_layer(
+                    layer_data,
+                    log_data_raw,
+                    analysis_config,
+                    save_to_csv=save_csv_for_this_layer,
+                    csv_filename=csv_filepath,
+                    **layer_kwargs,
+                )
+        elif analysis_mode == "fluence_gamma":
+            with run_profile.stage("gamma"):
+                analysis_results = calculate_fluence_gamma_for_layer(
+                    layer_data,
+                    log_data_raw,
+                    analysis_config,
+                    save_to_csv=save_csv_for_this_layer,
+                    csv_filename=csv_filepath,
+                    **layer_kwargs,
+                )
+        else:
+            with run_profile.stage("calculator"):
+                analysis_results = calculate_differences_for_layer(
+                    layer_data,
+                    log_data_raw,
+                    save_to_csv=save_csv_for_this_layer,
+                    csv_filename=csv_filepath,
+                    config=analysis_config,
+                    **layer_kwargs,
+                )
+    except (KeyError, ValueError, TypeError) as e:
+        logger.error(
+            f"Error calculating differences for {beam_name}, Layer {layer_index}: {e}"
+        )
+        return None
+
+    if "error" in analysis_results:
+        logger.warning(f"Skipping layer due to error: {analysis_results['error']}")
+        return None
+
+    return (
+        analysis_results,
+        point_gamma_results,
+        debug_columns[0] if debug_columns else None,
+    )
+
+
+def _ptn_file_size(ptn_file, raw_data=None):
+    if raw_data is not None:
+        return int(raw_data.nbytes)
+    try:
+        return os.path.getsize(ptn_file)
+    except OSError:
+        return 0
+
+
+_worker_layer_context = None
+
+
+def _init_layer_worker(context):
+    global _worker_layer_context
+    _worker_layer_context = context
+
+
+def _analyze_layer_in_worker(task):
+    return _analyze_layer(_worker_layer_context, *task)
+
+
+def _layer_pool_context():
+    # Fork shares the plan data with the workers copy-on-write, but forking a
+    # process that runs other threads (the analysis service, read-ahead) can
+    # copy a lock one of them holds into the child.  Those processes, and
+    # platforms without fork, pickle the context once per worker through the
+    # pool initializer instead.
+    start_methods = multiprocessing.get_all_start_methods()
+    if threading.active_count() == 1 and "fork" in start_methods:
+        return multiprocessing.get_context("fork")
+    if "forkserver" in start_methods:
+        return multiprocessing.get_context("forkserver")
+    return None
+
+
+def start_layer_worker_pool(workers):
+    """Start a layer process pool that ``run_analysis`` can reuse across runs.
+
+    Long-running callers start it before their own threads: fork then
+    launches every worker at once from the caller's warm state.  Otherwise
+    the workers come from a forkserver that has imported this module.
+    """
+    mp_context = _layer_pool_context()
+    if mp_context is not None and mp_context.get_start_method() == "forkserver":
+        mp_context.set_forkserver_preload(["main"])
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=mp_context)
+    # The first task launches the workers (all of them under fork).
+    executor.submit(int).result()
+    return executor
+
+
+def _layer_task_context(context, beam_number, layer_index):
+    """``context`` trimmed to the one plan layer a task analyzes."""
+    beam_data = context["beams"][beam_number]
+    return {
+        **context,
+        "beams": {
+            beam_number: {
+                **beam_data,
+                "layers": {layer_index: beam_data["layers"][layer_index]},
+            }
+        },
+        "planrange_lookups": {beam_number: context["planrange_lookups"][beam_number]},
+    }
+
+
+def _run_layer_tasks(context, tasks, workers=1, executor=None):
+    """Yield the ``_analyze_layer`` outcome of each task, in task order.
+
+    ``executor`` is a pool from ``start_layer_worker_pool``; it outlives the
+    run, so each task carries its own trimmed context instead of the pool
+    initializer.
+    """
+    if workers <= 1 or len(tasks) <= 1:
+        # Cache hits skip the PTN read, so read-ahead would only add I/O.
+        if context["prefetch_depth"] < 1 or context["layer_cache"] is not None:
+            for task in tasks:
+                yield _analyze_layer(context, *task)
+            return
+        with PtnPrefetcher(
+            [ptn_file for _, _, ptn_file in tasks],
+            depth=context["prefetch_depth"],
+            max_bytes=context["prefetch_max_bytes"],
+            concurrency=context["read_concurrency"],
+        ) as prefetcher:
+            for task, (_, raw_data) in zip(tasks, prefetcher):
+                yield _analyze_layer(context, *task, raw_data=raw_data)
+        return
+
+    if executor is not None:
+        contexts = [
+            _layer_task_context(context, beam_number, layer_index)
+            for beam_number, layer_index, _ in tasks
+        ]
+        yield from executor.map(_analyze_layer, contexts, *zip(*tasks))
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(tasks)),
+        mp_context=_layer_pool_context(),
+        initializer=_init_layer_worker,
+        initargs=(context,),
+    ) as executor:
+        yield from executor.map(_analyze_layer_in_worker, tasks)
+
+
+def app_config_path():
+    return os.path.join(os.path.dirname(__file__) or ".", "config.yaml")
+
+
+def load_app_config():
+    """Parse the ``config.yaml`` next to this script."""
+    config_path = app_config_path()
+    if not os.path.exists(config_path):
+        raise FileNotFoundError(f"App config file not found: {config_path}")
+
+    try:
+        return parse_yaml_config(config_path)
     except Exception as e:
         raise ValueError(f"Failed to parse config file: {e}")
 
+
+def load_analysis_inputs(dcm_file, app_config):
+    """Return ``(plan_data, machine_config)`` for ``dcm_file``."""
     try:
         logger.info("Parsing DICOM file: %s", dcm_file)
-        plan_data_raw, config = load_plan_and_machine_config(
+        return load_plan_and_machine_config(
             dcm_file,
             zero_dose_config=app_config,
         )
@@ -194,6 +528,89 @@ def run_analysis(log_dir, dcm_file, output_dir, report_name=None):
     except Exception as e:
         raise ValueError(f"Failed to load analysis inputs: {e}")
 
+
+def run_analysis(
+    log_dir,
+    dcm_file,
+    output_dir,
+    report_name=None,
+    workers=1,
+    app_config=None,
+    plan_inputs=None,
+    profile=None,
+    profile_stages=None,
+    profile_memory=None,
+    layer_executor=None,
+):
+    """
+    Runs the analysis on the given DICOM and PTN files and generates plot images.
+
+    With ``workers`` > 1 the layers are analyzed in a process pool; results
+    are collected in the same beam and layer order as a sequential run;
+    ``layer_executor`` (see ``start_layer_worker_pool``) is then used instead
+    of a pool started for this run.
+    ``app_config`` and ``plan_inputs`` (the result of ``load_analysis_inputs``)
+    let long-running callers reuse already parsed inputs.  Per-stage timings
+    are written to ``run_profile.json`` in ``output_dir``.
+
+    ``profile`` and ``profile_stages`` override the ``profiling`` section of
+    ``config.yaml``; when profiling is on, cProfile output is written to
+    ``output_dir`` even if the analysis fails.  ``profile_memory`` likewise
+    overrides ``profiling.memory``: RSS, tracemalloc peaks and top allocators
+    per stage and per layer are then added to ``run_profile.json``.
+    """
+    if app_config is None:
+        app_config = load_app_config()
+    memory = memory_tracker_from_config(app_config, enabled=profile_memory)
+    profiler = pipeline_profiler_from_config(
+        app_config, enabled=profile, stages=profile_stages
+    )
+    if profiler is not None and workers > 1:
+        logger.warning(
+            "Profiling analyzes layers in this process; ignoring workers=%d", workers
+        )
+        workers = 1
+
+    analysis_args = (
+        log_dir,
+        dcm_file,
+        output_dir,
+        report_name,
+        workers,
+        app_config,
+        plan_inputs,
+        memory,
+        layer_executor,
+    )
+    with memory.tracing() if memory is not None else contextlib.nullcontext():
+        if profiler is None:
+            return _run_analysis(*analysis_args)
+        try:
+            with profiler.activate():
+                report_data = _run_analysis(*analysis_args)
+        finally:
+            profile_paths = profiler.write(output_dir)
+    report_data["_profile_paths"] = list(profile_paths)
+    return report_data
+
+
+def _run_analysis(
+    log_dir,
+    dcm_file,
+    output_dir,
+    report_name,
+    workers,
+    app_config,
+    plan_inputs,
+    memory,
+    layer_executor,
+):
+    profile = RunProfile(workers=workers, memory=memory)
+    if plan_inputs is None:
+        with profile.stage("dicom_parse"):
+            plan_inputs = load_analysis_inputs(dcm_file, app_config)
+    plan_data_raw, config = plan_inputs
+
     if not plan_data_raw or "beams" not in plan_data_raw or not plan_data_raw["beams"]:
         raise ValueError("Failed to parse DICOM file or it contains no beam data.")
 
@@ -204,7 +621,10 @@ def run_analysis(log_dir, dcm_file, output_dir, report_name=None):
         **_resolve_machine_gamma_config(app_config, machine_name),
     }
 
-    delivery_groups = collect_ptn_delivery_groups(log_dir)
+    with profile.stage("directory_scan"):
+        delivery_groups = collect_ptn_delivery_groups(
+            log_dir, cache_dir=delivery_index_cache_dir(app_config, output_dir)
+        )
     if not delivery_groups:
         raise FileNotFoundError(f"No .ptn files found in directory {log_dir}")
 
@@ -232,6 +652,13 @@ def run_analysis(log_dir, dcm_file, output_dir, report_name=None):
         "_patient_name": plan_data_raw.get("patient_name", ""),
     }
     save_debug_csv = app_config["SAVE_DEBUG_CSV"]
+    use_debug_dump = (
+        save_debug_csv and app_config.get("DEBUG_OUTPUT_FORMAT", "csv") == "npz"
+    )
+    layer_cache = layer_cache_from_config(app_config, output_dir)
+    analysis_mode = _analysis_mode(analysis_config)
+    if analysis_mode == "both":
+        report_data["_point_gamma"] = {}
 
     beam_processing_order = []
     for group in delivery_groups:
@@ -245,10 +672,36 @@ def run_analysis(log_dir, dcm_file, output_dir, report_name=None):
         if beam_number not in beam_processing_order
     )
 
+    layer_context = {
+        "beams": treatment_beams,
+        "planrange_lookups": {
+            beam_number: group["planrange_lookup"]
+            for beam_number, group in matched_groups.items()
+        },
+        "config": config,
+        "analysis_config": analysis_config,
+        "analysis_mode": analysis_mode,
+        "layer_cache": layer_cache,
+        "output_dir": output_dir,
+        "save_debug_csv": save_debug_csv,
+        "use_debug_dump": use_debug_dump,
+        "prefetch_depth": app_config.get("PTN_PREFETCH_DEPTH", 0),
+        "prefetch_max_bytes": int(
+            app_config.get("PTN_PREFETCH_MAX_MB", 256.0) * 1024 * 1024
+        ),
+        "read_concurrency": app_config.get("PTN_READ_CONCURRENCY", 1),
+        "memory_tracker": memory,
+    }
+    layer_tasks = []
     for beam_number in beam_processing_order:
         beam_data = treatment_beams[beam_number]
         beam_name = beam_data.get("name", f"Beam {beam_number}")
         report_data[beam_name] = {"beam_number": beam_number, "layers": []}
+        if analysis_mode == "both":
+            report_data["_point_gamma"][beam_name] = {
+                "beam_number": beam_number,
+                "layers": [],
+            }
         matched_group = matched_groups.get(beam_number)
         if matched_group is None:
             logger.warning(
@@ -257,121 +710,95 @@ def run_analysis(log_dir, dcm_file, output_dir, report_name=None):
                 beam_name,
             )
             continue
+        layer_tasks.extend(_beam_layer_tasks(beam_number, beam_data, matched_group))
 
-        ptn_file_iter = iter(matched_group["ptn_files"])
-        planrange_lookup = matched_group["planrange_lookup"]
-
-        for layer_index, layer_data in beam_data.get("layers", {}).items():
-            try:
-                ptn_file = next(ptn_file_iter)
-
-                try:
-                    log_data_raw = parse_ptn_with_optional_mu_correction(
-                        ptn_file,
-                        config,
-                        planrange_lookup,
-                    )
-                    if not log_data_raw:
-                        logger.warning(
-                            f"Could not parse PTN file or it is empty: {ptn_file}"
-                        )
-                        continue
-                except (KeyError, ValueError, IOError) as e:
-                    logger.error(f"Error parsing PTN file {ptn_file}: {e}")
-                    continue
-
-                try:
-                    save_csv_for_this_layer = save_debug_csv
-                    csv_filepath = ""
-                    if save_csv_for_this_layer:
-                        layer_number = layer_index // 2 + 1
-                        csv_filepath = os.path.join(
-                            output_dir,
-                            f"debug_data_beam_{beam_number}_layer_{layer_number}.csv",
-                        )
-
-                    analysis_mode = _analysis_mode(analysis_config)
-                    if analysis_mode == "point_gamma":
-                        analysis_results = calculate_point_gamma_for_layer(
-                            layer_data,
-                            log_data_raw,
-                            analysis_config,
-                            save_to_csv=save_csv_for_this_layer,
-                            csv_filename=csv_filepath,
-                        )
-                    else:
-                        analysis_results = calculate_differences_for_layer(
-                            layer_data,
-                            log_data_raw,
-                            save_to_csv=save_csv_for_this_layer,
-                            csv_filename=csv_filepath,
-                            config=analysis_config,
-                        )
-                except (KeyError, ValueError, TypeError) as e:
-                    logger.error(
-                        f"Error calculating differences for {beam_name}, Layer {layer_index}: {e}"
-                    )
-                    continue
-
-                if "error" in analysis_results:
-                    logger.warning(
-                        f"Skipping layer due to error: {analysis_results['error']}"
-                    )
-                    continue
-
-                report_data[beam_name]["layers"].append(
-                    {"layer_index": layer_index, "results": analysis_results}
+    debug_writers = {}
+    for (beam_number, layer_index, _ptn_file), (outcome, layer_profile) in zip(
+        layer_tasks, _run_layer_tasks(
+            layer_context, layer_tasks, workers, executor=layer_executor
+        )
+    ):
+        profile.add_layer(layer_profile)
+        if outcome is None:
+            continue
+        analysis_results, point_gamma_results, debug_columns = outcome
+        beam_name = treatment_beams[beam_number].get("name", f"Beam {beam_number}")
+        if debug_columns is not None:
+            if beam_number not in debug_writers:
+                debug_writers[beam_number] = DebugDumpWriter(
+                    debug_dump_path(output_dir, beam_number)
                 )
+            debug_writers[beam_number].add_layer(layer_index // 2 + 1, debug_columns)
 
-            except StopIteration:
-                logger.warning(
-                    f"No more PTN files to process for layer {layer_index} of beam {beam_name}."
-                )
-                break
+        report_data[beam_name]["layers"].append(
+            {"layer_index": layer_index, "results": analysis_results}
+        )
+        if point_gamma_results is not None and "error" in point_gamma_results:
+            logger.warning(
+                "Skipping point gamma for layer due to error: %s",
+                point_gamma_results["error"],
+            )
+        elif point_gamma_results is not None:
+            report_data["_point_gamma"][beam_name]["layers"].append(
+                {"layer_index": layer_index, "results": point_gamma_results}
+            )
+
+    for debug_writer in debug_writers.values():
+        debug_dump_file = debug_writer.close()
+        if debug_dump_file:
+            logger.info(f"Saved debug dump to {debug_dump_file}")
 
     if not any(
         data["layers"] for key, data in report_data.items() if not key.startswith("_")
     ):
         raise ValueError("No analysis results were generated. Check logs for warnings.")
 
-    analysis_mode = _analysis_mode(analysis_config)
-    if app_config["EXPORT_REPORT_CSV"] and analysis_mode != "point_gamma":
+    if app_config["EXPORT_REPORT_CSV"]:
         logger.info(f"Generating report CSV files in directory: {output_dir}")
-        export_report_csv(
-            report_data,
-            output_dir,
-            report_mode=app_config["ZERO_DOSE_REPORT_MODE"],
-        )
-    elif app_config["EXPORT_REPORT_CSV"]:
-        logger.warning(
-            "Point gamma CSV export is not implemented in this pass; skipping"
-        )
+        with profile.stage("csv_export"):
+            if analysis_mode in ("trajectory", "both"):
+                export_report_csv(
+                    report_data,
+                    output_dir,
+                    report_mode=app_config["ZERO_DOSE_REPORT_MODE"],
+                )
+            if analysis_mode != "trajectory":
+                export_point_gamma_report_csv(
+                    _point_gamma_report_data(report_data, analysis_mode), output_dir
+                )
 
     generated_report_paths = []
     if app_config["EXPORT_PDF_REPORT"]:
         logger.info(f"Generating PDF report in directory: {output_dir}")
-        if analysis_mode == "point_gamma":
-            generated_report_paths = _normalize_report_paths(generate_report(
-                report_data,
-                output_dir,
-                report_name=report_name,
-                report_mode=app_config["ZERO_DOSE_REPORT_MODE"],
-                analysis_config=analysis_config,
-                analysis_mode="point_gamma",
-                report_detail_pdf=app_config.get("REPORT_DETAIL_PDF", False),
-            ))
-        else:
-            generated_report_paths = _normalize_report_paths(generate_report(
-                report_data,
-                output_dir,
-                report_style=app_config["REPORT_STYLE"],
-                report_name=report_name,
-                report_mode=app_config["ZERO_DOSE_REPORT_MODE"],
-                analysis_config=analysis_config,
-            ))
+        with profile.stage("pdf_render"):
+            if analysis_mode != "trajectory":
+                generated_report_paths = _normalize_report_paths(generate_report(
+                    _point_gamma_report_data(report_data, analysis_mode),
+                    output_dir,
+                    report_name=report_name,
+                    report_mode=app_config["ZERO_DOSE_REPORT_MODE"],
+                    analysis_config=fluence_gamma_report_config(analysis_config)
+                    if analysis_mode == "fluence_gamma"
+                    else analysis_config,
+                    analysis_mode="point_gamma",
+                    report_detail_pdf=app_config.get("REPORT_DETAIL_PDF", False),
+                ))
+            if analysis_mode in ("trajectory", "both"):
+                generated_report_paths += _normalize_report_paths(generate_report(
+                    report_data,
+                    output_dir,
+                    report_style=app_config["REPORT_STYLE"],
+                    report_name=report_name,
+                    report_mode=app_config["ZERO_DOSE_REPORT_MODE"],
+                    analysis_config=analysis_config,
+                ))
     if generated_report_paths:
         report_data["_report_paths"] = generated_report_paths
         report_data["_report_path"] = generated_report_paths[0]
+    profile.finish()
+    report_data["_run_profile_path"] = profile.write(
+        output_dir, log_dir=log_dir, dcm_file=dcm_file
+    )
     logger.info("Done.")
     return report_data
 
@@ -394,12 +821,48 @@ def main():
         default="analysis_report",
         help="Directory to save the output plot images.",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes analyzing layers in parallel (default: 1).",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        default=None,
+        help="Write cProfile stats (profile.pstats) and flame-graph stacks "
+        "(profile.collapsed.txt) to the output directory.",
+    )
+    parser.add_argument(
+        "--profile_stages",
+        help="Comma-separated stages to profile instead of the whole run, "
+        "e.g. gamma or ptn_read,mu_correction (implies --profile).",
+    )
+    parser.add_argument(
+        "--profile_memory",
+        action="store_true",
+        default=None,
+        help="Record RSS, tracemalloc peaks and top allocators per stage and "
+        "layer in run_profile.json.",
+    )
     args = parser.parse_args()
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
 
     report_name = derive_report_name(args.log_dir)
 
     try:
-        run_analysis(args.log_dir, args.dcm_file, args.output, report_name=report_name)
+        run_analysis(
+            args.log_dir,
+            args.dcm_file,
+            args.output,
+            report_name=report_name,
+            workers=args.workers,
+            profile=args.profile,
+            profile_stages=args.profile_stages,
+            profile_memory=args.profile_memory,
+        )
     except (FileNotFoundError, ValueError) as e:
         logger.error(f"{e}")
         sys.exit(1)
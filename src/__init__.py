@@ -1,18 +1,32 @@
-"""Curated package-level entrypoints for PTN checker components."""
-
-from src.calculator import calculate_differences_for_layer
-from src.config_loader import parse_scv_init, parse_yaml_config
-from src.dicom_parser import parse_dcm_file
-from src.log_parser import parse_ptn_file
-from src.report_csv_exporter import export_report_csv
-from src.report_generator import generate_report
-
-__all__ = [
-    "calculate_differences_for_layer",
-    "export_report_csv",
-    "generate_report",
-    "parse_dcm_file",
-    "parse_ptn_file",
-    "parse_scv_init",
-    "parse_yaml_config",
-]
+"""Curated package-level entrypoints for PTN checker components.
+
+The entrypoints are resolved on first attribute access (PEP 562) so that
+importing any ``src`` submodule does not pull in matplotlib and scipy.
+"""
+
+import importlib
+
+_ENTRYPOINTS = {
+    "calculate_differences_for_layer": "src.calculator",
+    "export_report_csv": "src.report_csv_exporter",
+    "generate_report": "src.report_generator",
+    "parse_dcm_file": "src.dicom_parser",
+    "parse_ptn_file": "src.log_parser",
+    "parse_scv_init": "src.config_loader",
+    "parse_yaml_config": "src.config_loader",
+}
+
+__all__ = sorted(_ENTRYPOINTS)
+
+
+def __getattr__(name):
+    module_name = _ENTRYPOINTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
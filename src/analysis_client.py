@@ -0,0 +1,132 @@
+"""
+Command-line client for ``src.analysis_service``.
+
+    python -m src.analysis_client analyze --log_dir <dir> --dcm_file <plan.dcm> --output out
+    python -m src.analysis_client analyze ... --no-wait      # print the job and return
+    python -m src.analysis_client status [job_id]
+
+``analyze`` waits for the job by default and exits non-zero when it failed.
+Requests carry the token the service wrote to its token file
+(``--token_file``, the service's default when omitted).
+"""
+
+import argparse
+import json
+import os
+import sys
+import urllib.error
+import urllib.request
+
+from src.analysis_service import (
+    DEFAULT_HOST,
+    DEFAULT_PORT,
+    DEFAULT_TOKEN_FILE,
+    read_token_file,
+)
+
+
+def _request(url, payload=None, token=None, timeout=None):
+    if token is None:
+        token = read_token_file()
+    data = None if payload is None else json.dumps(payload).encode("utf-8")
+    request = urllib.request.Request(
+        url,
+        data=data,
+        headers={
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {token}",
+        },
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return json.loads(e.read() or b"{}") or {"error": str(e)}
+
+
+def analyze(
+    base_url,
+    log_dir,
+    dcm_file,
+    output,
+    report_name=None,
+    workers=None,
+    wait=True,
+    token=None,
+):
+    payload = {
+        # The service may run in another working directory.
+        "log_dir": os.path.abspath(log_dir),
+        "dcm_file": os.path.abspath(dcm_file),
+        "output": os.path.abspath(output),
+        "wait": wait,
+    }
+    if report_name:
+        payload["report_name"] = report_name
+    if workers:
+        payload["workers"] = workers
+    return _request(f"{base_url}/analyze", payload, token=token)
+
+
+def status(base_url, job_id=None, token=None):
+    path = "/status" if job_id is None else f"/status/{job_id}"
+    return _request(f"{base_url}{path}", token=token)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Submit jobs to the local analysis service.")
+    parser.add_argument(
+        "--url",
+        default=f"http://{DEFAULT_HOST}:{DEFAULT_PORT}",
+        help="Service base URL",
+    )
+    parser.add_argument(
+        "--token_file",
+        default=DEFAULT_TOKEN_FILE,
+        help=f"Token file written by the service (default: {DEFAULT_TOKEN_FILE})",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    analyze_parser = commands.add_parser("analyze", help="Analyze one case")
+    analyze_parser.add_argument("--log_dir", required=True)
+    analyze_parser.add_argument("--dcm_file", required=True)
+    analyze_parser.add_argument("-o", "--output", default="analysis_report")
+    analyze_parser.add_argument("--report_name")
+    analyze_parser.add_argument("--workers", type=int)
+    analyze_parser.add_argument(
+        "--no-wait", dest="wait", action="store_false", help="Return once queued"
+    )
+    status_parser = commands.add_parser("status", help="Show the service or one job")
+    status_parser.add_argument("job_id", nargs="?")
+    args = parser.parse_args()
+
+    try:
+        token = read_token_file(args.token_file)
+    except OSError as e:
+        print(f"Cannot read the service token: {e}", file=sys.stderr)
+        sys.exit(2)
+
+    try:
+        if args.command == "analyze":
+            result = analyze(
+                args.url,
+                args.log_dir,
+                args.dcm_file,
+                args.output,
+                report_name=args.report_name,
+                workers=args.workers,
+                wait=args.wait,
+                token=token,
+            )
+        else:
+            result = status(args.url, args.job_id, token=token)
+    except urllib.error.URLError as e:
+        print(f"Cannot reach analysis service at {args.url}: {e.reason}", file=sys.stderr)
+        sys.exit(2)
+
+    print(json.dumps(result, indent=2))
+    if "error" in result:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
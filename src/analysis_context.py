@@ -3,8 +3,9 @@ import os
 
 from src.config_loader import parse_scv_init
 from src.dicom_parser import parse_dcm_file
-from src.log_parser import parse_ptn_file
+from src.log_parser import parse_ptn_data, parse_ptn_file
 from src.mu_correction import apply_mu_correction
+from src.run_profile import stage
 
 
 logger = logging.getLogger(__name__)
@@ -37,9 +38,18 @@ def parse_ptn_with_optional_mu_correction(
     ptn_file: str,
     config: dict,
     planrange_lookup: dict,
+    raw_data=None,
 ) -> dict:
-    """Parse a PTN file and apply MU correction when matching range metadata exists."""
-    log_data = parse_ptn_file(ptn_file, config)
+    """Parse a PTN file and apply MU correction when matching range metadata exists.
+
+    ``raw_data`` holds the file's words when they were already read (see
+    ``src.ptn_prefetch``); the file is then not opened again.
+    """
+    with stage("ptn_read"):
+        if raw_data is None:
+            log_data = parse_ptn_file(ptn_file, config)
+        else:
+            log_data = parse_ptn_data(raw_data, config)
     range_info = planrange_lookup.get(os.path.abspath(ptn_file))
     planrange_metadata = {
         "found": False,
@@ -54,7 +64,8 @@ def parse_ptn_with_optional_mu_correction(
             "energy": float(range_info.energy),
             "dose1_range_code": int(range_info.dose1_range_code),
         }
-        apply_mu_correction(log_data, range_info.energy, range_info.dose1_range_code)
+        with stage("mu_correction"):
+            apply_mu_correction(log_data, range_info.energy, range_info.dose1_range_code)
     elif planrange_lookup:
         logger.warning("No PlanRange entry for %s, using uncorrected MU", ptn_file)
     log_data["planrange_metadata"] = planrange_metadata
@@ -0,0 +1,343 @@
+"""
+Warm local analysis service.
+
+A ``python main.py`` run spends most of an interactive re-check importing
+numpy/scipy/pydicom/matplotlib and parsing ``config.yaml``, the RTPLAN and
+``scv_init_*.txt``.  The service is one long-lived process that has paid
+those costs already: it keeps the modules imported and the inputs cached
+(``src.warm_inputs``), runs jobs on a thread pool, and with ``--workers``
+keeps one layer process pool for its whole life, shared by all jobs.  The
+pool is started before any thread, so on POSIX its workers are forked from
+the already warm process.
+Jobs in memory mode (``profiling.memory``) run alone: tracemalloc figures
+are process-wide, so other jobs would show up in them.
+
+It listens on localhost HTTP only and speaks JSON.  Every start writes a
+new random token to a file only the current user can read (``--token_file``,
+mode 0600); requests without ``Authorization: Bearer <token>`` are refused,
+and ``POST`` bodies must be ``application/json``.  A web page cannot read the
+token or set that header on a cross-origin request, so it cannot submit jobs:
+
+* ``POST /analyze`` with ``log_dir``, ``dcm_file``, ``output`` and optional
+  ``report_name``, ``workers`` and ``wait`` submits a job and returns it;
+  with ``"wait": true`` the response is sent when the job has finished.
+  ``"workers": 1`` analyzes the layers in the service process; any larger
+  value uses the service's pool, whose size is fixed by ``--workers`` (a
+  service started without one starts a pool for the job).
+* ``GET /status`` lists the service state and every job;
+  ``GET /status/<job_id>`` returns one job.
+
+``src.analysis_client`` is the matching command-line client::
+
+    python -m src.analysis_service --port 8765
+    python -m src.analysis_client analyze --log_dir <dir> --dcm_file <plan.dcm> --output out
+"""
+
+import argparse
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import hmac
+import itertools
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+
+from main import derive_report_name, run_analysis, start_layer_worker_pool
+from src.warm_inputs import WarmInputs
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_TOKEN_FILE = os.path.join(os.path.expanduser("~"), ".ptn_analysis_service_token")
+REQUIRED_JOB_FIELDS = ("log_dir", "dcm_file", "output")
+
+
+def _layer_counts(report_data):
+    return {
+        beam_name: len(data["layers"])
+        for beam_name, data in report_data.items()
+        if not beam_name.startswith("_")
+    }
+
+
+class AnalysisService:
+    """Job queue around ``run_analysis`` with warm inputs."""
+
+    def __init__(self, max_jobs=1, workers=1):
+        self.workers = workers
+        # Before the job threads exist, so fork is still safe.
+        self._layer_pool = start_layer_worker_pool(workers) if workers > 1 else None
+        self.inputs = WarmInputs()
+        self.started_at = datetime.now().isoformat(timespec="seconds")
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_jobs, thread_name_prefix="analysis-job"
+        )
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._futures = {}
+        self._ids = itertools.count(1)
+        self._slots = threading.Condition()
+        self._running = 0
+        self._exclusive_running = False
+        self._exclusive_waiting = 0
+
+    def submit(self, request):
+        """Queue a job for ``request``; returns its initial record."""
+        missing = [field for field in REQUIRED_JOB_FIELDS if not request.get(field)]
+        if missing:
+            raise ValueError(f"Missing required field(s): {', '.join(missing)}")
+
+        with self._lock:
+            job_id = str(next(self._ids))
+            job = {
+                "id": job_id,
+                "status": "queued",
+                "log_dir": request["log_dir"],
+                "dcm_file": request["dcm_file"],
+                "output": request["output"],
+                "submitted_at": datetime.now().isoformat(timespec="seconds"),
+            }
+            self._jobs[job_id] = job
+            self._futures[job_id] = self._executor.submit(self._run, job_id, request)
+            return dict(job)
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            self._jobs[job_id].update(fields)
+
+    @contextlib.contextmanager
+    def _job_slot(self, exclusive):
+        """Run slot for one job; an ``exclusive`` job runs with no other job."""
+        with self._slots:
+            if exclusive:
+                self._exclusive_waiting += 1
+                self._slots.wait_for(
+                    lambda: self._running == 0 and not self._exclusive_running
+                )
+                self._exclusive_waiting -= 1
+                self._exclusive_running = True
+            else:
+                # Waiting exclusive jobs go first so they are not starved.
+                self._slots.wait_for(
+                    lambda: not self._exclusive_running and not self._exclusive_waiting
+                )
+            self._running += 1
+        try:
+            yield
+        finally:
+            with self._slots:
+                self._running -= 1
+                if exclusive:
+                    self._exclusive_running = False
+                self._slots.notify_all()
+
+    def _run(self, job_id, request):
+        start = time.perf_counter()
+        layer_pool = self._layer_pool
+        try:
+            app_config = self.inputs.app_config()
+            with self._job_slot(exclusive=bool(app_config.get("PROFILE_MEMORY"))):
+                self._update(job_id, status="running")
+                start = time.perf_counter()
+                report_data = run_analysis(
+                    request["log_dir"],
+                    request["dcm_file"],
+                    request["output"],
+                    report_name=request.get("report_name")
+                    or derive_report_name(request["log_dir"]),
+                    workers=int(request.get("workers") or self.workers),
+                    app_config=app_config,
+                    plan_inputs=self.inputs.plan_inputs(request["dcm_file"], app_config),
+                    layer_executor=layer_pool,
+                )
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                self._replace_layer_pool(layer_pool)
+            logger.error("Job %s failed: %s", job_id, e)
+            self._update(
+                job_id,
+                status="failed",
+                error=f"{type(e).__name__}: {e}",
+                elapsed_s=round(time.perf_counter() - start, 3),
+            )
+            return
+        self._update(
+            job_id,
+            status="done",
+            report_paths=list(report_data.get("_report_paths", [])),
+            layers=_layer_counts(report_data),
+            elapsed_s=round(time.perf_counter() - start, 3),
+        )
+
+    def _replace_layer_pool(self, broken_pool):
+        # A worker died (e.g. out of memory); later jobs get a fresh pool.
+        with self._lock:
+            if self._layer_pool is broken_pool:
+                broken_pool.shutdown(wait=False)
+                self._layer_pool = start_layer_worker_pool(self.workers)
+
+    def job(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return None if job is None else dict(job)
+
+    def wait(self, job_id, timeout=None):
+        """Block until the job has finished; returns its record."""
+        with self._lock:
+            future = self._futures.get(job_id)
+        if future is not None:
+            future.result(timeout=timeout)
+        return self.job(job_id)
+
+    def status(self):
+        with self._lock:
+            jobs = [dict(job) for job in self._jobs.values()]
+        return {
+            "started_at": self.started_at,
+            "cached_plans": self.inputs.cached_plan_count(),
+            "jobs": jobs,
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+        if self._layer_pool is not None:
+            self._layer_pool.shutdown(wait=True)
+
+
+def write_token_file(path, token):
+    """Write ``token`` to ``path``, readable by the current user only."""
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(path)
+    # O_EXCL: never write through a file or symlink someone else created.
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(token)
+
+
+def read_token_file(path=DEFAULT_TOKEN_FILE):
+    with open(path, encoding="utf-8") as f:
+        return f.read().strip()
+
+
+def make_handler(service, token):
+    """``BaseHTTPRequestHandler`` class bound to ``service`` and ``token``."""
+    expected_authorization = f"Bearer {token}".encode("utf-8")
+
+    class AnalysisRequestHandler(BaseHTTPRequestHandler):
+        def _send_json(self, code, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _authorized(self):
+            if hmac.compare_digest(
+                self.headers.get("Authorization", "").encode("utf-8"),
+                expected_authorization,
+            ):
+                return True
+            self._send_json(401, {"error": "Missing or wrong service token"})
+            return False
+
+        def do_GET(self):
+            if not self._authorized():
+                return
+            if self.path == "/status":
+                self._send_json(200, service.status())
+                return
+            if self.path.startswith("/status/"):
+                job = service.job(self.path[len("/status/"):])
+                if job is None:
+                    self._send_json(404, {"error": "Unknown job"})
+                else:
+                    self._send_json(200, job)
+                return
+            self._send_json(404, {"error": f"Unknown endpoint {self.path}"})
+
+        def do_POST(self):
+            if not self._authorized():
+                return
+            if self.path != "/analyze":
+                self._send_json(404, {"error": f"Unknown endpoint {self.path}"})
+                return
+            if self.headers.get_content_type() != "application/json":
+                self._send_json(415, {"error": "Request body must be application/json"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                if not isinstance(request, dict):
+                    raise ValueError("Request body must be a JSON object")
+                job = service.submit(request)
+            except ValueError as e:
+                self._send_json(400, {"error": str(e)})
+                return
+            if request.get("wait"):
+                job = service.wait(job["id"])
+            self._send_json(202 if job["status"] == "queued" else 200, job)
+
+        def log_message(self, format, *args):
+            logger.debug("%s - %s", self.address_string(), format % args)
+
+    return AnalysisRequestHandler
+
+
+def serve(service, host=DEFAULT_HOST, port=DEFAULT_PORT, token_file=DEFAULT_TOKEN_FILE):
+    """Create the HTTP server with a new token in ``token_file``.
+
+    Call ``serve_forever()`` on the result.
+    """
+    token = secrets.token_urlsafe(32)
+    write_token_file(token_file, token)
+    return ThreadingHTTPServer((host, port), make_handler(service, token))
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(
+        description="Serve PTN analyses from a warm process over localhost HTTP."
+    )
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="TCP port on 127.0.0.1")
+    parser.add_argument(
+        "--jobs", type=int, default=1, help="Number of analyses run at the same time"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Layer worker processes, kept for the life of the service and shared by all jobs",
+    )
+    parser.add_argument(
+        "--token_file",
+        default=DEFAULT_TOKEN_FILE,
+        help=f"File the per-start access token is written to (default: {DEFAULT_TOKEN_FILE})",
+    )
+    args = parser.parse_args()
+    if args.jobs < 1 or args.workers < 1:
+        parser.error("--jobs and --workers must be at least 1")
+
+    service = AnalysisService(max_jobs=args.jobs, workers=args.workers)
+    server = serve(service, port=args.port, token_file=args.token_file)
+    logger.info("Analysis service listening on http://%s:%d", DEFAULT_HOST, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Stopped.")
+    finally:
+        server.server_close()
+        service.shutdown()
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(args.token_file)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Concurrent PTN reads for high-latency storage.
+
+On a mounted network share the cost of a PTN file is dominated by the
+per-file open/read round trip, not by its few hundred kilobytes.
+``AsyncPtnLoader`` keeps up to ``concurrency`` reads in flight on a thread
+pool (blocking file I/O releases the GIL) and hands the buffers back in the
+order they were requested, so hundreds of small files cost roughly
+``files / concurrency`` round trips.
+
+``load_ptn_files`` is the synchronous entry point; ``PtnPrefetcher`` uses the
+loader for its read-ahead when ``io.read_concurrency`` > 1.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from src.log_parser import parse_ptn_data, read_ptn_raw
+
+DEFAULT_READ_CONCURRENCY = 8
+
+
+class AsyncPtnLoader:
+    """Read PTN files on a thread pool, at most ``concurrency`` at a time.
+
+    ``reader`` maps a path to the file's words; it defaults to
+    :func:`src.log_parser.read_ptn_raw` and exists so tests can substitute a
+    slow file system.
+    """
+
+    def __init__(self, concurrency=DEFAULT_READ_CONCURRENCY, reader=read_ptn_raw):
+        if concurrency < 1:
+            raise ValueError("concurrency must be >= 1")
+        self.concurrency = int(concurrency)
+        self._reader = reader
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix="ptn-read"
+        )
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+
+    async def read(self, path):
+        """Return the words of ``path``; read errors are raised here."""
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, self._reader, path)
+
+    async def read_many(self, paths):
+        """Words (or the read exception) of every path, in input order."""
+        return await asyncio.gather(
+            *(self.read(path) for path in paths), return_exceptions=True
+        )
+
+    async def parse_many(self, paths, config_params):
+        """``parse_ptn_file`` results (or exceptions) of every path, in order.
+
+        Each buffer is parsed on the event loop thread as soon as it and its
+        predecessors are read, while later reads are still in flight.
+        """
+        reads = [asyncio.ensure_future(self.read(path)) for path in paths]
+        results = []
+        for read in reads:
+            try:
+                results.append(parse_ptn_data(await read, config_params))
+            except (OSError, KeyError, ValueError) as e:
+                results.append(e)
+        return results
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def load_ptn_files(
+    paths, config_params, concurrency=DEFAULT_READ_CONCURRENCY, reader=read_ptn_raw
+):
+    """Read and parse ``paths`` concurrently; see ``AsyncPtnLoader.parse_many``."""
+
+    async def _load():
+        async with AsyncPtnLoader(concurrency, reader=reader) as loader:
+            return await loader.parse_many(paths, config_params)
+
+    return asyncio.run(_load())
@@ -0,0 +1,235 @@
+"""
+Multi-case batch runner with a resumable status manifest.
+
+Cases come from a manifest (CSV with ``log_dir,dcm_file,output`` columns, or
+YAML with a ``cases`` list of the same keys) or are discovered under a root
+directory: every immediate subdirectory holding an RTPLAN ``RP*.dcm`` is one
+case, written to ``<output_root>/<case>``.
+
+Cases run concurrently in a process pool (``--jobs``).  After every finished
+case the status manifest is rewritten atomically with the status, start
+time, elapsed seconds, report paths and error of each case; on restart,
+cases already marked ``done`` are skipped, so an interrupted nightly run
+resumes where it stopped::
+
+    python -m src.batch_runner --root /data/SHI_log/2025-07 --output_root out --jobs 4
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import csv
+from datetime import datetime
+import glob
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import yaml
+
+from main import derive_report_name, run_analysis
+
+logger = logging.getLogger(__name__)
+
+CASE_FIELDS = ["log_dir", "dcm_file", "output"]
+STATUS_FIELDS = CASE_FIELDS + [
+    "status",
+    "started_at",
+    "elapsed_s",
+    "report_paths",
+    "error",
+]
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+DEFAULT_STATUS_FILENAME = "batch_status.csv"
+
+
+def _case_key(case):
+    return tuple(os.path.abspath(case[field]) for field in CASE_FIELDS)
+
+
+def _validated_case(entry, source):
+    missing = [field for field in CASE_FIELDS if not entry.get(field)]
+    if missing:
+        raise ValueError(f"Manifest entry in {source} is missing {', '.join(missing)}")
+    return {field: str(entry[field]) for field in CASE_FIELDS}
+
+
+def load_manifest(path):
+    """Read the cases of a ``.csv`` or ``.yaml``/``.yml`` manifest."""
+    if path.lower().endswith((".yaml", ".yml")):
+        with open(path, "r", encoding="utf-8") as f:
+            data = yaml.safe_load(f) or {}
+        entries = data.get("cases") if isinstance(data, dict) else None
+        if not isinstance(entries, list):
+            raise ValueError(f"Invalid manifest {path}: expected a 'cases' list")
+    else:
+        with open(path, "r", newline="", encoding="utf-8") as f:
+            entries = list(csv.DictReader(f))
+    return [_validated_case(entry, path) for entry in entries]
+
+
+def discover_cases(root, output_root):
+    """One case per subdirectory of ``root`` that holds exactly one ``RP*.dcm``."""
+    cases = []
+    for entry in sorted(os.scandir(root), key=lambda entry: entry.name):
+        if not entry.is_dir():
+            continue
+        plans = sorted(glob.glob(os.path.join(entry.path, "RP*.dcm")))
+        if len(plans) != 1:
+            if plans:
+                logger.warning(
+                    "Skipping %s: %d RTPLAN files found", entry.path, len(plans)
+                )
+            continue
+        cases.append(
+            {
+                "log_dir": entry.path,
+                "dcm_file": plans[0],
+                "output": os.path.join(output_root, entry.name),
+            }
+        )
+    return cases
+
+
+def read_status(path):
+    """Status rows of a previous run keyed by case; empty when there is none."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", newline="", encoding="utf-8") as f:
+        return {_case_key(row): row for row in csv.DictReader(f)}
+
+
+def write_status(path, rows):
+    """Rewrite the status manifest atomically."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=STATUS_FIELDS)
+            writer.writeheader()
+            for row in rows:
+                writer.writerow({field: row.get(field, "") for field in STATUS_FIELDS})
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def run_case(case, workers=1):
+    """Analyze one case; returns its status row instead of raising."""
+    started_at = datetime.now().isoformat(timespec="seconds")
+    start = time.perf_counter()
+    row = {**case, "started_at": started_at}
+    try:
+        report_data = run_analysis(
+            case["log_dir"],
+            case["dcm_file"],
+            case["output"],
+            report_name=derive_report_name(case["log_dir"]),
+            workers=workers,
+        )
+    except Exception as e:
+        logger.error("Case %s failed: %s", case["log_dir"], e)
+        row.update(status=STATUS_FAILED, error=f"{type(e).__name__}: {e}")
+    else:
+        row.update(
+            status=STATUS_DONE,
+            report_paths=";".join(report_data.get("_report_paths", [])),
+        )
+    row["elapsed_s"] = f"{time.perf_counter() - start:.3f}"
+    return row
+
+
+def run_batch(cases, status_path, jobs=1, workers=1):
+    """Run every case not yet ``done`` in ``status_path``; returns the status rows.
+
+    Rows keep the order of ``cases``; the manifest is rewritten after each
+    finished case.
+    """
+    previous = read_status(status_path)
+    rows = []
+    pending = []
+    for case in cases:
+        row = previous.get(_case_key(case))
+        if row is not None and row.get("status") == STATUS_DONE:
+            logger.info("Skipping completed case %s", case["log_dir"])
+            rows.append(row)
+        else:
+            rows.append({**case, "status": "pending"})
+            pending.append(len(rows) - 1)
+    write_status(status_path, rows)
+
+    if jobs <= 1:
+        for index in pending:
+            rows[index] = run_case(rows[index], workers)
+            write_status(status_path, rows)
+        return rows
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            executor.submit(
+                run_case, {field: rows[index][field] for field in CASE_FIELDS}, workers
+            ): index
+            for index in pending
+        }
+        for future in as_completed(futures):
+            rows[futures[future]] = future.result()
+            write_status(status_path, rows)
+    return rows
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(
+        description="Run the PTN analysis over many cases with a resumable status manifest."
+    )
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument(
+        "--manifest", help="CSV or YAML manifest of log_dir/dcm_file/output cases"
+    )
+    source.add_argument(
+        "--root", help="Directory whose subdirectories (with one RP*.dcm) are cases"
+    )
+    parser.add_argument(
+        "--output_root",
+        default="output",
+        help="Output parent directory for discovered cases (default: output)",
+    )
+    parser.add_argument(
+        "--status",
+        help=f"Status manifest path (default: <output_root>/{DEFAULT_STATUS_FILENAME})",
+    )
+    parser.add_argument(
+        "--jobs", type=int, default=1, help="Number of cases analyzed concurrently"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1, help="Layer worker processes per case"
+    )
+    args = parser.parse_args()
+    if args.jobs < 1 or args.workers < 1:
+        parser.error("--jobs and --workers must be at least 1")
+
+    if args.manifest:
+        cases = load_manifest(args.manifest)
+    else:
+        cases = discover_cases(args.root, args.output_root)
+    status_path = args.status or os.path.join(args.output_root, DEFAULT_STATUS_FILENAME)
+
+    rows = run_batch(cases, status_path, jobs=args.jobs, workers=args.workers)
+    failed = sum(row["status"] == STATUS_FAILED for row in rows)
+    logger.info(
+        "Batch finished: %d case(s), %d failed; status in %s",
+        len(rows),
+        failed,
+        status_path,
+    )
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,9 @@
 import logging
 
 import numpy as np
-from scipy.optimize import curve_fit
+
+from src.streaming_stats import AxisStatsAccumulator
+from src.time_alignment import align_log_time
 
 logger = logging.getLogger(__name__)
 
@@ -58,13 +60,17 @@ def _detect_settling(
     return search_length, "never_settled"
 
 
-def _calculate_axis_stats(diff):
+def _calculate_axis_stats(diff, accumulator=None):
+    # p95 comes from the accumulator's quantile sketch, the same estimate that
+    # beam-level summaries merge, instead of sorting every sample.
+    if accumulator is None:
+        accumulator = AxisStatsAccumulator.from_values(diff)
     return {
         "mean": np.mean(diff),
         "std": np.std(diff),
         "rmse": np.sqrt(np.mean(diff ** 2)),
         "max_abs": np.max(np.abs(diff)),
-        "p95_abs": np.percentile(np.abs(diff), 95),
+        "p95_abs": accumulator.abs_percentile(95),
     }
 
 
@@ -225,6 +231,8 @@ def _boundary_carryover_mask(config, plan_time_s, log_time_s, assigned_spot_inde
 
 
 def _fit_histogram(diff):
+    from scipy.optimize import curve_fit
+
     bins = np.arange(
         HISTOGRAM_RANGE_MM[0],
         HISTOGRAM_RANGE_MM[1] + HISTOGRAM_BIN_STEP,
@@ -247,8 +255,30 @@ def _fit_histogram(diff):
     }
 
 
-def _write_debug_csv(
-    csv_filename,
+DEBUG_COLUMNS = (
+    "log_time_s",
+    "interp_plan_x",
+    "interp_plan_y",
+    "log_x",
+    "log_y",
+    "x_raw",
+    "y_raw",
+    "layer_num",
+    "beam_on_off",
+    "is_settling",
+    "log_velocity_mm_s",
+    "interp_plan_mu",
+    "log_mu",
+    "assigned_spot_index",
+    "assigned_spot_mu",
+    "assigned_spot_scan_speed_mm_s",
+    "sample_is_transit_min_dose",
+    "sample_is_boundary_carryover",
+    "sample_is_included_filtered_stats",
+)
+
+
+def _debug_columns(
     log_time_s,
     interp_plan_x,
     interp_plan_y,
@@ -266,7 +296,8 @@ def _write_debug_csv(
     sample_is_boundary_carryover,
     sample_is_included_filtered_stats,
 ):
-    data_to_save = np.column_stack((
+    """Return the per-sample debug columns keyed by ``DEBUG_COLUMNS`` names."""
+    values = (
         log_time_s,
         interp_plan_x,
         interp_plan_y,
@@ -286,15 +317,32 @@ def _write_debug_csv(
         sample_is_transit_min_dose.astype(int),
         sample_is_boundary_carryover.astype(int),
         sample_is_included_filtered_stats.astype(int),
-    ))
-    header = (
-        "log_time_s,interp_plan_x,interp_plan_y,log_x,log_y,x_raw,y_raw,"
-        "layer_num,beam_on_off,is_settling,log_velocity_mm_s,interp_plan_mu,log_mu,"
-        "assigned_spot_index,assigned_spot_mu,assigned_spot_scan_speed_mm_s,"
-        "sample_is_transit_min_dose,sample_is_boundary_carryover,"
-        "sample_is_included_filtered_stats"
     )
-    np.savetxt(csv_filename, data_to_save, delimiter=",", header=header, comments="")
+    return {name: np.asarray(value) for name, value in zip(DEBUG_COLUMNS, values)}
+
+
+def _write_debug_columns_csv(csv_filename, columns):
+    data_to_save = np.column_stack([columns[name] for name in DEBUG_COLUMNS])
+    np.savetxt(
+        csv_filename,
+        data_to_save,
+        delimiter=",",
+        header=",".join(DEBUG_COLUMNS),
+        comments="",
+    )
+
+
+def _write_debug_csv(csv_filename, *args):
+    _write_debug_columns_csv(csv_filename, _debug_columns(*args))
+
+
+def _emit_debug_output(save_to_csv, csv_filename, debug_sink, *args):
+    """Send debug columns to ``debug_sink`` when given, else to a CSV file."""
+    if debug_sink is not None:
+        debug_sink(_debug_columns(*args))
+    elif save_to_csv:
+        logger.info(f"Saving data to {csv_filename}")
+        _write_debug_csv(csv_filename, *args)
 
 
 def _store_axis_stats(results, prefix, stats_x, stats_y):
@@ -310,28 +358,22 @@ def _store_axis_stats(results, prefix, stats_x, stats_y):
     results[f'{prefix}p95_abs_diff_y'] = stats_y['p95_abs']
 
 
-def calculate_differences_for_layer(
-    plan_layer,
-    log_data,
-    save_to_csv=False,
-    csv_filename="debug_layer_data.csv",
-    config=None,
-):
+DEBUG_LOG_DATA_KEYS = ("x_raw", "y_raw", "layer_num", "beam_on_off")
+
+
+def prepare_difference_intermediates(plan_layer, log_data, config=None):
     """
-    Calculates the differences between planned and actual data for a single layer.
+    Build the threshold-independent per-sample series for a layer.
 
-    Args:
-        plan_layer: A dictionary containing the plan data for a single layer.
-        log_data: Parsed data from a PTN log file for the corresponding layer.
-        save_to_csv (bool): If True, saves the interpolated plan and log data to a CSV file.
-        csv_filename (str): The name of the CSV file to save.
-        config (dict | None): Parsed analysis configuration.
+    The result (aligned log time, interpolated plan series, velocity and the
+    assigned spot index) only depends on the PTN data, the plan layer and the
+    time-alignment settings, so it can be cached and reused when only
+    settling, zero-dose filter or report thresholds change.
 
     Returns:
-        A dictionary containing the analysis results for the layer.
+        A dictionary of arrays plus a ``time_alignment`` dict, or a dictionary
+        with an ``error`` key when the inputs are incomplete.
     """
-    results = {}
-
     missing_plan_key = _missing_required_keys(
         plan_layer,
         ('time_axis_s', 'trajectory_x_mm', 'trajectory_y_mm'),
@@ -343,7 +385,7 @@ def calculate_differences_for_layer(
     if missing_log_key is not None:
         return {'error': f"Missing required log_data key: '{missing_log_key}'"}
 
-    plan_time_s, plan_x, plan_y, log_time_s, log_x, log_y = _prepare_plan_and_log_arrays(
+    plan_time_s, _, _, log_time_s, log_x, log_y = _prepare_plan_and_log_arrays(
         plan_layer,
         log_data,
     )
@@ -351,18 +393,91 @@ def calculate_differences_for_layer(
     if len(plan_time_s) == 0 or len(log_time_s) == 0:
         return {'error': 'Empty data arrays'}
 
+    log_time_s, time_alignment = align_log_time(
+        plan_layer,
+        log_time_s,
+        log_x,
+        log_y,
+        log_data.get("mu"),
+        config or {},
+    )
+
     interp_plan_x, interp_plan_y, interp_plan_mu, log_mu = _interpolate_plan_series(
         plan_layer,
         log_data,
         plan_time_s,
         log_time_s,
     )
-    log_velocity_mm_s = _calculate_log_velocity(log_time_s, log_x, log_y)
+    intermediates = {
+        'log_time_s': log_time_s,
+        'log_x': log_x,
+        'log_y': log_y,
+        'interp_plan_x': interp_plan_x,
+        'interp_plan_y': interp_plan_y,
+        'interp_plan_mu': interp_plan_mu,
+        'log_mu': log_mu,
+        'log_velocity_mm_s': _calculate_log_velocity(log_time_s, log_x, log_y),
+        'assigned_spot_index': _assign_samples_to_spots(log_time_s, plan_time_s),
+        'time_alignment': time_alignment,
+    }
+    for key in DEBUG_LOG_DATA_KEYS:
+        if key in log_data:
+            intermediates[key] = np.asarray(log_data[key])
+    return intermediates
+
+
+def calculate_differences_for_layer(
+    plan_layer,
+    log_data,
+    save_to_csv=False,
+    csv_filename="debug_layer_data.csv",
+    config=None,
+    debug_sink=None,
+    intermediates=None,
+):
+    """
+    Calculates the differences between planned and actual data for a single layer.
+
+    Args:
+        plan_layer: A dictionary containing the plan data for a single layer.
+        log_data: Parsed data from a PTN log file for the corresponding layer.
+        save_to_csv (bool): If True, saves the interpolated plan and log data to a CSV file.
+        csv_filename (str): The name of the CSV file to save.
+        config (dict | None): Parsed analysis configuration.
+        debug_sink (callable | None): Receives the debug columns dict instead
+            of writing ``csv_filename`` (see ``src.debug_dump``).
+        intermediates (dict | None): Output of
+            ``prepare_difference_intermediates``; when given, ``log_data`` is
+            not read and only masks and statistics are recomputed.
+
+    Returns:
+        A dictionary containing the analysis results for the layer.
+    """
+    results = {}
+    config = config or {}
+
+    if intermediates is None:
+        intermediates = prepare_difference_intermediates(plan_layer, log_data, config)
+    if 'error' in intermediates:
+        return {'error': intermediates['error']}
+
+    plan_time_s = np.asarray(plan_layer['time_axis_s'], dtype=float)
+    plan_x = np.asarray(plan_layer['trajectory_x_mm'], dtype=float)
+    plan_y = np.asarray(plan_layer['trajectory_y_mm'], dtype=float)
+    log_time_s = intermediates['log_time_s']
+    log_x = intermediates['log_x']
+    log_y = intermediates['log_y']
+    interp_plan_x = intermediates['interp_plan_x']
+    interp_plan_y = intermediates['interp_plan_y']
+    interp_plan_mu = intermediates['interp_plan_mu']
+    log_mu = intermediates['log_mu']
+    log_velocity_mm_s = intermediates['log_velocity_mm_s']
+    assigned_spot_index = intermediates['assigned_spot_index']
+    time_alignment = intermediates['time_alignment']
 
     diff_x = interp_plan_x - log_x
     diff_y = interp_plan_y - log_y
 
-    config = config or {}
     settling_index, settling_status = _detect_settling(
         log_x,
         log_y,
@@ -380,7 +495,6 @@ def calculate_differences_for_layer(
     stats_diff_x = diff_x[settled_mask] if np.any(settled_mask) else diff_x
     stats_diff_y = diff_y[settled_mask] if np.any(settled_mask) else diff_y
 
-    assigned_spot_index = _assign_samples_to_spots(log_time_s, plan_time_s)
     spot_mu, spot_is_transit_min_dose, spot_scan_speed_mm_s = _normalized_spot_series(
         plan_layer,
         plan_time_s,
@@ -429,17 +543,18 @@ def calculate_differences_for_layer(
     if overlap < 0.95:
         logger.warning(f"Plan/log time overlap: {overlap:.1%}")
 
-    # Save to CSV if requested
-    if save_to_csv:
-        logger.info(f"Saving data to {csv_filename}")
-        _write_debug_csv(
+    # Save debug columns if requested
+    if save_to_csv or debug_sink is not None:
+        _emit_debug_output(
+            save_to_csv,
             csv_filename,
+            debug_sink,
             log_time_s,
             interp_plan_x,
             interp_plan_y,
             log_x,
             log_y,
-            log_data,
+            intermediates,
             is_settling,
             log_velocity_mm_s,
             interp_plan_mu,
@@ -471,10 +586,17 @@ def calculate_differences_for_layer(
     # Add missing keys expected by report generator
     results['plan_positions'] = np.column_stack((interp_plan_x, interp_plan_y))
     results['log_positions'] = np.column_stack((log_x, log_y))
-    stats_x = _calculate_axis_stats(stats_diff_x)
-    stats_y = _calculate_axis_stats(stats_diff_y)
+    # Mergeable accumulators of the raw statistics samples for beam-level
+    # summaries; the layer's own p95 is read from their sketches.
+    accumulator_x = AxisStatsAccumulator.from_values(stats_diff_x)
+    accumulator_y = AxisStatsAccumulator.from_values(stats_diff_y)
+    stats_x = _calculate_axis_stats(stats_diff_x, accumulator_x)
+    stats_y = _calculate_axis_stats(stats_diff_y, accumulator_y)
     _store_axis_stats(results, "", stats_x, stats_y)
+    results['stats_accumulator_x'] = accumulator_x
+    results['stats_accumulator_y'] = accumulator_y
     results['time_overlap_fraction'] = overlap
+    results.update(time_alignment)
 
     if zero_dose_filter_enabled:
         results['filtered_diff_x'] = filtered_diff_x
@@ -2,10 +2,16 @@ import os
 import logging
 import yaml
 
+from src.pipeline_stages import STAGE_ORDER
+
 logger = logging.getLogger(__name__)
 
 VALID_ZERO_DOSE_REPORT_MODES = {"filtered", "raw", "both"}
-VALID_ANALYSIS_MODES = {"trajectory", "point_gamma"}
+VALID_ANALYSIS_MODES = {"trajectory", "point_gamma", "fluence_gamma", "both"}
+VALID_DEBUG_OUTPUT_FORMATS = {"csv", "npz"}
+VALID_GAMMA_SEARCH_MODES = {"time_locked", "spatial"}
+VALID_GAMMA_NORMALIZATIONS = {"global", "local"}
+VALID_GAMMA_TIME_GRIDS = {"fixed", "adaptive"}
 
 DEFAULT_ZERO_DOSE_FILTER = {
     "enabled": True,
@@ -24,7 +30,54 @@ DEFAULT_POINT_GAMMA_CONFIG = {
     "distance_mm_threshold": 2.0,
     "lower_percent_fluence_cutoff": 10.0,
     "normalization_factor_by_machine": {},
+    "search_mode": "time_locked",
+    "search_radius_factor": 2.0,
+    "criteria": [],
+    "time_grid": "fixed",
+    "adaptive_coarse_factor": 16,
+}
+
+DEFAULT_FLUENCE_GAMMA_CONFIG = {
+    "distance_mm": 2.0,
+    "dose_percent": 3.0,
+    "lower_percent_cutoff": 10.0,
+    "grid_resolution_mm": 0.5,
+    "spot_sigma_mm": None,
+}
+
+DEFAULT_TIME_ALIGNMENT_CONFIG = {
+    "enabled": False,
+    "max_lag_s": 0.05,
+    "fit_time_scale": False,
+    "spot_tolerance_mm": 1.0,
+    "max_scale_deviation": 0.05,
+}
+
+DEFAULT_CACHE_CONFIG = {
+    "enabled": False,
+    "dir": None,
+    "directory_index": False,
+}
+
+DEFAULT_IO_CONFIG = {
+    "prefetch_depth": 0,
+    "prefetch_max_mb": 256.0,
+    "read_concurrency": 1,
+}
+
+DEFAULT_WARM_INPUTS_CONFIG = {
+    "max_plans": 8,
 }
+
+DEFAULT_PROFILING_CONFIG = {
+    "enabled": False,
+    "stages": [],
+    "memory": False,
+    "memory_budget_mb": None,
+    "memory_top_allocators": 5,
+}
+
+
 def _validate_settling_config(config: dict) -> None:
     threshold = config.get("SETTLING_THRESHOLD_MM")
     window = config.get("SETTLING_WINDOW_SAMPLES")
@@ -94,6 +147,27 @@ def _validate_app_config(config: dict) -> None:
             f"ANALYSIS_MODE must be one of {sorted(VALID_ANALYSIS_MODES)}"
         )
 
+    search_mode = config.get("GAMMA_SEARCH_MODE", "time_locked")
+    if search_mode not in VALID_GAMMA_SEARCH_MODES:
+        raise ValueError(
+            f"GAMMA_SEARCH_MODE must be one of {sorted(VALID_GAMMA_SEARCH_MODES)}"
+        )
+    if float(config.get("GAMMA_SEARCH_RADIUS_FACTOR", 2.0)) < 1.0:
+        raise ValueError("GAMMA_SEARCH_RADIUS_FACTOR must be at least 1.0")
+    time_grid = config.get("GAMMA_TIME_GRID", "fixed")
+    if time_grid not in VALID_GAMMA_TIME_GRIDS:
+        raise ValueError(
+            f"GAMMA_TIME_GRID must be one of {sorted(VALID_GAMMA_TIME_GRIDS)}"
+        )
+    if int(config.get("GAMMA_ADAPTIVE_COARSE_FACTOR", 16)) < 1:
+        raise ValueError("GAMMA_ADAPTIVE_COARSE_FACTOR must be >= 1")
+
+    debug_output_format = config.get("DEBUG_OUTPUT_FORMAT", "csv")
+    if debug_output_format not in VALID_DEBUG_OUTPUT_FORMATS:
+        raise ValueError(
+            f"DEBUG_OUTPUT_FORMAT must be one of {sorted(VALID_DEBUG_OUTPUT_FORMATS)}"
+        )
+
     report_mode = config.get("ZERO_DOSE_REPORT_MODE")
     if report_mode not in VALID_ZERO_DOSE_REPORT_MODES:
         raise ValueError(
@@ -122,6 +196,59 @@ def _validate_app_config(config: dict) -> None:
     for key in point_gamma_float_keys:
         if config.get(key) <= 0:
             raise ValueError(f"{key} must be > 0")
+    for criterion in config.get("GAMMA_CRITERIA", []):
+        if (
+            criterion["fluence_percent_threshold"] <= 0
+            or criterion["distance_mm_threshold"] <= 0
+        ):
+            raise ValueError("GAMMA_CRITERIA thresholds must be > 0")
+        if criterion["normalization"] not in VALID_GAMMA_NORMALIZATIONS:
+            raise ValueError(
+                "GAMMA_CRITERIA normalization must be one of "
+                f"{sorted(VALID_GAMMA_NORMALIZATIONS)}"
+            )
+
+    for key in (
+        "FLUENCE_GAMMA_DISTANCE_MM",
+        "FLUENCE_GAMMA_DOSE_PERCENT",
+        "FLUENCE_GAMMA_LOWER_PERCENT_CUTOFF",
+        "FLUENCE_GAMMA_GRID_RESOLUTION_MM",
+    ):
+        if config.get(key) <= 0:
+            raise ValueError(f"{key} must be > 0")
+    spot_sigma_mm = config.get("FLUENCE_GAMMA_SPOT_SIGMA_MM")
+    if spot_sigma_mm is not None and spot_sigma_mm <= 0:
+        raise ValueError("FLUENCE_GAMMA_SPOT_SIGMA_MM must be > 0 when set")
+
+    for key in (
+        "TIME_ALIGNMENT_MAX_LAG_S",
+        "TIME_ALIGNMENT_SPOT_TOLERANCE_MM",
+        "TIME_ALIGNMENT_MAX_SCALE_DEVIATION",
+    ):
+        if config.get(key) <= 0:
+            raise ValueError(f"{key} must be > 0")
+
+    if config.get("PTN_PREFETCH_DEPTH", 0) < 0:
+        raise ValueError("PTN_PREFETCH_DEPTH must be >= 0")
+    if config.get("PTN_PREFETCH_MAX_MB", 1.0) <= 0:
+        raise ValueError("PTN_PREFETCH_MAX_MB must be > 0")
+    if config.get("PTN_READ_CONCURRENCY", 1) < 1:
+        raise ValueError("PTN_READ_CONCURRENCY must be >= 1")
+    if config.get("WARM_INPUTS_MAX_PLANS", 1) < 1:
+        raise ValueError("WARM_INPUTS_MAX_PLANS must be >= 1")
+
+    memory_budget_mb = config.get("MEMORY_BUDGET_MB")
+    if memory_budget_mb is not None and memory_budget_mb <= 0:
+        raise ValueError("MEMORY_BUDGET_MB must be > 0 when set")
+    if config.get("MEMORY_TOP_ALLOCATORS", 1) < 1:
+        raise ValueError("MEMORY_TOP_ALLOCATORS must be >= 1")
+
+    unknown_stages = sorted(set(config.get("PROFILE_STAGES", ())) - set(STAGE_ORDER))
+    if unknown_stages:
+        raise ValueError(
+            f"Invalid PROFILE_STAGES {', '.join(unknown_stages)}; "
+            f"expected any of {', '.join(STAGE_ORDER)}"
+        )
 
 
 def _parse_point_gamma_normalization_map(raw_value) -> dict[str, float]:
@@ -138,6 +265,33 @@ def _parse_point_gamma_normalization_map(raw_value) -> dict[str, float]:
     return parsed
 
 
+def _parse_point_gamma_criteria(raw_value) -> list[dict]:
+    if raw_value in (None, []):
+        return []
+    if not isinstance(raw_value, list):
+        raise ValueError("Invalid YAML structure: 'point_gamma.criteria' must be a list")
+
+    criteria = []
+    for entry in raw_value:
+        if not isinstance(entry, dict):
+            raise ValueError(
+                "Invalid YAML structure: each 'point_gamma.criteria' entry must be a dict"
+            )
+        try:
+            criteria.append(
+                {
+                    "fluence_percent_threshold": float(
+                        entry["fluence_percent_threshold"]
+                    ),
+                    "distance_mm_threshold": float(entry["distance_mm_threshold"]),
+                    "normalization": str(entry.get("normalization", "global")).lower(),
+                }
+            )
+        except KeyError as e:
+            raise ValueError(f"point_gamma.criteria entry is missing {e}") from e
+    return criteria
+
+
 def _parse_zero_dose_filter_config(yaml_data: dict) -> dict:
     section = yaml_data.get("zero_dose_filter") or {}
     if not isinstance(section, dict):
@@ -181,6 +335,113 @@ def _parse_point_gamma_config(yaml_data: dict) -> dict:
             merged["lower_percent_fluence_cutoff"]
         ),
         "GAMMA_NORMALIZATION_FACTOR_BY_MACHINE": normalization_map,
+        "GAMMA_SEARCH_MODE": str(merged["search_mode"]).lower(),
+        "GAMMA_SEARCH_RADIUS_FACTOR": float(merged["search_radius_factor"]),
+        "GAMMA_CRITERIA": _parse_point_gamma_criteria(merged.get("criteria")),
+        "GAMMA_TIME_GRID": str(merged["time_grid"]).lower(),
+        "GAMMA_ADAPTIVE_COARSE_FACTOR": int(merged["adaptive_coarse_factor"]),
+    }
+
+
+def _parse_fluence_gamma_config(yaml_data: dict) -> dict:
+    section = yaml_data.get("fluence_gamma") or {}
+    if not isinstance(section, dict):
+        raise ValueError("Invalid YAML structure: 'fluence_gamma' must be a dict")
+
+    merged = DEFAULT_FLUENCE_GAMMA_CONFIG.copy()
+    merged.update(section)
+    spot_sigma_mm = merged["spot_sigma_mm"]
+    return {
+        "FLUENCE_GAMMA_DISTANCE_MM": float(merged["distance_mm"]),
+        "FLUENCE_GAMMA_DOSE_PERCENT": float(merged["dose_percent"]),
+        "FLUENCE_GAMMA_LOWER_PERCENT_CUTOFF": float(merged["lower_percent_cutoff"]),
+        "FLUENCE_GAMMA_GRID_RESOLUTION_MM": float(merged["grid_resolution_mm"]),
+        "FLUENCE_GAMMA_SPOT_SIGMA_MM": None
+        if spot_sigma_mm is None
+        else float(spot_sigma_mm),
+    }
+
+
+def _parse_time_alignment_config(yaml_data: dict) -> dict:
+    section = yaml_data.get("time_alignment") or {}
+    if not isinstance(section, dict):
+        raise ValueError("Invalid YAML structure: 'time_alignment' must be a dict")
+
+    merged = DEFAULT_TIME_ALIGNMENT_CONFIG.copy()
+    merged.update(section)
+    return {
+        "TIME_ALIGNMENT_ENABLED": bool(merged["enabled"]),
+        "TIME_ALIGNMENT_MAX_LAG_S": float(merged["max_lag_s"]),
+        "TIME_ALIGNMENT_FIT_SCALE": bool(merged["fit_time_scale"]),
+        "TIME_ALIGNMENT_SPOT_TOLERANCE_MM": float(merged["spot_tolerance_mm"]),
+        "TIME_ALIGNMENT_MAX_SCALE_DEVIATION": float(merged["max_scale_deviation"]),
+    }
+
+
+def _parse_cache_config(yaml_data: dict) -> dict:
+    section = yaml_data.get("cache") or {}
+    if not isinstance(section, dict):
+        raise ValueError("Invalid YAML structure: 'cache' must be a dict")
+
+    merged = DEFAULT_CACHE_CONFIG.copy()
+    merged.update(section)
+    return {
+        "LAYER_CACHE_ENABLED": bool(merged["enabled"]),
+        "LAYER_CACHE_DIR": str(merged["dir"]) if merged["dir"] else None,
+        "DIRECTORY_INDEX_CACHE_ENABLED": bool(merged["directory_index"]),
+    }
+
+
+def _parse_io_config(yaml_data: dict) -> dict:
+    section = yaml_data.get("io") or {}
+    if not isinstance(section, dict):
+        raise ValueError("Invalid YAML structure: 'io' must be a dict")
+
+    merged = DEFAULT_IO_CONFIG.copy()
+    merged.update(section)
+    return {
+        "PTN_PREFETCH_DEPTH": int(merged["prefetch_depth"]),
+        "PTN_PREFETCH_MAX_MB": float(merged["prefetch_max_mb"]),
+        "PTN_READ_CONCURRENCY": int(merged["read_concurrency"]),
+    }
+
+
+def _parse_warm_inputs_config(yaml_data: dict) -> dict:
+    section = yaml_data.get("warm_inputs") or {}
+    if not isinstance(section, dict):
+        raise ValueError("Invalid YAML structure: 'warm_inputs' must be a dict")
+
+    merged = DEFAULT_WARM_INPUTS_CONFIG.copy()
+    merged.update(section)
+    return {
+        "WARM_INPUTS_MAX_PLANS": int(merged["max_plans"]),
+    }
+
+
+def _parse_profiling_config(yaml_data: dict) -> dict:
+    section = yaml_data.get("profiling") or {}
+    if not isinstance(section, dict):
+        raise ValueError("Invalid YAML structure: 'profiling' must be a dict")
+
+    merged = DEFAULT_PROFILING_CONFIG.copy()
+    merged.update(section)
+    stages = merged["stages"] or []
+    if isinstance(stages, str):
+        stages = stages.split(",")
+    if not isinstance(stages, list):
+        raise ValueError("Invalid YAML structure: 'profiling.stages' must be a list")
+    return {
+        "PROFILE_ENABLED": bool(merged["enabled"]),
+        "PROFILE_STAGES": tuple(
+            str(stage).strip().lower() for stage in stages if str(stage).strip()
+        ),
+        "PROFILE_MEMORY": bool(merged["memory"]),
+        "MEMORY_BUDGET_MB": (
+            float(merged["memory_budget_mb"])
+            if merged["memory_budget_mb"] is not None
+            else None
+        ),
+        "MEMORY_TOP_ALLOCATORS": int(merged["memory_top_allocators"]),
     }
 
 
@@ -236,9 +497,16 @@ def parse_yaml_config(file_path: str) -> dict:
         "EXPORT_REPORT_CSV": export_report_csv,
         "SAVE_DEBUG_CSV": save_debug_csv,
         "ANALYSIS_MODE": str(app_section.get("analysis_mode", "trajectory")).lower(),
+        "DEBUG_OUTPUT_FORMAT": str(app_section.get("debug_output_format", "csv")).lower(),
     }
     config.update(_parse_zero_dose_filter_config(yaml_data))
     config.update(_parse_point_gamma_config(yaml_data))
+    config.update(_parse_fluence_gamma_config(yaml_data))
+    config.update(_parse_time_alignment_config(yaml_data))
+    config.update(_parse_cache_config(yaml_data))
+    config.update(_parse_io_config(yaml_data))
+    config.update(_parse_warm_inputs_config(yaml_data))
+    config.update(_parse_profiling_config(yaml_data))
 
     _validate_app_config(config)
     return config
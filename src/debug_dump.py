@@ -0,0 +1,156 @@
+"""
+Binary columnar debug dumps.
+
+When ``debug_output_format: npz`` is configured, the per-sample debug columns
+of every layer of a beam are collected into one uncompressed ``.npz`` file
+(``debug_data_beam_<n>.npz``).  Each column is stored as one contiguous
+array over all layers; ``layer_offsets`` (length ``layers + 1``) and
+``layer_numbers`` locate the rows of a layer.  The members are stored
+uncompressed, so :func:`read_debug_layer` memory-maps each column at its
+offset in the zip file and reads only the rows of the requested layer.  The
+file is several times smaller and much faster to write than the equivalent
+``np.savetxt`` CSV.
+
+A CSV for one layer can be produced on demand::
+
+    python -m src.debug_dump output/debug_data_beam_1.npz --layer 3
+"""
+
+import argparse
+import os
+import struct
+import zipfile
+
+import numpy as np
+
+from src.calculator import DEBUG_COLUMNS, _write_debug_columns_csv
+
+
+def debug_dump_path(output_dir, beam_number):
+    return os.path.join(output_dir, f"debug_data_beam_{beam_number}.npz")
+
+
+class DebugDumpWriter:
+    """Collect per-layer debug columns for one beam and write them on close."""
+
+    def __init__(self, path):
+        self.path = path
+        self._layer_numbers = []
+        self._chunks = {name: [] for name in DEBUG_COLUMNS}
+
+    def add_layer(self, layer_number, columns):
+        lengths = {np.asarray(columns[name]).shape[0] for name in DEBUG_COLUMNS}
+        if len(lengths) != 1:
+            raise ValueError("Debug columns must all have the same length")
+        self._layer_numbers.append(int(layer_number))
+        for name in DEBUG_COLUMNS:
+            self._chunks[name].append(np.asarray(columns[name]))
+
+    def layer_sink(self, layer_number):
+        """Return a ``debug_sink`` callable bound to ``layer_number``."""
+        return lambda columns: self.add_layer(layer_number, columns)
+
+    def close(self):
+        """Write the dump; returns the path, or ``None`` when no layer was added."""
+        if not self._layer_numbers:
+            return None
+        lengths = [chunk.shape[0] for chunk in self._chunks[DEBUG_COLUMNS[0]]]
+        arrays = {
+            name: np.concatenate(self._chunks[name]) for name in DEBUG_COLUMNS
+        }
+        arrays["layer_offsets"] = np.concatenate(([0], np.cumsum(lengths))).astype(
+            np.int64
+        )
+        arrays["layer_numbers"] = np.asarray(self._layer_numbers, dtype=np.int64)
+        np.savez(self.path, **arrays)
+        self._chunks = {name: [] for name in DEBUG_COLUMNS}
+        self._layer_numbers = []
+        return self.path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+ZIP_LOCAL_HEADER = struct.Struct("<4s22xHH")
+ZIP_LOCAL_HEADER_SIGNATURE = b"PK\x03\x04"
+
+
+def open_member_memmap(path, zip_file, name):
+    """Read-only ``np.memmap`` of the uncompressed ``<name>.npy`` member."""
+    info = zip_file.getinfo(f"{name}.npy")
+    if info.compress_type != zipfile.ZIP_STORED:
+        raise ValueError(f"{name} in {path} is compressed and cannot be memory-mapped")
+    with open(path, "rb") as handle:
+        handle.seek(info.header_offset)
+        signature, name_length, extra_length = ZIP_LOCAL_HEADER.unpack(
+            handle.read(ZIP_LOCAL_HEADER.size)
+        )
+        if signature != ZIP_LOCAL_HEADER_SIGNATURE:
+            raise ValueError(f"Corrupt zip member {name} in {path}")
+        handle.seek(name_length + extra_length, os.SEEK_CUR)
+        version = np.lib.format.read_magic(handle)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(handle)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(handle)
+        data_offset = handle.tell()
+    if int(np.prod(shape)) == 0:
+        return np.empty(shape, dtype=dtype)
+    return np.memmap(
+        path,
+        dtype=dtype,
+        mode="r",
+        offset=data_offset,
+        shape=shape,
+        order="F" if fortran_order else "C",
+    )
+
+
+def read_debug_layer(path, layer_number):
+    """Return the debug columns of ``layer_number`` from a beam dump.
+
+    Only the rows of that layer are read from disk.
+    """
+    with zipfile.ZipFile(path) as zip_file:
+        layer_numbers = np.asarray(open_member_memmap(path, zip_file, "layer_numbers"))
+        matches = np.flatnonzero(layer_numbers == int(layer_number))
+        if matches.size == 0:
+            raise KeyError(
+                f"Layer {layer_number} not found in {path}; "
+                f"available layers: {layer_numbers.tolist()}"
+            )
+        offsets = open_member_memmap(path, zip_file, "layer_offsets")
+        start, stop = int(offsets[matches[0]]), int(offsets[matches[0] + 1])
+        return {
+            name: np.array(open_member_memmap(path, zip_file, name)[start:stop])
+            for name in DEBUG_COLUMNS
+        }
+
+
+def export_layer_csv(path, layer_number, csv_filename=None):
+    """Write one layer of a beam dump in the legacy debug CSV layout."""
+    if csv_filename is None:
+        stem = os.path.splitext(path)[0]
+        csv_filename = f"{stem}_layer_{layer_number}.csv"
+    _write_debug_columns_csv(csv_filename, read_debug_layer(path, layer_number))
+    return csv_filename
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert one layer of a binary debug dump to CSV."
+    )
+    parser.add_argument("dump", help="Path to a debug_data_beam_<n>.npz file")
+    parser.add_argument(
+        "--layer", type=int, required=True, help="Layer number (1-based) to export"
+    )
+    parser.add_argument("-o", "--output", help="CSV path (default: next to the dump)")
+    args = parser.parse_args()
+    print(f"Wrote {export_layer_csv(args.dump, args.layer, args.output)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+"""
+Single-walk index of the PTN delivery groups under a case log directory.
+
+Collecting delivery groups used to list the case directory, walk every
+subdirectory for PTN files, list the directory again for ``PlanRange.txt``
+and open ``PlanInfo.txt`` per group.  On a network share every listing is a
+round trip, so ``DeliveryIndex.scan`` lists each directory exactly once and
+records what the group logic needs: PTN files, parsed PlanRange rows and
+PlanInfo beam numbers.
+
+With a cache directory the index is stored as JSON and reused while every
+indexed directory keeps its mtime and every PlanRange/PlanInfo file keeps
+its mtime and size; validating costs one ``stat`` per directory instead of a
+listing.  Paths are stored relative to the case directory, so the cached
+index does not depend on how the directory was spelled.
+"""
+
+import csv
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+from src.layer_cache import DEFAULT_LAYER_CACHE_DIRNAME
+from src.planrange_parser import (
+    LayerRangeInfo,
+    planrange_lookup_from_rows,
+    read_planrange_file,
+)
+
+logger = logging.getLogger(__name__)
+
+INDEX_FORMAT_VERSION = 1
+DEFAULT_DELIVERY_INDEX_DIRNAME = "delivery_index"
+PLANRANGE_FILENAME = "PlanRange.txt"
+PLANINFO_FILENAME = "PlanInfo.txt"
+
+
+def read_planinfo_beam_number(directory):
+    planinfo_path = os.path.join(directory, PLANINFO_FILENAME)
+    if not os.path.isfile(planinfo_path):
+        return None
+
+    try:
+        with open(planinfo_path, "r", encoding="utf-8") as handle:
+            reader = csv.reader(handle)
+            for row in reader:
+                if len(row) < 2:
+                    continue
+                if row[0].strip() == "DICOM_BEAM_NUMBER":
+                    value = row[1].strip()
+                    if value:
+                        return int(value)
+    except (OSError, ValueError) as exc:
+        logger.warning(
+            "Failed to read PlanInfo beam number from %s: %s", planinfo_path, exc
+        )
+
+    return None
+
+
+def _join(log_dir, rel_path):
+    return log_dir if rel_path == "" else os.path.join(log_dir, rel_path)
+
+
+class DeliveryIndex:
+    """Directory listing facts for one case directory, relative to it.
+
+    ``directories`` maps each indexed directory to its ``st_mtime_ns``;
+    ``ptn_files`` and ``subdirs`` hold the direct PTN file names and child
+    directory names of each; ``planrange_rows`` and ``beam_numbers`` hold the
+    parsed PlanRange.txt / PlanInfo.txt of the directories that have one;
+    ``marker_files`` records ``[mtime_ns, size]`` of those files.
+    """
+
+    def __init__(
+        self,
+        directories,
+        ptn_files,
+        subdirs,
+        planrange_rows,
+        beam_numbers,
+        marker_files,
+    ):
+        self.directories = directories
+        self.ptn_files = ptn_files
+        self.subdirs = subdirs
+        self.planrange_rows = planrange_rows
+        self.beam_numbers = beam_numbers
+        self.marker_files = marker_files
+
+    @classmethod
+    def scan(cls, log_dir):
+        """List every directory under ``log_dir`` once and parse its markers.
+
+        Matches the ``os.walk`` of each group directory it replaces: a
+        symlinked immediate subdirectory is a group directory and is listed,
+        while symlinked directories below it are not descended into.
+        """
+        directories = {}
+        ptn_files = {}
+        subdirs = {}
+        planrange_rows = {}
+        beam_numbers = {}
+        marker_files = {}
+
+        pending = [""]
+        while pending:
+            rel_dir = pending.pop()
+            path = _join(log_dir, rel_dir)
+            try:
+                # Stat before listing: a change during the listing leaves an
+                # older mtime behind, which invalidates the cached index.
+                directories[rel_dir] = os.stat(path).st_mtime_ns
+                with os.scandir(path) as entries:
+                    entries = list(entries)
+            except OSError as e:
+                logger.warning("Could not scan directory %s: %s", path, e)
+                continue
+
+            names = []
+            children = []
+            for entry in entries:
+                if entry.is_dir():
+                    children.append(entry.name)
+                    if rel_dir == "" or not entry.is_symlink():
+                        pending.append(os.path.join(rel_dir, entry.name))
+                elif entry.name.endswith(".ptn"):
+                    names.append(entry.name)
+                elif entry.name in (PLANRANGE_FILENAME, PLANINFO_FILENAME):
+                    rel_file = os.path.join(rel_dir, entry.name)
+                    stat = entry.stat()
+                    marker_files[rel_file] = [stat.st_mtime_ns, stat.st_size]
+                    if entry.name == PLANRANGE_FILENAME:
+                        planrange_rows[rel_dir] = read_planrange_file(entry.path)
+                    else:
+                        beam_numbers[rel_dir] = read_planinfo_beam_number(path)
+            ptn_files[rel_dir] = sorted(names)
+            subdirs[rel_dir] = sorted(children)
+
+        return cls(
+            directories, ptn_files, subdirs, planrange_rows, beam_numbers, marker_files
+        )
+
+    def is_current(self, log_dir):
+        """True while no indexed directory or marker file has changed."""
+        try:
+            for rel_dir, mtime_ns in self.directories.items():
+                if os.stat(_join(log_dir, rel_dir)).st_mtime_ns != mtime_ns:
+                    return False
+            for rel_file, (mtime_ns, size) in self.marker_files.items():
+                stat = os.stat(os.path.join(log_dir, rel_file))
+                if stat.st_mtime_ns != mtime_ns or stat.st_size != size:
+                    return False
+        except OSError:
+            return False
+        return True
+
+    def all_ptn_files(self, log_dir, rel_dir=""):
+        """PTN paths under ``rel_dir`` (recursively), sorted by path."""
+        found = []
+        pending = [rel_dir]
+        while pending:
+            current = pending.pop()
+            if current not in self.directories:
+                continue
+            found.extend(
+                os.path.join(_join(log_dir, current), name)
+                for name in self.ptn_files.get(current, [])
+            )
+            pending.extend(
+                os.path.join(current, child) for child in self.subdirs.get(current, [])
+            )
+        return sorted(found)
+
+    def planrange_lookup(self, log_dir, rel_dir=""):
+        """Same result as ``parse_planrange_for_directory`` on ``rel_dir``."""
+        rows_by_dir = []
+        candidates = [rel_dir] + [
+            os.path.join(rel_dir, child) for child in self.subdirs.get(rel_dir, [])
+        ]
+        for candidate in candidates:
+            if candidate in self.planrange_rows:
+                rows_by_dir.append(
+                    (_join(log_dir, candidate), self.planrange_rows[candidate])
+                )
+        return planrange_lookup_from_rows(rows_by_dir, _join(log_dir, rel_dir))
+
+    def delivery_groups(self, log_dir):
+        """Delivery groups as returned by ``main.collect_ptn_delivery_groups``.
+
+        PTN files directly in ``log_dir`` form the first group; every
+        immediate subdirectory holding PTN files (at any depth) forms one
+        more, in name order.
+        """
+        groups = []
+        candidates = [("", self.ptn_files.get("", []))] + [
+            (child, self.all_ptn_files(log_dir, child))
+            for child in self.subdirs.get("", [])
+        ]
+        for rel_dir, ptn_files in candidates:
+            if not ptn_files:
+                continue
+            if rel_dir == "":
+                ptn_files = [os.path.join(log_dir, name) for name in ptn_files]
+            groups.append(
+                {
+                    "source_dir": _join(log_dir, rel_dir),
+                    "ptn_files": ptn_files,
+                    "planrange_lookup": self.planrange_lookup(log_dir, rel_dir),
+                    "beam_number": self.beam_numbers.get(rel_dir),
+                }
+            )
+        return groups
+
+    def to_json(self):
+        return {
+            "version": INDEX_FORMAT_VERSION,
+            "directories": self.directories,
+            "ptn_files": self.ptn_files,
+            "subdirs": self.subdirs,
+            "planrange_rows": {
+                rel_dir: [[name, list(info)] for name, info in rows]
+                for rel_dir, rows in self.planrange_rows.items()
+            },
+            "beam_numbers": self.beam_numbers,
+            "marker_files": self.marker_files,
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        if data.get("version") != INDEX_FORMAT_VERSION:
+            raise ValueError(f"Unsupported delivery index version {data.get('version')}")
+        return cls(
+            data["directories"],
+            data["ptn_files"],
+            data["subdirs"],
+            {
+                rel_dir: [(name, LayerRangeInfo(*info)) for name, info in rows]
+                for rel_dir, rows in data["planrange_rows"].items()
+            },
+            data["beam_numbers"],
+            {rel_file: tuple(value) for rel_file, value in data["marker_files"].items()},
+        )
+
+
+def _index_cache_path(cache_dir, log_dir):
+    digest = hashlib.sha256(os.path.abspath(log_dir).encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, f"{digest[:32]}.json")
+
+
+def _load_cached_index(path):
+    try:
+        with open(path, "r", encoding="utf-8") as handle:
+            return DeliveryIndex.from_json(json.load(handle))
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logger.warning("Ignoring unreadable delivery index %s: %s", path, e)
+        return None
+
+
+def _store_index(path, index):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as handle:
+            json.dump(index.to_json(), handle)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def load_delivery_index(log_dir, cache_dir=None):
+    """Return the ``DeliveryIndex`` for ``log_dir``, reusing a current cache entry."""
+    if cache_dir is None:
+        return DeliveryIndex.scan(log_dir)
+
+    path = _index_cache_path(cache_dir, log_dir)
+    index = _load_cached_index(path)
+    if index is not None and index.is_current(log_dir):
+        logger.debug("Reusing delivery index %s for %s", path, log_dir)
+        return index
+
+    index = DeliveryIndex.scan(log_dir)
+    try:
+        _store_index(path, index)
+    except OSError as e:
+        logger.warning("Could not store delivery index %s: %s", path, e)
+    return index
+
+
+def delivery_index_cache_dir(app_config, output_dir):
+    """Directory for cached indexes when ``cache.directory_index`` is set."""
+    if not app_config.get("DIRECTORY_INDEX_CACHE_ENABLED", False):
+        return None
+    cache_root = app_config.get("LAYER_CACHE_DIR") or os.path.join(
+        output_dir, DEFAULT_LAYER_CACHE_DIRNAME
+    )
+    return os.path.join(cache_root, DEFAULT_DELIVERY_INDEX_DIRNAME)
@@ -0,0 +1,145 @@
+"""
+On-disk cache of threshold-independent per-layer intermediates.
+
+Parsing a PTN file, applying MU correction, aligning and interpolating the
+plan onto the log samples does not depend on the settling, zero-dose filter
+or gamma thresholds.  When ``cache.enabled`` is set, those intermediates are
+stored as one uncompressed ``.npz`` per layer so a rerun with different
+thresholds only recomputes masks and statistics.
+
+Entries are keyed by the PTN file identity (path, size, mtime), the plan
+layer arrays, the machine config, the PlanRange entry, the analysis mode and
+the settings that shape the intermediates (time alignment and gamma
+normalization).  Any change to those produces a new key; stale entries are
+simply never read again.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CACHE_FORMAT_VERSION = 1
+DEFAULT_LAYER_CACHE_DIRNAME = ".layer_cache"
+_META_KEY = "__meta__"
+_PLAN_LAYER_KEYS = ("time_axis_s", "trajectory_x_mm", "trajectory_y_mm", "cumulative_mu")
+_INTERMEDIATE_CONFIG_PREFIXES = ("TIME_ALIGNMENT_", "GAMMA_NORMALIZATION_FACTOR")
+# The adaptive point-gamma grid is refined against the gamma criteria, so
+# every gamma setting shapes its intermediates.
+_ADAPTIVE_GRID_CONFIG_PREFIXES = _INTERMEDIATE_CONFIG_PREFIXES + ("GAMMA_",)
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+def _update_with_array(digest, value):
+    array = np.ascontiguousarray(np.asarray(value, dtype=float))
+    digest.update(str(array.shape).encode("ascii"))
+    digest.update(array.tobytes())
+
+
+class LayerCache:
+    """Store and load layer intermediates under ``cache_dir``."""
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(
+        self,
+        *,
+        ptn_file,
+        plan_layer,
+        machine_config,
+        analysis_config,
+        analysis_mode,
+        range_info=None,
+    ):
+        """Return the hex cache key for one layer."""
+        stat = os.stat(ptn_file)
+        config_prefixes = _INTERMEDIATE_CONFIG_PREFIXES
+        if analysis_config.get("GAMMA_TIME_GRID") == "adaptive":
+            config_prefixes = _ADAPTIVE_GRID_CONFIG_PREFIXES
+        digest = hashlib.sha256()
+        header = {
+            "version": CACHE_FORMAT_VERSION,
+            "analysis_mode": analysis_mode,
+            "ptn_file": os.path.abspath(ptn_file),
+            "ptn_size": stat.st_size,
+            "ptn_mtime_ns": stat.st_mtime_ns,
+            "range_info": None
+            if range_info is None
+            else [float(range_info.energy), int(range_info.dose1_range_code)],
+            "machine_config": machine_config,
+            "analysis_config": {
+                key: value
+                for key, value in analysis_config.items()
+                if key.startswith(config_prefixes)
+            },
+        }
+        digest.update(
+            json.dumps(header, sort_keys=True, default=_json_default).encode("utf-8")
+        )
+        for plan_key in _PLAN_LAYER_KEYS:
+            if plan_key in plan_layer:
+                digest.update(plan_key.encode("ascii"))
+                _update_with_array(digest, plan_layer[plan_key])
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def load(self, key):
+        """Return cached intermediates for ``key`` or ``None`` on a miss."""
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as stored:
+                intermediates = {
+                    name: stored[name] for name in stored.files if name != _META_KEY
+                }
+                intermediates.update(json.loads(str(stored[_META_KEY])))
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("Ignoring unreadable layer cache entry %s: %s", path, e)
+            return None
+        return intermediates
+
+    def store(self, key, intermediates):
+        """Persist ``intermediates``: arrays as members, everything else as JSON."""
+        arrays = {}
+        meta = {}
+        for name, value in intermediates.items():
+            if isinstance(value, np.ndarray):
+                arrays[name] = value
+            else:
+                meta[name] = value
+        arrays[_META_KEY] = np.array(json.dumps(meta, default=_json_default))
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as handle:
+                np.savez(handle, **arrays)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+def layer_cache_from_config(app_config, output_dir):
+    """Return a ``LayerCache`` when enabled in ``app_config``, else ``None``."""
+    if not app_config.get("LAYER_CACHE_ENABLED", False):
+        return None
+    cache_dir = app_config.get("LAYER_CACHE_DIR") or os.path.join(
+        output_dir, DEFAULT_LAYER_CACHE_DIRNAME
+    )
+    return LayerCache(cache_dir)
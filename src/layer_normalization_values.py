@@ -4,12 +4,14 @@ import math
 import os
 import statistics
 
+from main import app_config_path, load_app_config
 from src.analysis_context import (
     load_plan_and_machine_config,
     parse_ptn_with_optional_mu_correction,
 )
-from src.planrange_parser import parse_planrange_for_directory
-from main import find_ptn_files
+from src.delivery_index import load_delivery_index
+from src.pipeline_profiler import pipeline_profiler_from_config
+from src.run_profile import stage
 
 
 def format_range_difference(label_a, value_a, label_b, value_b):
@@ -19,14 +21,18 @@ def format_range_difference(label_a, value_a, label_b, value_b):
 
 
 def build_normalization_rows(log_dir, dcm_file):
-    plan_data, _config = load_plan_and_machine_config(dcm_file)
+    with stage("dicom_parse"):
+        plan_data, _config = load_plan_and_machine_config(dcm_file)
     machine_name = plan_data.get("machine_name", "UNKNOWN").upper()
 
-    ptn_files = find_ptn_files(log_dir, sort_paths=True)
+    # One directory walk serves both the PTN list and the PlanRange lookup.
+    with stage("directory_scan"):
+        delivery_index = load_delivery_index(log_dir)
+    ptn_files = delivery_index.all_ptn_files(log_dir)
     if not ptn_files:
         raise FileNotFoundError(f"No .ptn files found in directory {log_dir}")
 
-    planrange_lookup = parse_planrange_for_directory(log_dir)
+    planrange_lookup = delivery_index.planrange_lookup(log_dir)
 
     expected_layer_count = sum(
         len(beam_data.get("layers", {})) for beam_data in plan_data["beams"].values()
@@ -219,6 +225,13 @@ def run_analysis(
     return layer_csv, summary_csv
 
 
+def _app_config():
+    """Parsed ``config.yaml`` for the ``profiling`` section; ``{}`` without one."""
+    if not os.path.exists(app_config_path()):
+        return {}
+    return load_app_config()
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Compute per-layer normalization values from RTPLAN and PTN data."
@@ -238,14 +251,42 @@ def main():
         default="machine_beam_summary.csv",
         help="Output filename for the beam/machine summary CSV",
     )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        default=None,
+        help="Write cProfile stats and flame-graph stacks to the output directory "
+        "(default: profiling.enabled in config.yaml)",
+    )
+    parser.add_argument(
+        "--profile_stages",
+        help="Comma-separated stages to profile, e.g. ptn_read,mu_correction "
+        "(implies --profile)",
+    )
 
     args = parser.parse_args()
-    layer_csv, summary_csv = run_analysis(
-        log_dir=args.log_dir,
-        dcm_file=args.dcm_file,
-        output_dir=args.output,
-        layer_filename=args.layer_filename,
-        summary_filename=args.summary_filename,
+    profiler = pipeline_profiler_from_config(
+        _app_config(), enabled=args.profile, stages=args.profile_stages
     )
+    run_kwargs = {
+        "log_dir": args.log_dir,
+        "dcm_file": args.dcm_file,
+        "output_dir": args.output,
+        "layer_filename": args.layer_filename,
+        "summary_filename": args.summary_filename,
+    }
+    if profiler is None:
+        layer_csv, summary_csv = run_analysis(**run_kwargs)
+    else:
+        try:
+            with profiler.activate():
+                layer_csv, summary_csv = run_analysis(**run_kwargs)
+        finally:
+            for path in profiler.write(args.output):
+                print(f"Wrote {path}")
     print(f"Wrote {layer_csv}")
     print(f"Wrote {summary_csv}")
+
+
+if __name__ == "__main__":
+    main()
@@ -116,6 +116,27 @@ def _remove_alignment_outliers(
     return _select_arrays(arrays, slice(n_outliers, None))
 
 
+def read_ptn_raw(file_path: str) -> np.ndarray:
+    """
+    Reads the raw big-endian 16-bit words of a .ptn file.
+
+    This is the I/O half of :func:`parse_ptn_file`; :func:`parse_ptn_data`
+    does the rest, so a file can be read ahead on another thread.
+
+    Raises:
+        FileNotFoundError: If file_path does not exist.
+        IOError: If the file cannot be read.
+    """
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"Error: File not found at {file_path}")
+
+    try:
+        # Big-endian 2-byte unsigned integers
+        return np.fromfile(file_path, dtype='>u2')
+    except Exception as e:
+        raise IOError(f"Error reading binary data from {file_path}: {e}")
+
+
 def parse_ptn_file(file_path: str, config_params: dict) -> dict:
     """
     Parses a .ptn binary log file into a dictionary of numpy arrays.
@@ -163,15 +184,22 @@ def parse_ptn_file(file_path: str, config_params: dict) -> dict:
     # 2. Check for essential config_params
     _require_config_params(config_params)
 
+    # 3. Read binary data
+    return parse_ptn_data(read_ptn_raw(file_path), config_params)
+
+
+def parse_ptn_data(raw_data_1d: np.ndarray, config_params: dict) -> dict:
+    """
+    Parses the raw words returned by :func:`read_ptn_raw`.
+
+    Returns the same dictionary as :func:`parse_ptn_file` and raises the same
+    ``KeyError`` / ``ValueError`` for bad config or data.
+    """
+    _require_config_params(config_params)
+
     # Check if beam filtering is enabled
     filtered_beam_enabled = config_params.get('FILTERED_BEAM_ON_OFF', 'on').lower() == 'on'
 
-    try:
-        # 3. Read binary data using numpy, big-endian 2-byte unsigned integers
-        raw_data_1d = np.fromfile(file_path, dtype='>u2')
-    except Exception as e:
-        raise IOError(f"Error reading binary data from {file_path}: {e}")
-
     # 4. Check if data can be reshaped (multiple of 8)
     if raw_data_1d.size % PTN_COLUMN_COUNT != 0:
         raise ValueError(
@@ -6,10 +6,10 @@ and a dose dividing factor to convert raw dose1_au counts into physically
 corrected MU values.
 """
 
+import functools
 import logging
 
 import numpy as np
-from scipy.interpolate import PchipInterpolator
 
 logger = logging.getLogger(__name__)
 
@@ -51,10 +51,16 @@ class ConstExtrapPchipInterpolator:
         sort_idx = np.argsort(x)
         self._x = x[sort_idx]
         self._y = y[sort_idx]
-        self._interpolator = PchipInterpolator(self._x, self._y, extrapolate=False)
         self._min_x, self._max_x = self._x[0], self._x[-1]
         self._min_y, self._max_y = self._y[0], self._y[-1]
 
+    @functools.cached_property
+    def _interpolator(self):
+        # Built on first use so importing this module does not load scipy.
+        from scipy.interpolate import PchipInterpolator
+
+        return PchipInterpolator(self._x, self._y, extrapolate=False)
+
     def __call__(self, xi):
         xi = np.asarray(xi)
         yi = np.empty_like(xi, dtype=np.float32)
@@ -102,6 +108,41 @@ def get_monitor_range_factor(monitor_range_code: int) -> float:
     return factors[monitor_range_code]
 
 
+# ---------------------------------------------------------------------------
+# Scalar correction factor, memoized per (energy, range code, dividing factor)
+# ---------------------------------------------------------------------------
+@functools.lru_cache(maxsize=1024)
+def _cached_mu_correction_factor(
+    nominal_energy: float,
+    monitor_range_code: int,
+    dose_dividing_factor: float,
+) -> float:
+    return (
+        float(PROTON_DOSE_INTERPOLATOR(nominal_energy))
+        * float(MU_COUNT_DOSE_INTERPOLATOR(nominal_energy))
+        * get_monitor_range_factor(monitor_range_code)
+        / dose_dividing_factor
+    )
+
+
+def mu_correction_factor(
+    nominal_energy: float,
+    monitor_range_code: int,
+    dose_dividing_factor: float = 10.0,
+) -> float:
+    """
+    Return the dose1_au -> MU factor for one layer.
+
+    A plan reuses a handful of energies and range codes across hundreds of
+    layers, so the two PCHIP evaluations are memoized.
+    """
+    return _cached_mu_correction_factor(
+        float(nominal_energy),
+        int(monitor_range_code),
+        float(dose_dividing_factor),
+    )
+
+
 # ---------------------------------------------------------------------------
 # Convenience function to apply all corrections to parsed PTN log data
 # ---------------------------------------------------------------------------
@@ -125,12 +166,17 @@ def apply_mu_correction(
     Unlike mqi_interpreter (which rounds to int for MOQUI CSV output),
     we keep float values because ptn_checker uses MU for continuous
     interpolation.
+
+    The factors collapse into one scalar (``mu_correction_factor``), applied
+    in a single multiply that computes in float64 and writes float32.  Only
+    the running sum is accumulated in float64, so long layers do not drift.
     """
-    corrected = log_data['dose1_au'].astype(np.float64)
-    corrected *= PROTON_DOSE_INTERPOLATOR(nominal_energy)
-    corrected *= MU_COUNT_DOSE_INTERPOLATOR(nominal_energy)
-    corrected *= get_monitor_range_factor(monitor_range_code)
-    corrected /= dose_dividing_factor
-    log_data['mu_per_sample_corrected'] = corrected.astype(np.float32)
-    log_data['mu'] = np.cumsum(corrected).astype(np.float32)
+    factor = mu_correction_factor(
+        nominal_energy, monitor_range_code, dose_dividing_factor
+    )
+    dose1_au = np.asarray(log_data['dose1_au'])
+    corrected = np.empty(dose1_au.shape, dtype=np.float32)
+    np.multiply(dose1_au, factor, out=corrected, dtype=np.float64)
+    log_data['mu_per_sample_corrected'] = corrected
+    log_data['mu'] = np.cumsum(corrected, dtype=np.float64).astype(np.float32)
     return log_data
@@ -0,0 +1,553 @@
+"""
+Vectorized parameter sweep over zero-dose, settling and gamma settings.
+
+Every layer is parsed, aligned and interpolated once (reusing the layer cache
+when enabled); the settling, boundary-carryover and gamma criteria are then
+evaluated for all combinations at once by broadcasting the sample masks over
+a leading parameter axis.  The sweep always applies the zero-dose filter so
+the boundary holdoff axes take effect, and gamma criteria are evaluated with
+the time-locked comparison.
+
+Writes a tidy per-layer table (one row per layer and combination) and a
+per-combination summary::
+
+    python -m src.parameter_sweep --log_dir <dir> --dcm_file <plan.dcm> \\
+        --output sweep --holdoff_s 0,0.0006,0.001 --settling_threshold_mm 0.3,0.5
+"""
+
+import argparse
+import csv
+import itertools
+import logging
+import os
+
+import numpy as np
+
+from src.analysis_context import (
+    load_plan_and_machine_config,
+    parse_ptn_with_optional_mu_correction,
+)
+from src.calculator import (
+    DEFAULT_SETTLING_CONSECUTIVE_SAMPLES,
+    DEFAULT_SETTLING_SEARCH_WINDOW_S,
+    DEFAULT_SETTLING_THRESHOLD_MM,
+    DEFAULT_ZERO_DOSE_BOUNDARY_HOLDOFF_S,
+    DEFAULT_ZERO_DOSE_POST_MINIMAL_DOSE_BOUNDARY_S,
+    _assign_samples_to_spots,
+    _normalized_spot_series,
+)
+from src.config_loader import parse_yaml_config
+from src.delivery_index import delivery_index_cache_dir
+from src.layer_cache import layer_cache_from_config
+from src.report_metrics import layer_passes
+from src.streaming_stats import QuantileSketch
+from main import (
+    _analysis_mode,
+    _prepare_layer_intermediates,
+    _resolve_machine_gamma_config,
+    collect_ptn_delivery_groups,
+    match_delivery_groups_to_beams,
+)
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on combinations x samples materialized at once for max/p95.
+MAX_MASK_ELEMENTS_PER_CHUNK = 4_000_000
+
+PARAMETER_FIELDS = [
+    "zero_dose_boundary_holdoff_s",
+    "zero_dose_post_minimal_dose_boundary_s",
+    "settling_threshold_mm",
+]
+GAMMA_PARAMETER_FIELDS = ["gamma_distance_mm", "gamma_fluence_percent"]
+STATS_FIELDS = [
+    "num_included_samples",
+    "mean_diff_x",
+    "mean_diff_y",
+    "std_diff_x",
+    "std_diff_y",
+    "rmse_x",
+    "rmse_y",
+    "max_abs_diff_x",
+    "max_abs_diff_y",
+    "p95_abs_diff_x",
+    "p95_abs_diff_y",
+]
+
+
+def _repo_root():
+    return os.path.dirname(os.path.dirname(__file__))
+
+
+def parse_grid(text):
+    """Parse a comma-separated list of floats into a sorted unique array."""
+    values = [float(item) for item in str(text).split(",") if item.strip()]
+    if not values:
+        raise ValueError(f"Empty parameter grid: {text!r}")
+    return np.unique(np.asarray(values, dtype=float))
+
+
+def settling_indices(
+    log_x,
+    log_y,
+    time_s,
+    target_x,
+    target_y,
+    thresholds,
+    consecutive,
+    window_s=DEFAULT_SETTLING_SEARCH_WINDOW_S,
+):
+    """Vectorized ``_detect_settling`` over an array of thresholds."""
+    thresholds = np.asarray(thresholds, dtype=float)
+    run_length = int(consecutive)
+    search_length = min(int(np.sum(np.asarray(time_s) <= float(window_s))), len(log_x))
+    if len(log_x) == 0 or search_length < run_length:
+        return np.zeros(thresholds.size, dtype=int)
+
+    deviation = np.maximum(
+        np.abs(np.asarray(log_x[:search_length], dtype=float) - float(target_x)),
+        np.abs(np.asarray(log_y[:search_length], dtype=float) - float(target_y)),
+    )
+    within = deviation[None, :] < thresholds[:, None]
+    cumulative = np.concatenate(
+        (np.zeros((thresholds.size, 1), dtype=int), np.cumsum(within, axis=1)), axis=1
+    )
+    stable_run = (cumulative[:, run_length:] - cumulative[:, :-run_length]) == run_length
+    first = np.argmax(stable_run, axis=1)
+    return np.where(np.any(stable_run, axis=1), first, search_length)
+
+
+def boundary_elapsed_s(plan_time_s, time_s, assigned_spot_index, spot_is_transit_min_dose):
+    """Time since the start of a treatment spot that follows a transit spot.
+
+    Samples on any other spot get ``inf`` so no holdoff can flag them.
+    """
+    elapsed = np.full(len(time_s), np.inf)
+    after_transit = np.zeros(len(plan_time_s), dtype=bool)
+    after_transit[1:] = (~spot_is_transit_min_dose[1:]) & spot_is_transit_min_dose[:-1]
+    flagged = after_transit[assigned_spot_index]
+    elapsed[flagged] = (
+        np.asarray(time_s)[flagged] - plan_time_s[assigned_spot_index[flagged] - 1]
+    )
+    return elapsed
+
+
+def analysis_masks(
+    num_samples,
+    settling,
+    elapsed_s,
+    sample_is_transit_min_dose,
+    holdoffs_s,
+    post_boundaries_s,
+):
+    """Return ``(filtered, settled)`` masks of shape ``[S, H, P, N]`` and ``[S, N]``."""
+    holdoffs_s = np.asarray(holdoffs_s, dtype=float)
+    post_boundaries_s = np.asarray(post_boundaries_s, dtype=float)
+    settled = np.arange(num_samples)[None, :] >= np.asarray(settling)[:, None]
+    holdoff_carry = (holdoffs_s[:, None] > 0) & (elapsed_s[None, :] < holdoffs_s[:, None])
+    post_carry = (elapsed_s[None, :] >= 0) & (
+        elapsed_s[None, :] < post_boundaries_s[:, None]
+    )
+    carryover = holdoff_carry[:, None, :] | post_carry[None, :, :]
+    filtered = (
+        settled[:, None, None, :]
+        & ~np.asarray(sample_is_transit_min_dose, dtype=bool)[None, None, None, :]
+        & ~carryover[None, :, :, :]
+    )
+    return filtered, settled
+
+
+def _masked_axis_stats(masks, diff):
+    """Stats of ``diff`` under each row of ``masks`` (``[M, N]``)."""
+    weights = masks.astype(float)
+    count = weights.sum(axis=1)
+    safe_count = np.where(count > 0, count, 1.0)
+    mean = weights @ diff / safe_count
+    mean_sq = weights @ (diff * diff) / safe_count
+    abs_diff = np.abs(diff)
+    max_abs = np.zeros(masks.shape[0])
+    p95_abs = np.zeros(masks.shape[0])
+    chunk = max(1, MAX_MASK_ELEMENTS_PER_CHUNK // max(diff.size, 1))
+    for start in range(0, masks.shape[0], chunk):
+        block = masks[start:start + chunk]
+        masked = np.where(block, abs_diff[None, :], np.nan)
+        has_values = np.any(block, axis=1)
+        if np.any(has_values):
+            max_abs[start:start + chunk][has_values] = np.nanmax(masked[has_values], axis=1)
+    # Same quantile sketch as the layer workflows, so rows match single runs.
+    for row in np.flatnonzero(count > 0):
+        p95_abs[row] = QuantileSketch.from_values(abs_diff[masks[row]]).percentile(95)
+    return {
+        "count": count,
+        "mean": mean,
+        "std": np.sqrt(np.maximum(mean_sq - mean * mean, 0.0)),
+        "rmse": np.sqrt(mean_sq),
+        "max_abs": max_abs,
+        "p95_abs": p95_abs,
+    }
+
+
+def _stats_masks(filtered, settled=None):
+    """Flatten to ``[M, N]`` with the layer workflows' empty-mask fallbacks.
+
+    The trajectory calculator falls back from the filtered to the settled
+    samples and then to all samples; point gamma (``settled=None``) falls back
+    straight to all samples.
+    """
+    shape = filtered.shape
+    flat = filtered.reshape(-1, shape[-1]).copy()
+    if settled is not None:
+        fallback = np.broadcast_to(settled[:, None, None, :], shape).reshape(-1, shape[-1])
+        empty = ~np.any(flat, axis=1)
+        flat[empty] = fallback[empty]
+    still_empty = ~np.any(flat, axis=1)
+    flat[still_empty] = True
+    return flat
+
+
+def sweep_layer(plan_layer, intermediates, config, grids, analysis_mode):
+    """Evaluate every parameter combination for one layer.
+
+    Returns a list of row dicts (parameters + statistics).
+    """
+    plan_time_s = np.asarray(plan_layer["time_axis_s"], dtype=float)
+    plan_x = np.asarray(plan_layer["trajectory_x_mm"], dtype=float)
+    plan_y = np.asarray(plan_layer["trajectory_y_mm"], dtype=float)
+    if analysis_mode == "point_gamma":
+        time_s = np.asarray(intermediates["time_s"], dtype=float)
+        log_x = np.asarray(intermediates["log_x"], dtype=float)
+        log_y = np.asarray(intermediates["log_y"], dtype=float)
+        diff_x = log_x - np.asarray(intermediates["plan_x"], dtype=float)
+        diff_y = log_y - np.asarray(intermediates["plan_y"], dtype=float)
+        assigned_spot_index = _assign_samples_to_spots(time_s, plan_time_s)
+    else:
+        time_s = np.asarray(intermediates["log_time_s"], dtype=float)
+        log_x = np.asarray(intermediates["log_x"], dtype=float)
+        log_y = np.asarray(intermediates["log_y"], dtype=float)
+        diff_x = np.asarray(intermediates["interp_plan_x"], dtype=float) - log_x
+        diff_y = np.asarray(intermediates["interp_plan_y"], dtype=float) - log_y
+        assigned_spot_index = np.asarray(intermediates["assigned_spot_index"], dtype=int)
+    if time_s.size == 0:
+        return []
+
+    _, spot_is_transit_min_dose, _ = _normalized_spot_series(plan_layer, plan_time_s)
+    settling = settling_indices(
+        log_x,
+        log_y,
+        time_s,
+        plan_x[0],
+        plan_y[0],
+        grids["settling_threshold_mm"],
+        config.get("SETTLING_CONSECUTIVE_SAMPLES", DEFAULT_SETTLING_CONSECUTIVE_SAMPLES),
+    )
+    filtered, settled = analysis_masks(
+        time_s.size,
+        settling,
+        boundary_elapsed_s(
+            plan_time_s, time_s, assigned_spot_index, spot_is_transit_min_dose
+        ),
+        spot_is_transit_min_dose[assigned_spot_index],
+        grids["zero_dose_boundary_holdoff_s"],
+        grids["zero_dose_post_minimal_dose_boundary_s"],
+    )
+    point_gamma = analysis_mode == "point_gamma"
+    stats_masks = _stats_masks(filtered, None if point_gamma else settled)
+    included_counts = filtered.reshape(stats_masks.shape).sum(axis=1)
+    stats_x = _masked_axis_stats(stats_masks, diff_x)
+    stats_y = _masked_axis_stats(stats_masks, diff_y)
+
+    combinations = list(
+        itertools.product(
+            grids["settling_threshold_mm"],
+            grids["zero_dose_boundary_holdoff_s"],
+            grids["zero_dose_post_minimal_dose_boundary_s"],
+        )
+    )
+    base_rows = []
+    for index, (threshold, holdoff, post) in enumerate(combinations):
+        row = {
+            "zero_dose_boundary_holdoff_s": float(holdoff),
+            "zero_dose_post_minimal_dose_boundary_s": float(post),
+            "settling_threshold_mm": float(threshold),
+            "num_included_samples": int(included_counts[index]),
+        }
+        for axis, stats in (("x", stats_x), ("y", stats_y)):
+            row[f"mean_diff_{axis}"] = float(stats["mean"][index])
+            row[f"std_diff_{axis}"] = float(stats["std"][index])
+            row[f"rmse_{axis}"] = float(stats["rmse"][index])
+            row[f"max_abs_diff_{axis}"] = float(stats["max_abs"][index])
+            row[f"p95_abs_diff_{axis}"] = float(stats["p95_abs"][index])
+        base_rows.append(row)
+
+    if not point_gamma:
+        for row in base_rows:
+            row["layer_pass"] = layer_passes(row)
+        return base_rows
+
+    return _gamma_rows(base_rows, filtered, intermediates, config, grids)
+
+
+def _gamma_rows(base_rows, filtered, intermediates, config, grids):
+    plan_count = np.asarray(intermediates["plan_count"], dtype=float)
+    log_count = np.asarray(intermediates["log_count"], dtype=float)
+    position_error_mm = np.hypot(
+        np.asarray(intermediates["log_x"], dtype=float)
+        - np.asarray(intermediates["plan_x"], dtype=float),
+        np.asarray(intermediates["log_y"], dtype=float)
+        - np.asarray(intermediates["plan_y"], dtype=float),
+    )
+    count_error = log_count - plan_count
+    peak_plan_count = float(np.max(plan_count)) if plan_count.size else 0.0
+    eligible = plan_count >= (
+        peak_plan_count * float(config["GAMMA_LOWER_PERCENT_FLUENCE_CUTOFF"]) / 100.0
+    )
+
+    distances = np.asarray(grids["gamma_distance_mm"], dtype=float)
+    fluence_percents = np.asarray(grids["gamma_fluence_percent"], dtype=float)
+    dose_thresholds = peak_plan_count * fluence_percents / 100.0
+    dose_thresholds = np.where(dose_thresholds > 0, dose_thresholds, 1e-12)
+    gamma_squared = (
+        (position_error_mm[None, None, :] / distances[:, None, None]) ** 2
+        + (count_error[None, None, :] / dose_thresholds[None, :, None]) ** 2
+    )
+    gamma_pass = (gamma_squared <= 1.0).reshape(-1, plan_count.size)
+
+    analysis = filtered.reshape(-1, plan_count.size)
+    evaluated = (analysis & eligible[None, :]).astype(float)
+    evaluated_count = evaluated.sum(axis=1)
+    passed = evaluated @ gamma_pass.T.astype(float)
+
+    rows = []
+    criteria = list(itertools.product(distances, fluence_percents))
+    for index, base_row in enumerate(base_rows):
+        for criteria_index, (distance, fluence) in enumerate(criteria):
+            row = dict(base_row)
+            row["gamma_distance_mm"] = float(distance)
+            row["gamma_fluence_percent"] = float(fluence)
+            row["evaluated_point_count"] = int(evaluated_count[index])
+            row["gamma_pass_rate"] = (
+                float(passed[index, criteria_index] / evaluated_count[index])
+                if evaluated_count[index] > 0
+                else 0.0
+            )
+            rows.append(row)
+    return rows
+
+
+def default_grids(config):
+    return {
+        "zero_dose_boundary_holdoff_s": np.array(
+            [config.get("ZERO_DOSE_BOUNDARY_HOLDOFF_S", DEFAULT_ZERO_DOSE_BOUNDARY_HOLDOFF_S)],
+            dtype=float,
+        ),
+        "zero_dose_post_minimal_dose_boundary_s": np.array(
+            [
+                config.get(
+                    "ZERO_DOSE_POST_MINIMAL_DOSE_BOUNDARY_S",
+                    DEFAULT_ZERO_DOSE_POST_MINIMAL_DOSE_BOUNDARY_S,
+                )
+            ],
+            dtype=float,
+        ),
+        "settling_threshold_mm": np.array(
+            [config.get("SETTLING_THRESHOLD_MM", DEFAULT_SETTLING_THRESHOLD_MM)],
+            dtype=float,
+        ),
+        "gamma_distance_mm": np.array(
+            [config.get("GAMMA_DISTANCE_MM_THRESHOLD", 2.0)], dtype=float
+        ),
+        "gamma_fluence_percent": np.array(
+            [config.get("GAMMA_FLUENCE_PERCENT_THRESHOLD", 5.0)], dtype=float
+        ),
+    }
+
+
+def _sweep_analysis_mode(config):
+    # ``both`` sweeps the point-gamma series, whose rows also carry the
+    # position statistics.
+    mode = _analysis_mode(config)
+    return "point_gamma" if mode == "both" else mode
+
+
+def _iter_layer_intermediates(log_dir, dcm_file, app_config, output_dir):
+    plan_data, machine_config = load_plan_and_machine_config(
+        dcm_file, zero_dose_config=app_config
+    )
+    analysis_config = {
+        **machine_config,
+        **_resolve_machine_gamma_config(app_config, plan_data.get("machine_name", "UNKNOWN")),
+        # An adaptive grid is refined for one criterion; the sweep varies it.
+        "GAMMA_TIME_GRID": "fixed",
+    }
+    analysis_mode = _sweep_analysis_mode(analysis_config)
+    layer_cache = layer_cache_from_config(app_config, output_dir)
+    matched_groups = match_delivery_groups_to_beams(
+        plan_data["beams"],
+        collect_ptn_delivery_groups(
+            log_dir, cache_dir=delivery_index_cache_dir(app_config, output_dir)
+        ),
+    )
+
+    for beam_number, beam_data in plan_data["beams"].items():
+        group = matched_groups.get(beam_number)
+        if group is None:
+            continue
+        beam_name = beam_data.get("name", f"Beam {beam_number}")
+        for (layer_index, layer_data), ptn_file in zip(
+            beam_data.get("layers", {}).items(), group["ptn_files"]
+        ):
+            cache_key = intermediates = None
+            if layer_cache is not None:
+                cache_key = layer_cache.key(
+                    ptn_file=ptn_file,
+                    plan_layer=layer_data,
+                    machine_config=machine_config,
+                    analysis_config=analysis_config,
+                    analysis_mode=analysis_mode,
+                    range_info=group["planrange_lookup"].get(os.path.abspath(ptn_file)),
+                )
+                intermediates = layer_cache.load(cache_key)
+            if intermediates is None:
+                try:
+                    log_data = parse_ptn_with_optional_mu_correction(
+                        ptn_file, machine_config, group["planrange_lookup"]
+                    )
+                    intermediates = _prepare_layer_intermediates(
+                        analysis_mode, layer_data, log_data, analysis_config
+                    )
+                except (KeyError, ValueError, IOError) as e:
+                    logger.error(f"Error preparing {ptn_file}: {e}")
+                    continue
+                if "error" in intermediates:
+                    logger.warning(f"Skipping layer: {intermediates['error']}")
+                    continue
+                if layer_cache is not None:
+                    layer_cache.store(cache_key, intermediates)
+            yield (
+                beam_name,
+                layer_index,
+                layer_data,
+                intermediates,
+                analysis_config,
+                analysis_mode,
+            )
+
+
+def build_summary_rows(layer_rows, analysis_mode):
+    """Aggregate per-layer sweep rows into one row per combination."""
+    key_fields = PARAMETER_FIELDS + (
+        GAMMA_PARAMETER_FIELDS if analysis_mode == "point_gamma" else []
+    )
+    grouped = {}
+    for row in layer_rows:
+        grouped.setdefault(tuple(row[field] for field in key_fields), []).append(row)
+
+    summary_rows = []
+    for key, rows in grouped.items():
+        summary = dict(zip(key_fields, key))
+        summary["layers"] = len(rows)
+        summary["max_abs_diff_x"] = max(row["max_abs_diff_x"] for row in rows)
+        summary["max_abs_diff_y"] = max(row["max_abs_diff_y"] for row in rows)
+        if analysis_mode == "point_gamma":
+            evaluated = sum(row["evaluated_point_count"] for row in rows)
+            passed = sum(
+                row["gamma_pass_rate"] * row["evaluated_point_count"] for row in rows
+            )
+            summary["gamma_pass_rate"] = passed / evaluated if evaluated else 0.0
+        else:
+            summary["layer_pass_rate"] = sum(row["layer_pass"] for row in rows) / len(rows)
+        summary_rows.append(summary)
+    return summary_rows
+
+
+def write_csv(path, fieldnames, rows):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def run_sweep(
+    log_dir,
+    dcm_file,
+    output_dir,
+    grids=None,
+    layer_filename="parameter_sweep_layers.csv",
+    summary_filename="parameter_sweep_summary.csv",
+):
+    """Run the sweep and write the per-layer and summary CSVs."""
+    os.makedirs(output_dir, exist_ok=True)
+    app_config = parse_yaml_config(os.path.join(_repo_root(), "config.yaml"))
+
+    layer_rows = []
+    analysis_mode = _sweep_analysis_mode(app_config)
+    resolved_grids = None
+    for (
+        beam_name,
+        layer_index,
+        layer_data,
+        intermediates,
+        analysis_config,
+        analysis_mode,
+    ) in _iter_layer_intermediates(log_dir, dcm_file, app_config, output_dir):
+        if resolved_grids is None:
+            resolved_grids = {**default_grids(analysis_config), **(grids or {})}
+        for row in sweep_layer(
+            layer_data, intermediates, analysis_config, resolved_grids, analysis_mode
+        ):
+            layer_rows.append({"beam_name": beam_name, "layer_index": layer_index, **row})
+
+    gamma_fields = (
+        GAMMA_PARAMETER_FIELDS + ["evaluated_point_count", "gamma_pass_rate"]
+        if analysis_mode == "point_gamma"
+        else ["layer_pass"]
+    )
+    layer_csv = os.path.join(output_dir, layer_filename)
+    summary_csv = os.path.join(output_dir, summary_filename)
+    write_csv(
+        layer_csv,
+        ["beam_name", "layer_index"] + PARAMETER_FIELDS + STATS_FIELDS + gamma_fields,
+        layer_rows,
+    )
+    summary_rows = build_summary_rows(layer_rows, analysis_mode)
+    write_csv(
+        summary_csv,
+        list(summary_rows[0]) if summary_rows else PARAMETER_FIELDS,
+        summary_rows,
+    )
+    return layer_csv, summary_csv
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(
+        description="Sweep zero-dose, settling and gamma settings over one case."
+    )
+    parser.add_argument("--log_dir", required=True, help="Directory containing PTN files")
+    parser.add_argument("--dcm_file", required=True, help="Path to the RTPLAN DICOM")
+    parser.add_argument("--output", required=True, help="Directory for the sweep CSVs")
+    for name, help_text in (
+        ("holdoff_s", "Comma-separated ZERO_DOSE_BOUNDARY_HOLDOFF_S values"),
+        ("post_boundary_s", "Comma-separated ZERO_DOSE_POST_MINIMAL_DOSE_BOUNDARY_S values"),
+        ("settling_threshold_mm", "Comma-separated SETTLING_THRESHOLD_MM values"),
+        ("gamma_distance_mm", "Comma-separated point-gamma distance criteria"),
+        ("gamma_fluence_percent", "Comma-separated point-gamma fluence criteria"),
+    ):
+        parser.add_argument(f"--{name}", help=help_text)
+    args = parser.parse_args()
+
+    grid_args = {
+        "zero_dose_boundary_holdoff_s": args.holdoff_s,
+        "zero_dose_post_minimal_dose_boundary_s": args.post_boundary_s,
+        "settling_threshold_mm": args.settling_threshold_mm,
+        "gamma_distance_mm": args.gamma_distance_mm,
+        "gamma_fluence_percent": args.gamma_fluence_percent,
+    }
+    grids = {key: parse_grid(value) for key, value in grid_args.items() if value}
+    layer_csv, summary_csv = run_sweep(args.log_dir, args.dcm_file, args.output, grids)
+    print(f"Wrote {layer_csv}")
+    print(f"Wrote {summary_csv}")
+
+
+if __name__ == "__main__":
+    main()
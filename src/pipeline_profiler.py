@@ -0,0 +1,171 @@
+"""
+Opt-in cProfile hooks for the analysis pipeline.
+
+``PipelineProfiler`` runs cProfile over a whole analysis or only over
+selected ``src.run_profile`` stages (for example ``gamma``, which covers
+``calculate_point_gamma_for_layer`` and the fluence gamma).  It writes two
+artefacts to the output directory:
+
+* ``profile.pstats``, readable with ``python -m pstats`` or snakeviz, and
+* ``profile.collapsed.txt``, one ``frame;frame;frame microseconds`` line per
+  call path, the input format of ``flamegraph.pl`` and speedscope.
+
+cProfile records caller/callee pairs rather than full stacks, so the
+collapsed paths apportion each function's own time over its callers in
+proportion to the time spent under each caller.
+"""
+
+import cProfile
+import contextlib
+from collections import defaultdict
+import logging
+import os
+import pstats
+import threading
+
+from src import run_profile
+from src.pipeline_stages import STAGE_ORDER
+
+logger = logging.getLogger(__name__)
+
+PROFILE_STATS_FILENAME = "profile.pstats"
+PROFILE_COLLAPSED_FILENAME = "profile.collapsed.txt"
+# Call paths below this many seconds are dropped from the collapsed stacks.
+MIN_COLLAPSED_PATH_S = 1e-6
+MAX_COLLAPSED_DEPTH = 200
+
+
+def parse_stage_list(value):
+    """Stage names from a comma-separated string or a list."""
+    if value is None:
+        return ()
+    if isinstance(value, str):
+        value = value.split(",")
+    return tuple(str(name).strip().lower() for name in value if str(name).strip())
+
+
+class PipelineProfiler:
+    """cProfile over a block, or over the selected stages run inside it."""
+
+    def __init__(self, stages=()):
+        self.stages = frozenset(parse_stage_list(stages))
+        unknown = sorted(self.stages - set(STAGE_ORDER))
+        if unknown:
+            raise ValueError(
+                f"Unknown profile stage(s) {', '.join(unknown)}; "
+                f"expected any of {', '.join(STAGE_ORDER)}"
+            )
+        self._profile = cProfile.Profile()
+        self._depth = 0
+        self._thread_id = None
+
+    @contextlib.contextmanager
+    def _enabled(self):
+        if self._depth == 0:
+            self._profile.enable()
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            if self._depth == 0:
+                self._profile.disable()
+
+    def _stage(self, name):
+        # cProfile follows only the enabling thread; stages of other threads
+        # (other jobs of a long-running service) are left alone.
+        if name in self.stages and threading.get_ident() == self._thread_id:
+            return self._enabled()
+        return contextlib.nullcontext()
+
+    @contextlib.contextmanager
+    def activate(self):
+        self._thread_id = threading.get_ident()
+        if not self.stages:
+            with self._enabled():
+                yield self
+            return
+        with run_profile.use_stage_hook(self._stage):
+            yield self
+
+    def write(self, output_dir):
+        """Write the ``.pstats`` file and collapsed stacks; returns both paths."""
+        os.makedirs(output_dir, exist_ok=True)
+        stats_path = os.path.join(output_dir, PROFILE_STATS_FILENAME)
+        collapsed_path = os.path.join(output_dir, PROFILE_COLLAPSED_FILENAME)
+        self._profile.dump_stats(stats_path)
+        try:
+            stats = pstats.Stats(self._profile).stats
+        except TypeError:
+            # Nothing ran while profiling was enabled.
+            stats = {}
+        write_collapsed_stacks(stats, collapsed_path)
+        logger.info("Saved cProfile output to %s and %s", stats_path, collapsed_path)
+        return stats_path, collapsed_path
+
+
+def _frame_label(func):
+    file_name, line, name = func
+    if file_name == "~":
+        label = name
+    else:
+        label = f"{name} ({os.path.basename(file_name)}:{line})"
+    return label.replace(";", ",")
+
+
+def collapsed_stacks(stats):
+    """``{call path: seconds}`` of own time from ``pstats.Stats.stats``."""
+    callees = defaultdict(dict)
+    for func, (_, _, _, _, callers) in stats.items():
+        for caller, caller_stats in callers.items():
+            callees[caller][func] = caller_stats[3]
+
+    paths = defaultdict(float)
+
+    def walk(func, stack, share):
+        # ``share`` is the fraction of ``func``'s cumulative time on this path.
+        _, _, own_s, cumulative_s, _ = stats[func]
+        path = stack + (func,)
+        paths[path] += own_s * share
+        if len(path) >= MAX_COLLAPSED_DEPTH:
+            return
+        for callee, via_s in callees.get(func, {}).items():
+            callee_cumulative_s = stats[callee][3]
+            if callee in path or callee_cumulative_s <= 0:
+                continue
+            callee_share = share * via_s / callee_cumulative_s
+            if callee_share * callee_cumulative_s >= MIN_COLLAPSED_PATH_S:
+                walk(callee, path, callee_share)
+
+    for func, (_, _, _, _, callers) in stats.items():
+        if not callers:
+            walk(func, (), 1.0)
+    return paths
+
+
+def write_collapsed_stacks(stats, path):
+    lines = []
+    for stack, seconds in collapsed_stacks(stats).items():
+        microseconds = int(round(seconds * 1e6))
+        if microseconds > 0:
+            lines.append(f"{';'.join(_frame_label(func) for func in stack)} {microseconds}")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(sorted(lines)))
+        if lines:
+            f.write("\n")
+
+
+def pipeline_profiler_from_config(app_config, enabled=None, stages=None):
+    """``PipelineProfiler`` when profiling is on, else ``None``.
+
+    ``enabled`` and ``stages`` (from the command line) override the
+    ``profiling`` section of ``config.yaml``; naming stages turns profiling on.
+    """
+    stages = parse_stage_list(
+        stages if stages is not None else app_config.get("PROFILE_STAGES", ())
+    )
+    if enabled is None:
+        enabled = app_config.get("PROFILE_ENABLED", False)
+    if not (enabled or stages):
+        return None
+    return PipelineProfiler(stages)
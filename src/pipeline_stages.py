@@ -0,0 +1,16 @@
+"""Names of the timed pipeline stages, in pipeline order.
+
+Shared by ``src.config_loader`` (to validate ``profiling.stages``),
+``src.run_profile`` and ``src.pipeline_profiler``.
+"""
+
+STAGE_ORDER = (
+    "directory_scan",
+    "dicom_parse",
+    "ptn_read",
+    "mu_correction",
+    "calculator",
+    "gamma",
+    "csv_export",
+    "pdf_render",
+)
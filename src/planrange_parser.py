@@ -21,6 +21,93 @@ class LayerRangeInfo(NamedTuple):
     plan_dose2_range_code: int
 
 
+def read_planrange_file(pr_path: str) -> list[tuple[str, LayerRangeInfo]]:
+    """
+    Parse one ``PlanRange.txt`` into ``(ptn_filename, LayerRangeInfo)`` rows.
+
+    ``ptn_filename`` is relative to the directory holding the file.  Short or
+    malformed rows are skipped with a warning; an unreadable file yields no
+    rows.
+    """
+    rows: list[tuple[str, LayerRangeInfo]] = []
+    try:
+        with open(pr_path, 'r', encoding='utf-8') as f:
+            reader = csv.reader(f)
+            header = next(reader, None)
+            if header is None:
+                logger.warning("Empty PlanRange.txt: %s", pr_path)
+                return rows
+
+            for row_num, row in enumerate(reader, start=2):
+                try:
+                    # CSV columns (0-indexed):
+                    #  0: RESULT_ID
+                    #  1: LAYER_NO
+                    #  2: LAYER_ENERGY
+                    #  3: PATIENT_ID
+                    #  4: FLD_NO
+                    #  5: DOSE1_RANGE
+                    #  6: DOSE2_RANGE
+                    #  7: PLAN_DOSE1_RANGE
+                    #  8: PLAN_DOSE2_RANGE
+                    #  9: SCAN_OUT_FL_NM
+                    # 10: PLAN_SCAN_OUT_FL_NM
+                    if len(row) < 10:
+                        logger.warning(
+                            "Skipping short row %d in %s (got %d columns)",
+                            row_num, pr_path, len(row),
+                        )
+                        continue
+
+                    rows.append((
+                        row[9].strip(),
+                        LayerRangeInfo(
+                            energy=float(row[2]),
+                            dose1_range_code=int(row[5]),
+                            dose2_range_code=int(row[6]),
+                            plan_dose1_range_code=int(row[7]),
+                            plan_dose2_range_code=int(row[8]),
+                        ),
+                    ))
+                except (ValueError, IndexError) as e:
+                    logger.warning(
+                        "Skipping malformed row %d in %s: %s",
+                        row_num, pr_path, e,
+                    )
+    except OSError as e:
+        logger.warning("Could not read %s: %s", pr_path, e)
+    return rows
+
+
+def planrange_lookup_from_rows(
+    rows_by_dir: list[tuple[str, list[tuple[str, LayerRangeInfo]]]],
+    log_dir: str,
+) -> dict[str, LayerRangeInfo]:
+    """
+    Merge parsed ``PlanRange.txt`` rows into a lookup keyed by absolute PTN path.
+
+    ``rows_by_dir`` holds one ``(directory, rows)`` pair per PlanRange.txt
+    found for *log_dir*; an empty list logs the "no PlanRange" warning.
+    """
+    if not rows_by_dir:
+        logger.warning(
+            "No PlanRange.txt found in %s or its subdirectories. "
+            "MU correction will not be applied.", log_dir
+        )
+        return {}
+
+    lookup: dict[str, LayerRangeInfo] = {}
+    for parent_dir, rows in rows_by_dir:
+        for ptn_filename, range_info in rows:
+            lookup[os.path.abspath(os.path.join(parent_dir, ptn_filename))] = range_info
+
+    logger.info(
+        "Loaded PlanRange data for %d PTN files from %d PlanRange.txt file(s)",
+        len(lookup), len(rows_by_dir),
+    )
+    return lookup
+
+
 def parse_planrange_for_directory(log_dir: str) -> dict[str, LayerRangeInfo]:
     """
     Search *log_dir* and its immediate subdirectories for ``PlanRange.txt``
@@ -47,72 +134,10 @@ def parse_planrange_for_directory(log_dir: str) -> dict[str, LayerRangeInfo]:
     except OSError as e:
         logger.warning("Could not scan directory %s: %s", log_dir, e)
 
-    if not planrange_files:
-        logger.warning(
-            "No PlanRange.txt found in %s or its subdirectories. "
-            "MU correction will not be applied.", log_dir
-        )
-        return {}
-
-    lookup: dict[str, LayerRangeInfo] = {}
-
-    for parent_dir, pr_path in planrange_files:
-        try:
-            with open(pr_path, 'r', encoding='utf-8') as f:
-                reader = csv.reader(f)
-                header = next(reader, None)
-                if header is None:
-                    logger.warning("Empty PlanRange.txt: %s", pr_path)
-                    continue
-
-                for row_num, row in enumerate(reader, start=2):
-                    try:
-                        # CSV columns (0-indexed):
-                        #  0: RESULT_ID
-                        #  1: LAYER_NO
-                        #  2: LAYER_ENERGY
-                        #  3: PATIENT_ID
-                        #  4: FLD_NO
-                        #  5: DOSE1_RANGE
-                        #  6: DOSE2_RANGE
-                        #  7: PLAN_DOSE1_RANGE
-                        #  8: PLAN_DOSE2_RANGE
-                        #  9: SCAN_OUT_FL_NM
-                        # 10: PLAN_SCAN_OUT_FL_NM
-                        if len(row) < 10:
-                            logger.warning(
-                                "Skipping short row %d in %s (got %d columns)",
-                                row_num, pr_path, len(row),
-                            )
-                            continue
-
-                        energy = float(row[2])
-                        dose1_range_code = int(row[5])
-                        dose2_range_code = int(row[6])
-                        plan_dose1_range_code = int(row[7])
-                        plan_dose2_range_code = int(row[8])
-                        ptn_filename = row[9].strip()
-
-                        abs_ptn_path = os.path.abspath(
-                            os.path.join(parent_dir, ptn_filename)
-                        )
-                        lookup[abs_ptn_path] = LayerRangeInfo(
-                            energy=energy,
-                            dose1_range_code=dose1_range_code,
-                            dose2_range_code=dose2_range_code,
-                            plan_dose1_range_code=plan_dose1_range_code,
-                            plan_dose2_range_code=plan_dose2_range_code,
-                        )
-                    except (ValueError, IndexError) as e:
-                        logger.warning(
-                            "Skipping malformed row %d in %s: %s",
-                            row_num, pr_path, e,
-                        )
-        except OSError as e:
-            logger.warning("Could not read %s: %s", pr_path, e)
-
-    logger.info(
-        "Loaded PlanRange data for %d PTN files from %d PlanRange.txt file(s)",
-        len(lookup), len(planrange_files),
+    return planrange_lookup_from_rows(
+        [
+            (parent_dir, read_planrange_file(pr_path))
+            for parent_dir, pr_path in planrange_files
+        ],
+        log_dir,
     )
-    return lookup
@@ -2,6 +2,9 @@ import matplotlib.pyplot as plt
 import numpy as np
 
 A4_FIGSIZE = (8.27, 11.69)
+# Sparse gamma maps are binned to at most this many cells per axis for the
+# page; a map panel is a few hundred pixels wide.
+GAMMA_MAP_MAX_RENDER_SIDE = 1024
 
 
 def _gamma_percent(value):
@@ -12,6 +15,8 @@ def _gamma_percent(value):
 def _safe_grid(grid):
     if grid is None:
         return None
+    if hasattr(grid, "coarsened"):
+        grid = grid.coarsened(GAMMA_MAP_MAX_RENDER_SIDE)
     array = np.asarray(grid, dtype=float)
     if array.ndim != 2 or array.size == 0:
         return None
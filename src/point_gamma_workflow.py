@@ -1,20 +1,39 @@
 import logging
+from typing import NamedTuple
 
 import numpy as np
 
 from src.calculator import (
+    DEFAULT_SETTLING_SEARCH_WINDOW_S,
+    prepare_difference_intermediates,
     _assign_samples_to_spots,
     _boundary_carryover_mask,
     _detect_settling,
     _normalized_spot_series,
-    _write_debug_csv,
+    _emit_debug_output,
 )
+from src.streaming_stats import AxisStatsAccumulator
+from src.time_alignment import align_log_time
 
 logger = logging.getLogger(__name__)
 
 
 FIXED_SAMPLE_INTERVAL_S = 60e-6
 DIRECT_GAMMA_MAP_RESOLUTION_MM = 0.5
+# Cropped maps above this many cells are returned as ``SparseGammaMap``.
+DIRECT_GAMMA_MAP_SPARSE_CELL_LIMIT = 4_000_000
+DEFAULT_GAMMA_SEARCH_RADIUS_FACTOR = 2.0
+# Evaluated log points per sparse_distance_matrix call in spatial search.
+SPATIAL_GAMMA_CHUNK_SIZE = 8192
+# Adaptive time grid: coarse step in fixed-grid samples, and the coarse
+# time-locked gamma above which an interval is resampled at the fixed step.
+DEFAULT_ADAPTIVE_COARSE_FACTOR = 16
+ADAPTIVE_REFINE_GAMMA = 0.5
+# Logs whose sample times stay within this fraction of the fixed step of the
+# fixed grid are read on their own samples instead of being re-interpolated.
+NATIVE_LOG_GRID_TOLERANCE = 0.01
+# Point-gamma keys inside the flat ``analysis_mode: both`` intermediates.
+COMBINED_POINT_GAMMA_PREFIX = "point_gamma."
 
 
 def _normalize_log_counts(log_data, config):
@@ -25,16 +44,22 @@ def _normalize_log_counts(log_data, config):
     return counts
 
 
-def _build_fixed_time_axis(plan_layer, log_data, dt_s=FIXED_SAMPLE_INTERVAL_S):
-    plan_time_s = np.asarray(plan_layer.get("time_axis_s", []), dtype=float)
+def _rebased_log_time_s(log_data):
     log_time_ms = np.asarray(log_data.get("time_ms", []), dtype=float)
-
-    if plan_time_s.size == 0 and log_time_ms.size == 0:
+    if log_time_ms.size == 0:
         return np.zeros(0, dtype=float)
+    return (log_time_ms - float(log_time_ms[0])) / 1000.0
+
 
-    log_time_s = np.zeros_like(log_time_ms, dtype=float)
-    if log_time_ms.size > 0:
-        log_time_s = (log_time_ms - float(log_time_ms[0])) / 1000.0
+def _build_fixed_time_axis(
+    plan_layer, log_data, dt_s=FIXED_SAMPLE_INTERVAL_S, *, log_time_s=None
+):
+    plan_time_s = np.asarray(plan_layer.get("time_axis_s", []), dtype=float)
+    if log_time_s is None:
+        log_time_s = _rebased_log_time_s(log_data)
+
+    if plan_time_s.size == 0 and log_time_s.size == 0:
+        return np.zeros(0, dtype=float)
 
     t_end = 0.0
     if plan_time_s.size > 0:
@@ -45,32 +70,88 @@ def _build_fixed_time_axis(plan_layer, log_data, dt_s=FIXED_SAMPLE_INTERVAL_S):
     return np.arange(0.0, t_end + dt_s * 0.5, dt_s, dtype=float)
 
 
-def _per_sample_counts_from_cumulative(cumulative_values):
+def _per_sample_counts_from_cumulative(cumulative_values, sample_weight=None):
+    """Counts per fixed-grid sample from a cumulative series.
+
+    On an adaptive grid each sample stands for ``sample_weight`` fixed-grid
+    samples, so its increment is spread back to a per-sample rate.
+    """
     cumulative = np.asarray(cumulative_values, dtype=float)
     if cumulative.size == 0:
         return np.zeros(0, dtype=float)
 
     per_sample = np.diff(cumulative, prepend=cumulative[0])
     per_sample[0] = max(float(cumulative[0]), 0.0)
+    if sample_weight is not None:
+        per_sample /= np.asarray(sample_weight, dtype=float)
     return per_sample
 
 
-def _build_time_aligned_series(
-    plan_layer, log_data, config, *, dt_s=FIXED_SAMPLE_INTERVAL_S
+def _aligned_log_time_s(plan_layer, log_data, config, trajectory=None):
+    if trajectory is not None:
+        # ``prepare_difference_intermediates`` already aligned the same log.
+        return trajectory["log_time_s"], trajectory["time_alignment"]
+    return align_log_time(
+        plan_layer,
+        _rebased_log_time_s(log_data),
+        log_data.get("x_mm", log_data.get("x", [])),
+        log_data.get("y_mm", log_data.get("y", [])),
+        log_data.get("mu"),
+        config,
+    )
+
+
+def _native_log_index(log_time_s, grid_index, dt_s=FIXED_SAMPLE_INTERVAL_S):
+    """Map fixed-grid samples straight onto log samples when the clocks agree.
+
+    PTN samples every ``TIMEGAIN`` (0.06 ms), which is the fixed grid step, so
+    after rebasing the log usually already sits on the grid.  Returns the log
+    sample index for every entry of ``grid_index`` (a slice when that is the
+    whole log), or ``None`` when the log must be interpolated.  Grid samples
+    past the end of the log hold the last log sample, as ``np.interp`` would.
+    """
+    log_time_s = np.asarray(log_time_s, dtype=float)
+    if log_time_s.size < 2:
+        return None
+    deviation = np.abs(log_time_s - np.arange(log_time_s.size) * dt_s)
+    if np.max(deviation) > NATIVE_LOG_GRID_TOLERANCE * dt_s:
+        return None
+    if isinstance(grid_index, slice):
+        grid_size = grid_index.stop
+        if grid_size == log_time_s.size:
+            return slice(None)
+        grid_index = np.arange(grid_size)
+    return np.minimum(grid_index, log_time_s.size - 1)
+
+
+def _empty_aligned_series(time_s, time_alignment):
+    return {
+        "time_s": time_s,
+        "plan_x": np.zeros(0, dtype=float),
+        "plan_y": np.zeros(0, dtype=float),
+        "plan_cumulative_mu": np.zeros(0, dtype=float),
+        "plan_count": np.zeros(0, dtype=float),
+        "log_x": np.zeros(0, dtype=float),
+        "log_y": np.zeros(0, dtype=float),
+        "log_count": np.zeros(0, dtype=float),
+        "time_alignment": time_alignment,
+    }
+
+
+def _interpolate_aligned_series(
+    plan_layer,
+    log_data,
+    config,
+    time_s,
+    log_time_s,
+    sample_weight=None,
+    log_index=None,
 ):
-    time_s = _build_fixed_time_axis(plan_layer, log_data, dt_s=dt_s)
-    if time_s.size == 0:
-        return {
-            "time_s": time_s,
-            "plan_x": np.zeros(0, dtype=float),
-            "plan_y": np.zeros(0, dtype=float),
-            "plan_cumulative_mu": np.zeros(0, dtype=float),
-            "plan_count": np.zeros(0, dtype=float),
-            "log_x": np.zeros(0, dtype=float),
-            "log_y": np.zeros(0, dtype=float),
-            "log_count": np.zeros(0, dtype=float),
-        }
+    """Plan and log series on ``time_s``.
 
+    The plan is always interpolated.  The log is interpolated too unless
+    ``log_index`` (from ``_native_log_index``) maps the samples onto it.
+    """
     plan_time_s = np.asarray(plan_layer.get("time_axis_s", []), dtype=float)
     plan_x = np.asarray(plan_layer.get("trajectory_x_mm", []), dtype=float)
     plan_y = np.asarray(plan_layer.get("trajectory_y_mm", []), dtype=float)
@@ -88,7 +169,9 @@ def _build_time_aligned_series(
     interp_plan_x = np.interp(time_s, plan_time_s, plan_x)
     interp_plan_y = np.interp(time_s, plan_time_s, plan_y)
     interp_plan_cumulative_mu = np.interp(time_s, plan_time_s, plan_cumulative_mu)
-    plan_count = _per_sample_counts_from_cumulative(interp_plan_cumulative_mu)
+    plan_count = _per_sample_counts_from_cumulative(
+        interp_plan_cumulative_mu, sample_weight
+    )
 
     log_time_ms = np.asarray(log_data.get("time_ms", []), dtype=float)
     log_x = np.asarray(log_data.get("x_mm", log_data.get("x", [])), dtype=float)
@@ -104,10 +187,12 @@ def _build_time_aligned_series(
             "log_data must provide matching time_ms, x/y, and dose1_au arrays"
         )
 
-    log_time_s = (log_time_ms - float(log_time_ms[0])) / 1000.0
-    interp_log_x = np.interp(time_s, log_time_s, log_x)
-    interp_log_y = np.interp(time_s, log_time_s, log_y)
-    interp_log_count = np.interp(time_s, log_time_s, log_count)
+    if log_index is None:
+        log_x = np.interp(time_s, log_time_s, log_x)
+        log_y = np.interp(time_s, log_time_s, log_y)
+        log_count = np.interp(time_s, log_time_s, log_count)
+    else:
+        log_x, log_y, log_count = log_x[log_index], log_y[log_index], log_count[log_index]
 
     return {
         "time_s": time_s,
@@ -115,15 +200,237 @@ def _build_time_aligned_series(
         "plan_y": interp_plan_y,
         "plan_cumulative_mu": interp_plan_cumulative_mu,
         "plan_count": plan_count,
-        "log_x": interp_log_x,
-        "log_y": interp_log_y,
-        "log_count": interp_log_count,
+        "log_x": log_x,
+        "log_y": log_y,
+        "log_count": log_count,
     }
 
 
+def _aligned_series_from_trajectory(plan_layer, log_data, config, time_s, trajectory):
+    """Reuse the trajectory pass's series when both sit on the same samples.
+
+    Returns ``None`` when the inputs do not line up, so the caller falls
+    back to ``_interpolate_aligned_series``.
+    """
+    log_count = _normalize_log_counts(log_data, config)
+    if "cumulative_mu" not in plan_layer or log_count.size != time_s.size:
+        return None
+    plan_cumulative_mu = np.asarray(trajectory["interp_plan_mu"], dtype=float)
+    return {
+        "time_s": time_s,
+        "plan_x": trajectory["interp_plan_x"],
+        "plan_y": trajectory["interp_plan_y"],
+        "plan_cumulative_mu": plan_cumulative_mu,
+        "plan_count": _per_sample_counts_from_cumulative(plan_cumulative_mu),
+        "log_x": trajectory["log_x"],
+        "log_y": trajectory["log_y"],
+        "log_count": log_count,
+    }
+
+
+def _build_time_aligned_series(
+    plan_layer, log_data, config, *, dt_s=FIXED_SAMPLE_INTERVAL_S, trajectory=None
+):
+    log_time_s, time_alignment = _aligned_log_time_s(
+        plan_layer, log_data, config, trajectory
+    )
+    time_s = _build_fixed_time_axis(
+        plan_layer, log_data, dt_s=dt_s, log_time_s=log_time_s
+    )
+    if time_s.size == 0:
+        return _empty_aligned_series(time_s, time_alignment)
+
+    log_index = _native_log_index(log_time_s, slice(0, time_s.size), dt_s)
+    aligned = None
+    if trajectory is not None and isinstance(log_index, slice):
+        aligned = _aligned_series_from_trajectory(
+            plan_layer, log_data, config, time_s, trajectory
+        )
+    if aligned is None:
+        aligned = _interpolate_aligned_series(
+            plan_layer, log_data, config, time_s, log_time_s, log_index=log_index
+        )
+    aligned["time_alignment"] = time_alignment
+    return aligned
+
+
+def _strictest_gamma_thresholds(config):
+    """Smallest distance and global/local fluence percent over all criteria.
+
+    The local percent is ``None`` when no criterion is locally normalised.
+    """
+    distances = [float(config["GAMMA_DISTANCE_MM_THRESHOLD"])]
+    global_percents = [float(config["GAMMA_FLUENCE_PERCENT_THRESHOLD"])]
+    local_percents = []
+    for criterion in config.get("GAMMA_CRITERIA") or []:
+        distances.append(float(criterion["distance_mm_threshold"]))
+        percent = float(criterion["fluence_percent_threshold"])
+        if criterion.get("normalization", "global") == "local":
+            local_percents.append(percent)
+        else:
+            global_percents.append(percent)
+    return (
+        min(distances),
+        min(global_percents),
+        min(local_percents) if local_percents else None,
+    )
+
+
+def _adaptive_refine_intervals(plan_layer, coarse, config):
+    """Flag the coarse intervals that must be resampled on the fixed grid.
+
+    An interval is refined when it crosses a spot boundary or the fluence
+    cutoff, or when either end is eligible and near failing (time-locked
+    gamma against the strictest criterion) or inside the settling window.
+    Everything else is a trivially passing dwell or a below-cutoff transit.
+    """
+    plan_count = coarse["plan_count"]
+    peak_plan_count = float(np.max(plan_count)) if plan_count.size else 0.0
+    distance_mm, global_percent, local_percent = _strictest_gamma_thresholds(config)
+    dose_threshold = np.full(
+        plan_count.shape, max(peak_plan_count * global_percent / 100.0, 1e-12)
+    )
+    if local_percent is not None:
+        dose_threshold = np.minimum(
+            dose_threshold, np.maximum(plan_count * local_percent / 100.0, 1e-12)
+        )
+    position_error_mm = np.hypot(
+        coarse["log_x"] - coarse["plan_x"], coarse["log_y"] - coarse["plan_y"]
+    )
+    gamma = np.sqrt(
+        (position_error_mm / distance_mm) ** 2
+        + ((coarse["log_count"] - plan_count) / dose_threshold) ** 2
+    )
+    cutoff = (
+        peak_plan_count * float(config["GAMMA_LOWER_PERCENT_FLUENCE_CUTOFF"]) / 100.0
+    )
+    eligible = plan_count >= cutoff
+    # Settling is detected sample by sample inside a short window at the start.
+    near_failing = (eligible & (gamma > ADAPTIVE_REFINE_GAMMA)) | (
+        coarse["time_s"] <= DEFAULT_SETTLING_SEARCH_WINDOW_S
+    )
+
+    plan_time_s = np.asarray(plan_layer.get("time_axis_s", []), dtype=float)
+    spot_index = _assign_samples_to_spots(coarse["time_s"], plan_time_s)
+    return (
+        (np.diff(spot_index) != 0)
+        | (eligible[1:] != eligible[:-1])
+        | near_failing[1:]
+        | near_failing[:-1]
+    )
+
+
+def _build_adaptive_time_aligned_series(
+    plan_layer, log_data, config, *, dt_s=FIXED_SAMPLE_INTERVAL_S, trajectory=None
+):
+    """Coarse-to-fine variant of ``_build_time_aligned_series``.
+
+    The fixed grid is first sampled every ``GAMMA_ADAPTIVE_COARSE_FACTOR``
+    steps; intervals flagged by ``_adaptive_refine_intervals`` are filled in
+    with every fixed-grid sample.  ``sample_weight`` records how many
+    fixed-grid samples each kept sample stands for, so weighted metrics
+    match the fixed grid within the refinement tolerance.
+    """
+    log_time_s, time_alignment = _aligned_log_time_s(
+        plan_layer, log_data, config, trajectory
+    )
+    fine_time_s = _build_fixed_time_axis(
+        plan_layer, log_data, dt_s=dt_s, log_time_s=log_time_s
+    )
+    if fine_time_s.size == 0:
+        return _empty_aligned_series(fine_time_s, time_alignment)
+
+    factor = max(
+        int(config.get("GAMMA_ADAPTIVE_COARSE_FACTOR", DEFAULT_ADAPTIVE_COARSE_FACTOR)),
+        1,
+    )
+    coarse_index = np.arange(0, fine_time_s.size, factor)
+    if coarse_index[-1] != fine_time_s.size - 1:
+        coarse_index = np.append(coarse_index, fine_time_s.size - 1)
+    coarse_weight = np.diff(coarse_index, prepend=-1)
+    coarse = _interpolate_aligned_series(
+        plan_layer,
+        log_data,
+        config,
+        fine_time_s[coarse_index],
+        log_time_s,
+        coarse_weight,
+        _native_log_index(log_time_s, coarse_index, dt_s),
+    )
+
+    refine = _adaptive_refine_intervals(plan_layer, coarse, config)
+    fine_mask = np.zeros(fine_time_s.size, dtype=bool)
+    fine_mask[coarse_index] = True
+    starts = coarse_index[:-1][refine] + 1
+    stops = coarse_index[1:][refine]
+    if starts.size:
+        # Mark each refined (start, stop) range with a +1/-1 difference array.
+        edges = np.zeros(fine_time_s.size + 1, dtype=np.int64)
+        np.add.at(edges, starts, 1)
+        np.add.at(edges, stops, -1)
+        fine_mask |= np.cumsum(edges[:-1]) > 0
+
+    kept_index = np.flatnonzero(fine_mask)
+    sample_weight = np.diff(kept_index, prepend=-1).astype(float)
+    aligned = _interpolate_aligned_series(
+        plan_layer,
+        log_data,
+        config,
+        fine_time_s[kept_index],
+        log_time_s,
+        sample_weight,
+        _native_log_index(log_time_s, kept_index, dt_s),
+    )
+    aligned["sample_weight"] = sample_weight
+    aligned["time_alignment"] = time_alignment
+    return aligned
+
+
+class SparseGammaMap(NamedTuple):
+    """Occupied cells of a point gamma map too large to keep dense."""
+
+    shape: tuple
+    row_index: np.ndarray
+    col_index: np.ndarray
+    values: np.ndarray
+
+    def to_dense(self):
+        gamma_map = np.full(self.shape, np.nan, dtype=float)
+        gamma_map[self.row_index, self.col_index] = self.values
+        return gamma_map
+
+    def coarsened(self, max_side):
+        """Dense map of at most ``max_side`` cells per axis.
+
+        Each coarse cell holds the mean of the occupied cells it covers, so
+        the full-size grid is never allocated.
+        """
+        factor = max(1, -(-max(self.shape) // int(max_side)))
+        shape = (-(-self.shape[0] // factor), -(-self.shape[1] // factor))
+        flat_idx = (self.row_index // factor) * shape[1] + self.col_index // factor
+        accum = np.bincount(flat_idx, weights=self.values, minlength=shape[0] * shape[1])
+        counts = np.bincount(flat_idx, minlength=shape[0] * shape[1])
+        gamma_map = np.full(shape[0] * shape[1], np.nan, dtype=float)
+        nonzero = counts > 0
+        gamma_map[nonzero] = accum[nonzero] / counts[nonzero]
+        return gamma_map.reshape(shape)
+
+
 def _build_direct_gamma_map(
-    x_mm, y_mm, gamma_values, *, resolution_mm=DIRECT_GAMMA_MAP_RESOLUTION_MM
+    x_mm,
+    y_mm,
+    gamma_values,
+    *,
+    weights=None,
+    resolution_mm=DIRECT_GAMMA_MAP_RESOLUTION_MM,
+    sparse_cell_limit=DIRECT_GAMMA_MAP_SPARSE_CELL_LIMIT,
 ):
+    """Mean gamma per grid cell over the samples' bounding box.
+
+    Returns a dense array, or a ``SparseGammaMap`` when the cropped grid has
+    more than ``sparse_cell_limit`` cells.  ``weights`` (adaptive time grid)
+    turns the cell mean into a weighted mean.
+    """
     x_mm = np.asarray(x_mm, dtype=float)
     y_mm = np.asarray(y_mm, dtype=float)
     gamma_values = np.asarray(gamma_values, dtype=float)
@@ -139,8 +446,7 @@ def _build_direct_gamma_map(
     if y_coords.size < 2:
         y_coords = np.array([min_y, min_y + resolution_mm], dtype=float)
 
-    accum = np.zeros((y_coords.size, x_coords.size), dtype=float)
-    counts = np.zeros_like(accum)
+    shape = (y_coords.size, x_coords.size)
     x_idx = np.clip(
         np.round((x_mm - x_coords[0]) / resolution_mm).astype(int), 0, x_coords.size - 1
     )
@@ -148,16 +454,28 @@ def _build_direct_gamma_map(
         np.round((y_mm - y_coords[0]) / resolution_mm).astype(int), 0, y_coords.size - 1
     )
     valid = np.isfinite(gamma_values)
-    for xi, yi, gamma in zip(
-        x_idx[valid], y_idx[valid], gamma_values[valid], strict=False
-    ):
-        accum[yi, xi] += gamma
-        counts[yi, xi] += 1.0
+    flat_idx = y_idx[valid] * shape[1] + x_idx[valid]
+    valid_gamma = gamma_values[valid]
+    valid_weights = None
+    if weights is not None:
+        valid_weights = np.asarray(weights, dtype=float)[valid]
+        valid_gamma = valid_gamma * valid_weights
 
-    gamma_map = np.full_like(accum, np.nan)
+    if shape[0] * shape[1] > sparse_cell_limit:
+        cells, inverse = np.unique(flat_idx, return_inverse=True)
+        accum = np.bincount(inverse, weights=valid_gamma, minlength=cells.size)
+        counts = np.bincount(inverse, weights=valid_weights, minlength=cells.size)
+        rows, cols = np.divmod(cells, shape[1])
+        return SparseGammaMap(shape, rows, cols, accum / counts)
+
+    accum = np.bincount(flat_idx, weights=valid_gamma, minlength=shape[0] * shape[1])
+    counts = np.bincount(
+        flat_idx, weights=valid_weights, minlength=shape[0] * shape[1]
+    )
+    gamma_map = np.full(shape[0] * shape[1], np.nan, dtype=float)
     nonzero = counts > 0
     gamma_map[nonzero] = accum[nonzero] / counts[nonzero]
-    return gamma_map
+    return gamma_map.reshape(shape)
 
 
 def _build_analysis_sample_masks(plan_layer, aligned, config):
@@ -233,6 +551,166 @@ def _build_analysis_sample_masks(plan_layer, aligned, config):
     }
 
 
+def _spatial_gamma_values(
+    log_x,
+    log_y,
+    log_count,
+    plan_x,
+    plan_y,
+    plan_count,
+    *,
+    distance_threshold,
+    dose_threshold,
+    search_radius_mm,
+    time_locked_gamma,
+):
+    """Minimum gamma of each log point over plan points within the radius.
+
+    Plan samples repeat heavily while a spot dwells, so identical
+    ``(x, y, count)`` plan points are collapsed before building the
+    ``cKDTree``.  The time-locked gamma stays a candidate, so every point has
+    a value and spatial gamma never exceeds the time-locked one.
+    ``dose_threshold`` is a scalar (global) or one value per log point (local).
+    """
+    from scipy.spatial import cKDTree
+
+    dose_threshold = np.broadcast_to(
+        np.asarray(dose_threshold, dtype=float), np.shape(log_count)
+    )
+    plan_points = np.unique(
+        np.column_stack((plan_x, plan_y, plan_count)), axis=0
+    )
+    plan_tree = cKDTree(plan_points[:, :2])
+    plan_unique_count = plan_points[:, 2]
+    log_xy = np.column_stack((log_x, log_y))
+
+    gamma_values = np.array(time_locked_gamma, dtype=float, copy=True)
+    for start in range(0, log_xy.shape[0], SPATIAL_GAMMA_CHUNK_SIZE):
+        stop = min(start + SPATIAL_GAMMA_CHUNK_SIZE, log_xy.shape[0])
+        pairs = cKDTree(log_xy[start:stop]).sparse_distance_matrix(
+            plan_tree, search_radius_mm, output_type="ndarray"
+        )
+        if pairs.size == 0:
+            continue
+        log_index = pairs["i"] + start
+        candidate = np.sqrt(
+            (pairs["v"] / distance_threshold) ** 2
+            + (
+                (log_count[log_index] - plan_unique_count[pairs["j"]])
+                / dose_threshold[log_index]
+            )
+            ** 2
+        )
+        np.minimum.at(gamma_values, log_index, candidate)
+    return gamma_values
+
+
+def gamma_criterion_label(criterion):
+    """Short display label such as ``2%/2mm global``."""
+    return (
+        f"{float(criterion['fluence_percent_threshold']):g}%/"
+        f"{float(criterion['distance_mm_threshold']):g}mm "
+        f"{criterion.get('normalization', 'global')}"
+    )
+
+
+def _criteria_gamma_values(
+    criteria,
+    position_error_mm,
+    count_error,
+    plan_count,
+    peak_plan_count,
+):
+    """Time-locked gamma of every criterion at once, shape ``(criteria, points)``.
+
+    Global criteria normalise the count difference to the peak plan count,
+    local ones to the plan count of each evaluated sample.  Also returns the
+    per-point dose thresholds with the same shape.
+    """
+    distance = np.array(
+        [float(c["distance_mm_threshold"]) for c in criteria], dtype=float
+    )[:, None]
+    fraction = np.array(
+        [float(c["fluence_percent_threshold"]) / 100.0 for c in criteria],
+        dtype=float,
+    )[:, None]
+    local = np.array(
+        [c.get("normalization", "global") == "local" for c in criteria], dtype=bool
+    )[:, None]
+    reference_count = np.where(local, plan_count[None, :], peak_plan_count)
+    dose_threshold = np.maximum(fraction * reference_count, 1e-12)
+    gamma_values = np.sqrt(
+        (position_error_mm[None, :] / distance) ** 2
+        + (count_error[None, :] / dose_threshold) ** 2
+    )
+    return gamma_values, dose_threshold
+
+
+def _evaluated_point_count(sample_count, weights):
+    """Number of fixed-grid samples the evaluated samples stand for."""
+    if weights is None:
+        return int(sample_count)
+    return int(round(float(np.sum(weights))))
+
+
+def _calculate_criteria_results(
+    criteria,
+    search_mode,
+    search_radius_factor,
+    log_x,
+    log_y,
+    log_count,
+    plan_x,
+    plan_y,
+    plan_count,
+    evaluated,
+    position_error_mm,
+    count_error,
+    peak_plan_count,
+    weights=None,
+):
+    gamma_values, dose_threshold = _criteria_gamma_values(
+        criteria,
+        position_error_mm[evaluated],
+        count_error[evaluated],
+        plan_count[evaluated],
+        peak_plan_count,
+    )
+    if search_mode == "spatial":
+        for row, criterion in enumerate(criteria):
+            distance_threshold = float(criterion["distance_mm_threshold"])
+            gamma_values[row] = _spatial_gamma_values(
+                log_x[evaluated],
+                log_y[evaluated],
+                log_count[evaluated],
+                plan_x,
+                plan_y,
+                plan_count,
+                distance_threshold=distance_threshold,
+                dose_threshold=dose_threshold[row],
+                search_radius_mm=distance_threshold * search_radius_factor,
+                time_locked_gamma=gamma_values[row],
+            )
+
+    pass_rates = np.average(gamma_values <= 1.0, axis=1, weights=weights)
+    gamma_means = np.average(gamma_values, axis=1, weights=weights)
+    gamma_maxes = np.max(gamma_values, axis=1)
+    evaluated_point_count = _evaluated_point_count(gamma_values.shape[1], weights)
+    return [
+        {
+            "label": gamma_criterion_label(criterion),
+            "fluence_percent_threshold": float(criterion["fluence_percent_threshold"]),
+            "distance_mm_threshold": float(criterion["distance_mm_threshold"]),
+            "normalization": criterion.get("normalization", "global"),
+            "pass_rate": float(pass_rates[row]),
+            "gamma_mean": float(gamma_means[row]),
+            "gamma_max": float(gamma_maxes[row]),
+            "evaluated_point_count": evaluated_point_count,
+        }
+        for row, criterion in enumerate(criteria)
+    ]
+
+
 def _calculate_direct_gamma_results(aligned, config, analysis_mask=None):
     plan_count = np.asarray(aligned["plan_count"], dtype=float)
     log_count = np.asarray(aligned["log_count"], dtype=float)
@@ -264,6 +742,9 @@ def _calculate_direct_gamma_results(aligned, config, analysis_mask=None):
     else:
         analysis_mask = np.asarray(analysis_mask, dtype=bool)
     evaluated = analysis_mask & (plan_count >= cutoff)
+    weights = aligned.get("sample_weight")
+    if weights is not None:
+        weights = np.asarray(weights, dtype=float)[evaluated]
 
     if not np.any(evaluated):
         return {
@@ -287,35 +768,138 @@ def _calculate_direct_gamma_results(aligned, config, analysis_mask=None):
         (position_error_mm[evaluated] / distance_threshold) ** 2
         + (count_error[evaluated] / dose_threshold) ** 2
     )
+    search_mode = str(config.get("GAMMA_SEARCH_MODE", "time_locked")).lower()
+    search_radius_factor = float(
+        config.get("GAMMA_SEARCH_RADIUS_FACTOR", DEFAULT_GAMMA_SEARCH_RADIUS_FACTOR)
+    )
+    if search_mode == "spatial":
+        gamma_values = _spatial_gamma_values(
+            log_x[evaluated],
+            log_y[evaluated],
+            log_count[evaluated],
+            plan_x,
+            plan_y,
+            plan_count,
+            distance_threshold=distance_threshold,
+            dose_threshold=dose_threshold,
+            search_radius_mm=distance_threshold * search_radius_factor,
+            time_locked_gamma=gamma_values,
+        )
+    criteria = list(config.get("GAMMA_CRITERIA") or [])
+    criteria_results = []
+    if criteria:
+        criteria_results = _calculate_criteria_results(
+            criteria,
+            search_mode,
+            search_radius_factor,
+            log_x,
+            log_y,
+            log_count,
+            plan_x,
+            plan_y,
+            plan_count,
+            evaluated,
+            position_error_mm,
+            count_error,
+            peak_plan_count,
+            weights=weights,
+        )
 
     gamma_map = _build_direct_gamma_map(
         log_x[evaluated],
         log_y[evaluated],
         gamma_values,
+        weights=weights,
     )
     return {
-        "pass_rate": float(np.mean(gamma_values <= 1.0)),
-        "gamma_mean": float(np.mean(gamma_values)),
+        "pass_rate": float(np.average(gamma_values <= 1.0, weights=weights)),
+        "gamma_mean": float(np.average(gamma_values, weights=weights)),
         "gamma_max": float(np.max(gamma_values)),
-        "evaluated_point_count": int(gamma_values.size),
+        "evaluated_point_count": _evaluated_point_count(gamma_values.size, weights),
         "gamma_values": gamma_values,
         "gamma_map": gamma_map,
-        "position_error_mean_mm": float(np.mean(position_error_mm[evaluated])),
-        "count_error_mean": float(np.mean(np.abs(count_error[evaluated]))),
+        "position_error_mean_mm": float(
+            np.average(position_error_mm[evaluated], weights=weights)
+        ),
+        "count_error_mean": float(
+            np.average(np.abs(count_error[evaluated]), weights=weights)
+        ),
+        "gamma_search_mode": search_mode,
+        "gamma_criteria": criteria_results,
     }
 
 
-def calculate_point_gamma_for_layer(
-    plan_layer, log_data, config, save_to_csv=False, csv_filename=""
-):
+def prepare_point_gamma_intermediates(plan_layer, log_data, config, trajectory=None):
+    """Return the threshold-independent time-aligned series for a layer.
+
+    ``trajectory`` (output of ``prepare_difference_intermediates`` for the
+    same layer) skips the second time alignment and, on the native grid,
+    the second plan interpolation.
+    """
     if "time_axis_s" not in plan_layer or "trajectory_x_mm" not in plan_layer:
         return {
             "error": "No planned treatment trajectory available for point gamma analysis"
         }
     if "time_ms" not in log_data:
         return {"error": "Point gamma analysis requires time-aligned log samples"}
+    if config.get("GAMMA_TIME_GRID", "fixed") == "adaptive":
+        return _build_adaptive_time_aligned_series(
+            plan_layer, log_data, config, trajectory=trajectory
+        )
+    return _build_time_aligned_series(
+        plan_layer, log_data, config, trajectory=trajectory
+    )
+
+
+def prepare_combined_intermediates(plan_layer, log_data, config):
+    """Trajectory and point-gamma intermediates for ``analysis_mode: both``.
+
+    Both series come from one parse and one time alignment.  The result is
+    a flat dict (so it fits the layer cache): the trajectory keys as-is, the
+    point-gamma keys behind ``COMBINED_POINT_GAMMA_PREFIX``.
+    """
+    trajectory = prepare_difference_intermediates(plan_layer, log_data, config)
+    if "error" in trajectory:
+        return trajectory
+    point_gamma = prepare_point_gamma_intermediates(
+        plan_layer, log_data, config, trajectory=trajectory
+    )
+    if "error" in point_gamma:
+        return point_gamma
+
+    combined = dict(trajectory)
+    for key, value in point_gamma.items():
+        if key != "time_alignment":
+            combined[COMBINED_POINT_GAMMA_PREFIX + key] = value
+    return combined
+
+
+def split_combined_intermediates(combined):
+    """Inverse of ``prepare_combined_intermediates``: ``(trajectory, point_gamma)``."""
+    trajectory = {}
+    point_gamma = {"time_alignment": combined.get("time_alignment", {})}
+    for key, value in combined.items():
+        if key.startswith(COMBINED_POINT_GAMMA_PREFIX):
+            point_gamma[key[len(COMBINED_POINT_GAMMA_PREFIX):]] = value
+        else:
+            trajectory[key] = value
+    return trajectory, point_gamma
+
 
-    aligned = _build_time_aligned_series(plan_layer, log_data, config)
+def calculate_point_gamma_for_layer(
+    plan_layer,
+    log_data,
+    config,
+    save_to_csv=False,
+    csv_filename="",
+    debug_sink=None,
+    intermediates=None,
+):
+    aligned = intermediates
+    if aligned is None:
+        aligned = prepare_point_gamma_intermediates(plan_layer, log_data, config)
+    if "error" in aligned:
+        return {"error": aligned["error"]}
     analysis_masks = _build_analysis_sample_masks(plan_layer, aligned, config)
     results = _calculate_direct_gamma_results(
         aligned,
@@ -333,6 +917,14 @@ def calculate_point_gamma_for_layer(
     stats_diff_y = diff_y[mask] if np.any(mask) else diff_y
     abs_stats_diff_x = np.abs(stats_diff_x)
     abs_stats_diff_y = np.abs(stats_diff_y)
+    sample_weight = aligned.get("sample_weight")
+    stats_weight = included_weight = None
+    if sample_weight is not None:
+        sample_weight = np.asarray(sample_weight, dtype=float)
+        included_weight = sample_weight[mask]
+        stats_weight = included_weight if np.any(mask) else sample_weight
+    accumulator_x = AxisStatsAccumulator.from_values(stats_diff_x, weights=stats_weight)
+    accumulator_y = AxisStatsAccumulator.from_values(stats_diff_y, weights=stats_weight)
     results.update(
         {
             "diff_x": diff_x,
@@ -353,12 +945,10 @@ def calculate_point_gamma_for_layer(
             "max_abs_diff_y": float(np.max(abs_stats_diff_y))
             if abs_stats_diff_y.size
             else 0.0,
-            "p95_abs_diff_x": float(np.percentile(abs_stats_diff_x, 95))
-            if abs_stats_diff_x.size
-            else 0.0,
-            "p95_abs_diff_y": float(np.percentile(abs_stats_diff_y, 95))
-            if abs_stats_diff_y.size
-            else 0.0,
+            "p95_abs_diff_x": accumulator_x.abs_percentile(95),
+            "p95_abs_diff_y": accumulator_y.abs_percentile(95),
+            "stats_accumulator_x": accumulator_x,
+            "stats_accumulator_y": accumulator_y,
             "is_settling": analysis_masks["is_settling"],
             "settling_index": analysis_masks["settling_index"],
             "settling_samples_count": int(np.sum(analysis_masks["is_settling"])),
@@ -374,7 +964,9 @@ def calculate_point_gamma_for_layer(
             ],
             "sample_is_included_filtered_stats": analysis_masks["analysis_mask"],
             "num_filtered_samples": analysis_masks["num_filtered_samples"],
-            "num_included_samples": int(np.sum(analysis_masks["analysis_mask"])),
+            "num_included_samples": _evaluated_point_count(
+                np.sum(mask), included_weight
+            ),
             "plan_positions": np.column_stack((aligned["plan_x"], aligned["plan_y"])),
             "log_positions": np.column_stack((aligned["log_x"], aligned["log_y"])),
             "plan_grid": np.vstack(
@@ -393,18 +985,32 @@ def calculate_point_gamma_for_layer(
             "normalization_mode": "point_gamma",
             "used_planrange_mu_correction": False,
             "unmatched_delivered_weight": 0.0,
+            **aligned["time_alignment"],
         }
     )
 
-    # Save to CSV if requested
-    if save_to_csv:
+    if sample_weight is not None:
+        # Adaptive grid: each sample stands for ``sample_weight`` fixed-grid
+        # samples, so the summary statistics come from weighted moments.
+        for axis, accumulator in (("x", accumulator_x), ("y", accumulator_y)):
+            if accumulator.count <= 0:
+                continue
+            stats = accumulator.to_stats()
+            results[f"mean_diff_{axis}"] = stats["mean"]
+            results[f"std_diff_{axis}"] = stats["std"]
+            results[f"rmse_{axis}"] = stats["rmse"]
+            results[f"p95_abs_diff_{axis}"] = stats["p95_abs"]
+
+    # Save debug columns if requested
+    if save_to_csv or debug_sink is not None:
         plan_time_s = np.asarray(plan_layer.get("time_axis_s", []), dtype=float)
         spot_mu, spot_is_transit_min_dose, spot_scan_speed_mm_s = (
             _normalized_spot_series(plan_layer, plan_time_s)
         )
-        logger.info(f"Saving point-gamma data to {csv_filename}")
-        _write_debug_csv(
+        _emit_debug_output(
+            save_to_csv,
             csv_filename,
+            debug_sink,
             aligned["time_s"],  # log_time_s
             aligned["plan_x"],  # interp_plan_x
             aligned["plan_y"],  # interp_plan_y
@@ -0,0 +1,159 @@
+"""
+Background read-ahead of PTN files.
+
+Reading a PTN file is pure I/O (``np.fromfile`` releases the GIL), while
+parsing and the layer calculators are CPU work on the main thread.
+``PtnPrefetcher`` reads the next ``depth`` files on a reader thread while the
+consumer works on the current one, so on a network share the wall time per
+layer approaches ``max(read, compute)`` instead of their sum.
+
+Read-ahead is bounded twice: at most ``depth`` files beyond the one being
+consumed, and at most ``max_bytes`` of file data held at once (a single file
+larger than the cap is still read, alone).  Files are handed out in the order
+given, each as a ``concurrent.futures.Future`` whose ``result()`` returns the
+raw words or raises the read error (``FileNotFoundError`` / ``IOError``),
+exactly as :func:`src.log_parser.read_ptn_raw` would have.
+
+With ``concurrency`` > 1 the read-ahead window is filled by an
+``AsyncPtnLoader`` with that many reads in flight, for storage where the
+per-file latency rather than the bandwidth is the limit.
+"""
+
+import asyncio
+from collections import deque
+from concurrent.futures import Future
+import os
+import threading
+
+from src.async_ptn_loader import AsyncPtnLoader
+from src.log_parser import read_ptn_raw
+
+DEFAULT_PREFETCH_MAX_BYTES = 256 * 1024 * 1024
+
+
+class PtnPrefetcher:
+    """Iterate ``(path, future)`` over ``paths`` with files read ahead.
+
+    Use as a context manager so the reader thread is stopped when the
+    consumer leaves early::
+
+        with PtnPrefetcher(paths, depth=2) as prefetcher:
+            for path, raw in prefetcher:
+                log_data = parse_ptn_data(raw.result(), config)
+    """
+
+    def __init__(
+        self,
+        paths,
+        depth=2,
+        max_bytes=DEFAULT_PREFETCH_MAX_BYTES,
+        reader=read_ptn_raw,
+        concurrency=1,
+    ):
+        if depth < 1:
+            raise ValueError("depth must be >= 1")
+        self._paths = list(paths)
+        self._depth = int(depth)
+        self._concurrency = int(concurrency)
+        self._max_bytes = max_bytes
+        self._reader = reader
+        self._cond = threading.Condition()
+        self._ready = deque()
+        self._held_files = 0
+        self._held_bytes = 0
+        self._closed = False
+        self._thread = None
+
+    def _has_room(self, size):
+        # The file being consumed stays held until the next one is requested.
+        if self._held_files == 0:
+            return True
+        return (
+            self._held_files <= self._depth
+            and self._held_bytes + size <= self._max_bytes
+        )
+
+    def _reserve(self, path):
+        """Wait for room for ``path`` and queue its future; ``None`` once closed."""
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = 0
+        with self._cond:
+            self._cond.wait_for(lambda: self._closed or self._has_room(size))
+            if self._closed:
+                return None
+            self._held_files += 1
+            self._held_bytes += size
+            future = Future()
+            self._ready.append((path, size, future))
+            self._cond.notify_all()
+            return future
+
+    def _read_ahead(self):
+        if self._concurrency > 1:
+            asyncio.run(self._read_ahead_concurrently())
+            return
+        for path in self._paths:
+            future = self._reserve(path)
+            if future is None:
+                return
+            try:
+                future.set_result(self._reader(path))
+            except Exception as e:
+                future.set_exception(e)
+
+    async def _read_ahead_concurrently(self):
+        loop = asyncio.get_running_loop()
+        reads = []
+
+        async def read_into(loader, path, future):
+            try:
+                future.set_result(await loader.read(path))
+            except Exception as e:
+                future.set_exception(e)
+
+        async with AsyncPtnLoader(self._concurrency, reader=self._reader) as loader:
+            for path in self._paths:
+                # Waiting for room blocks, so it runs off the event loop.
+                future = await loop.run_in_executor(None, self._reserve, path)
+                if future is None:
+                    break
+                reads.append(asyncio.ensure_future(read_into(loader, path, future)))
+            await asyncio.gather(*reads)
+
+    def _release(self, size):
+        with self._cond:
+            self._held_files -= 1
+            self._held_bytes -= size
+            self._cond.notify_all()
+
+    def __iter__(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._read_ahead, name="ptn-prefetch", daemon=True
+            )
+            self._thread.start()
+        for _ in self._paths:
+            with self._cond:
+                self._cond.wait_for(lambda: self._ready)
+                path, size, future = self._ready.popleft()
+            try:
+                yield path, future
+            finally:
+                self._release(size)
+
+    def close(self):
+        """Stop reading ahead and wait for an in-flight read to finish."""
+        with self._cond:
+            self._closed = True
+            self._ready.clear()
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
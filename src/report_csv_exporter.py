@@ -42,6 +42,24 @@ CSV_FIELDNAMES = [
 ]
 
 
+POINT_GAMMA_CSV_FIELDNAMES = [
+    "patient_id",
+    "patient_name",
+    "beam_name",
+    "beam_number",
+    "layer_index_raw",
+    "layer_number",
+    "gamma_search_mode",
+    "evaluated_point_count",
+    "gamma_pass_rate_percent",
+    "gamma_mean",
+    "gamma_max",
+    "position_error_mean_mm",
+    "count_error_mean",
+]
+POINT_GAMMA_CRITERION_FIELDS = ("pass_rate_percent", "gamma_mean", "gamma_max")
+
+
 def _sanitize_filename(value):
     sanitized = re.sub(r"[^A-Za-z0-9]+", "_", value).strip("_")
     return sanitized or "beam"
@@ -144,3 +162,95 @@ def export_report_csv(report_data, output_dir, report_mode="raw"):
         written_files.append(csv_path)
 
     return written_files
+
+
+def _criterion_column_prefix(criterion):
+    return (
+        f"{float(criterion['fluence_percent_threshold']):g}pct_"
+        f"{float(criterion['distance_mm_threshold']):g}mm_"
+        f"{criterion.get('normalization', 'global')}"
+    ).replace(".", "p")
+
+
+def _point_gamma_criteria_fieldnames(layers):
+    fieldnames = []
+    for layer in layers:
+        for criterion in layer.get("results", {}).get("gamma_criteria", []):
+            prefix = _criterion_column_prefix(criterion)
+            for field in POINT_GAMMA_CRITERION_FIELDS:
+                name = f"{prefix}_{field}"
+                if name not in fieldnames:
+                    fieldnames.append(name)
+    return fieldnames
+
+
+def _build_point_gamma_layer_row(patient_id, patient_name, beam_name, beam_number, layer):
+    results = layer.get("results", {})
+    layer_index = int(layer.get("layer_index", 0))
+    row = {
+        "patient_id": patient_id,
+        "patient_name": patient_name,
+        "beam_name": beam_name,
+        "beam_number": beam_number,
+        "layer_index_raw": layer_index,
+        "layer_number": layer_index // 2 + 1,
+        "gamma_search_mode": results.get("gamma_search_mode", ""),
+        "evaluated_point_count": int(results.get("evaluated_point_count", 0)),
+        "gamma_pass_rate_percent": float(results.get("pass_rate", 0.0)) * 100.0,
+        "gamma_mean": results.get("gamma_mean"),
+        "gamma_max": results.get("gamma_max"),
+        "position_error_mean_mm": results.get("position_error_mean_mm"),
+        "count_error_mean": results.get("count_error_mean"),
+    }
+    for criterion in results.get("gamma_criteria", []):
+        prefix = _criterion_column_prefix(criterion)
+        row[f"{prefix}_pass_rate_percent"] = float(criterion["pass_rate"]) * 100.0
+        row[f"{prefix}_gamma_mean"] = criterion["gamma_mean"]
+        row[f"{prefix}_gamma_max"] = criterion["gamma_max"]
+    return row
+
+
+def export_point_gamma_report_csv(report_data, output_dir):
+    """Write one per-beam CSV of point-gamma layer results.
+
+    Each configured ``point_gamma.criteria`` entry adds pass rate, mean and
+    max columns prefixed with the criterion, e.g. ``2pct_2mm_local_``.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    patient_id = report_data.get("_patient_id", "")
+    patient_name = report_data.get("_patient_name", "")
+    written_files = []
+
+    for beam_name, beam_data in report_data.items():
+        if beam_name.startswith("_"):
+            continue
+
+        layers = beam_data.get("layers", [])
+        if not layers:
+            continue
+
+        filename = f"{_sanitize_filename(beam_name)}_point_gamma_layers.csv"
+        csv_path = os.path.join(output_dir, filename)
+        rows = [
+            _build_point_gamma_layer_row(
+                patient_id,
+                patient_name,
+                beam_name,
+                beam_data.get("beam_number", ""),
+                layer,
+            )
+            for layer in layers
+        ]
+
+        with open(csv_path, "w", encoding="utf-8", newline="") as handle:
+            writer = csv.DictWriter(
+                handle,
+                fieldnames=POINT_GAMMA_CSV_FIELDNAMES
+                + _point_gamma_criteria_fieldnames(layers),
+            )
+            writer.writeheader()
+            writer.writerows(rows)
+
+        written_files.append(csv_path)
+
+    return written_files
@@ -1,13 +1,13 @@
 import matplotlib.pyplot as plt
 from matplotlib.colors import Normalize
 import numpy as np
-from scipy.stats import pearsonr
 
 A4_FIGSIZE = (8.27, 11.69)
 
 from src.report_metrics import (
     THRESHOLDS,
     layer_passes as _layer_passes,
+    merged_axis_stats as _merged_axis_stats,
     metric_value as _metric_value,
     spot_pass_summary as _spot_pass_summary,
 )
@@ -53,6 +53,7 @@ def _collect_point_gamma_beam_metrics(layers_data):
     weighted_position_error_total = 0.0
     weighted_count_error_total = 0.0
     evaluated_point_total = 0
+    criteria_totals = {}
 
     for layer in layers_data:
         results = layer.get("results", {})
@@ -80,6 +81,17 @@ def _collect_point_gamma_beam_metrics(layers_data):
         weighted_count_error_total += count_error_mean * evaluated_point_count
         evaluated_point_total += evaluated_point_count
 
+        for criterion in results.get("gamma_criteria", []):
+            totals = criteria_totals.setdefault(
+                criterion["label"],
+                {"pass": 0.0, "mean": 0.0, "max": 0.0, "points": 0},
+            )
+            criterion_points = int(criterion.get("evaluated_point_count", 0))
+            totals["pass"] += _gamma_percent(criterion["pass_rate"]) * criterion_points
+            totals["mean"] += float(criterion["gamma_mean"]) * criterion_points
+            totals["max"] = max(totals["max"], float(criterion["gamma_max"]))
+            totals["points"] += criterion_points
+
     beam_pass_rate = (
         float(weighted_pass_total / evaluated_point_total)
         if evaluated_point_total > 0
@@ -115,9 +127,33 @@ def _collect_point_gamma_beam_metrics(layers_data):
         "beam_position_error_mean": beam_position_error_mean,
         "beam_count_error_mean": beam_count_error_mean,
         "evaluated_point_total": evaluated_point_total,
+        "criteria": [
+            {
+                "label": label,
+                "beam_pass_rate": totals["pass"] / totals["points"]
+                if totals["points"]
+                else 0.0,
+                "beam_gamma_mean": totals["mean"] / totals["points"]
+                if totals["points"]
+                else 0.0,
+                "beam_gamma_max": totals["max"],
+                "evaluated_point_total": totals["points"],
+            }
+            for label, totals in criteria_totals.items()
+        ],
     }
 
 
+def _primary_gamma_criterion_label(analysis_config):
+    cfg = analysis_config or {}
+    if "GAMMA_FLUENCE_PERCENT_THRESHOLD" not in cfg:
+        return "Primary"
+    return (
+        f"{float(cfg['GAMMA_FLUENCE_PERCENT_THRESHOLD']):g}%/"
+        f"{float(cfg.get('GAMMA_DISTANCE_MM_THRESHOLD', 0)):g}mm global"
+    )
+
+
 def _draw_point_gamma_analysis_info_panel(
     ax,
     analysis_config=None,
@@ -232,39 +268,62 @@ def _draw_gamma_summary_table(
     evaluated_point_total,
     beam_position_error_mean,
     beam_count_error_mean,
+    criteria=(),
+    primary_label="Primary",
 ):
     ax.axis("off")
     ax.set_title("Gamma Summary", fontsize=8, fontweight="bold", pad=0, y=0.95)
+    cell_text = [[
+        f"{beam_pass_rate:.1f}%",
+        f"{beam_gamma_mean:.3f}",
+        f"{beam_gamma_max:.3f}",
+        f"{evaluated_point_total:,}",
+        f"{beam_position_error_mean:.3f} mm",
+        f"{beam_count_error_mean:.3g}",
+        f"{num_layers}",
+    ]]
+    col_labels = [
+        "Gamma pass (%)",
+        "Gamma mean",
+        "Gamma max",
+        "Evaluated points",
+        "Pos err mean (mm)",
+        "Count err mean",
+        "Layers",
+    ]
+    col_widths = [0.15, 0.125, 0.125, 0.165, 0.18, 0.16, 0.095]
+    if criteria:
+        # One row per criterion; position/count errors do not depend on it.
+        cell_text = [[primary_label] + cell_text[0]] + [
+            [
+                criterion["label"],
+                f"{criterion['beam_pass_rate']:.1f}%",
+                f"{criterion['beam_gamma_mean']:.3f}",
+                f"{criterion['beam_gamma_max']:.3f}",
+                f"{criterion['evaluated_point_total']:,}",
+                "",
+                "",
+                "",
+            ]
+            for criterion in criteria
+        ]
+        col_labels = ["Criteria"] + col_labels
+        col_widths = [0.16] + [width * 0.84 for width in col_widths]
     tbl = ax.table(
-        cellText=[[
-            f"{beam_pass_rate:.1f}%",
-            f"{beam_gamma_mean:.3f}",
-            f"{beam_gamma_max:.3f}",
-            f"{evaluated_point_total:,}",
-            f"{beam_position_error_mean:.3f} mm",
-            f"{beam_count_error_mean:.3g}",
-            f"{num_layers}",
-        ]],
-        colLabels=[
-            "Gamma pass (%)",
-            "Gamma mean",
-            "Gamma max",
-            "Evaluated points",
-            "Pos err mean (mm)",
-            "Count err mean",
-            "Layers",
-        ],
+        cellText=cell_text,
+        colLabels=col_labels,
         loc="center",
         cellLoc="center",
-        colWidths=[0.15, 0.125, 0.125, 0.165, 0.18, 0.16, 0.095],
+        colWidths=col_widths,
     )
     tbl.auto_set_font_size(False)
     tbl.set_fontsize(6.1)
-    tbl.scale(1.0, 1.12)
-    for col_idx in range(7):
+    tbl.scale(1.0, 1.12 if not criteria else 1.0)
+    for col_idx in range(len(col_labels)):
         tbl[0, col_idx].set_facecolor("#34495e")
         tbl[0, col_idx].set_text_props(color="white", fontweight="bold", fontsize=6.1)
-        tbl[1, col_idx].set_facecolor("white")
+        for row_idx in range(1, len(cell_text) + 1):
+            tbl[row_idx, col_idx].set_facecolor("white")
 
 
 def _draw_layer_heatmap(
@@ -602,6 +661,8 @@ def _generate_point_gamma_summary_page(
 ):
     from datetime import date as _date
 
+    from scipy.stats import pearsonr
+
     layers_data = beam_data["layers"]
     num_layers = len(layers_data)
     metrics, all_plan_pos, all_log_pos, _, layer_labels, _, _ = _collect_beam_metrics(
@@ -639,6 +700,15 @@ def _generate_point_gamma_summary_page(
     global_max_y = max(max_y_all) if max_y_all else 0
     global_p95_x = np.mean(p95_x_all) if p95_x_all else 0
     global_p95_y = np.mean(p95_y_all) if p95_y_all else 0
+    merged_stats = _merged_axis_stats(layers_data)
+    if merged_stats is not None:
+        # Sample-weighted beam statistics rather than per-layer averages.
+        merged_x, merged_y = merged_stats
+        global_mean_x, global_mean_y = merged_x["mean"], merged_y["mean"]
+        global_std_x, global_std_y = merged_x["std"], merged_y["std"]
+        global_rmse_x, global_rmse_y = merged_x["rmse"], merged_y["rmse"]
+        global_max_x, global_max_y = merged_x["max_abs"], merged_y["max_abs"]
+        global_p95_x, global_p95_y = merged_x["p95_abs"], merged_y["p95_abs"]
 
     axes = build_summary_skeleton(
         beam_name=beam_name,
@@ -686,6 +756,8 @@ def _generate_point_gamma_summary_page(
         evaluated_point_total=gamma_metrics["evaluated_point_total"],
         beam_position_error_mean=gamma_metrics["beam_position_error_mean"],
         beam_count_error_mean=gamma_metrics["beam_count_error_mean"],
+        criteria=gamma_metrics["criteria"],
+        primary_label=_primary_gamma_criterion_label(analysis_config),
     )
 
     # Left panel: layer trend plot
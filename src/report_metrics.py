@@ -1,5 +1,7 @@
 import numpy as np
 
+from src.streaming_stats import merge_accumulators
+
 
 THRESHOLDS = {
     "mean_diff_mm": 1.0,
@@ -22,6 +24,29 @@ def metric_value(results: dict, base_key: str, report_mode: str):
     return results.get(_metric_key(results, base_key, report_mode), 0)
 
 
+def merged_axis_stats(layers_data):
+    """Merge per-layer stats accumulators into beam-level ``(stats_x, stats_y)``.
+
+    The accumulators cover the raw statistics samples.  Returns ``None`` when any layer lacks an accumulator, so callers can fall
+    back to averaging the per-layer scalar metrics.
+    """
+    accumulators_x = []
+    accumulators_y = []
+    for layer in layers_data:
+        results = layer.get("results", {})
+        accumulator_x = results.get("stats_accumulator_x")
+        accumulator_y = results.get("stats_accumulator_y")
+        if accumulator_x is None or accumulator_y is None:
+            return None
+        accumulators_x.append(accumulator_x)
+        accumulators_y.append(accumulator_y)
+    merged_x = merge_accumulators(accumulators_x)
+    merged_y = merge_accumulators(accumulators_y)
+    if merged_x is None or merged_y is None:
+        return None
+    return merged_x.to_stats(), merged_y.to_stats()
+
+
 def layer_passes(results: dict, report_mode: str = "raw") -> bool:
     """Check whether a single layer's metrics satisfy the report thresholds."""
     mean_ok = (
@@ -0,0 +1,486 @@
+"""
+Per-stage wall and CPU timing of one ``run_analysis`` call.
+
+``run_analysis`` times its run-level stages (directory scan, DICOM parse, CSV
+export, PDF render) on a ``RunProfile``; every layer is timed on its own
+``LayerProfile`` (PTN read, MU correction, calculator, gamma), which is
+returned from the worker process with the layer's results.  Code deep in the
+layer path marks a stage with the module-level :func:`stage`, which records
+into the layer being analyzed on the current thread and does nothing
+elsewhere, so the analysis functions keep their signatures.  A stage hook
+(:func:`use_stage_hook`) lets ``src.pipeline_profiler`` run cProfile over
+selected stages only; like the active layer it is held in a context
+variable, so concurrent jobs of a long-running service keep their own hooks.
+
+CPU time is the current thread's (``time.thread_time``), so read-ahead
+threads and other jobs of a long-running service are not counted against a
+stage.  The profile is written as ``run_profile.json`` next to the reports
+and summarized in one log line.
+
+With a ``MemoryTracker`` every stage also records the process RSS and peak
+RSS, and in memory mode the tracemalloc peak of the stage.  Run-level stages,
+each layer and the run as a whole add the source lines that allocated the
+most memory still held at their end.  The tracker warns once per process
+when RSS approaches the configured budget.
+
+Memory figures are process-wide, unlike CPU time: tracemalloc has one peak
+and one start/stop switch per process.  Memory-mode runs therefore hold
+:data:`TRACING_LOCK` while tracing, so they run one at a time, and
+``src.analysis_service`` runs a memory-mode job only while no other job is
+running.
+"""
+
+import contextlib
+import contextvars
+from collections import defaultdict
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from src.pipeline_stages import STAGE_ORDER
+
+logger = logging.getLogger(__name__)
+
+RUN_PROFILE_FILENAME = "run_profile.json"
+
+MEMORY_BUDGET_WARN_FRACTION = 0.9
+DEFAULT_TOP_ALLOCATORS = 5
+# Enough frames to get from numpy internals back to the project line that
+# asked for the array.
+MEMORY_TRACE_FRAMES = 25
+_MB = 1024 * 1024
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Allocations of the profiling machinery itself are not reported.
+_ALLOCATION_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+)
+
+# Serializes memory-mode runs; see the module docstring.
+TRACING_LOCK = threading.Lock()
+
+_active_layer = contextvars.ContextVar("active_layer_profile", default=None)
+_stage_hook = contextvars.ContextVar("stage_hook", default=None)
+
+
+@contextlib.contextmanager
+def use_stage_hook(hook):
+    """Wrap every stage of the current context in ``hook(name)``, a context manager."""
+    token = _stage_hook.set(hook)
+    try:
+        yield
+    finally:
+        _stage_hook.reset(token)
+
+
+def _hooked(name):
+    hook = _stage_hook.get()
+    return contextlib.nullcontext() if hook is None else hook(name)
+
+
+def current_rss_mb():
+    """Resident set size of this process in MB, or ``None`` where unknown."""
+    try:
+        with open("/proc/self/statm", "r", encoding="ascii") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / _MB
+    except (OSError, ValueError, IndexError, AttributeError):
+        # No /proc (macOS, Windows): only the peak is available.
+        return None
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or ``None`` where unknown."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+    return peak / _MB if sys.platform == "darwin" else peak / 1024
+
+
+class MemoryTracker:
+    """RSS, tracemalloc peaks and top allocators per stage, with a budget warning.
+
+    ``trace`` turns on tracemalloc (memory mode); without it only RSS is
+    recorded, which is cheap enough to back the budget warning on every run.
+    """
+
+    def __init__(self, trace=False, budget_mb=None, top_allocators=DEFAULT_TOP_ALLOCATORS):
+        self.trace = trace
+        self.budget_mb = budget_mb
+        self.top_allocators = top_allocators
+        self.budget_warning = None
+        self.traced_peak_mb = 0.0
+
+    @contextlib.contextmanager
+    def tracing(self):
+        """Run tracemalloc for the block, one memory-mode block at a time.
+
+        Blocks wait for each other on :data:`TRACING_LOCK`, so no run resets
+        the peak of another or stops tracing under it.
+        """
+        if not self.trace:
+            yield self
+            return
+        with TRACING_LOCK:
+            started = not tracemalloc.is_tracing()
+            if started:
+                tracemalloc.start(MEMORY_TRACE_FRAMES)
+            try:
+                yield self
+            finally:
+                if started:
+                    tracemalloc.stop()
+
+    def _tracing(self):
+        # Worker processes started with spawn do not inherit tracing.
+        return self.trace and tracemalloc.is_tracing()
+
+    def begin(self, snapshot=False):
+        """Start measuring a stage; returns the token for :meth:`measure`."""
+        if not self._tracing():
+            return None
+        tracemalloc.reset_peak()
+        return tracemalloc.take_snapshot() if snapshot else None
+
+    def measure(self, name, start_snapshot=None):
+        """Memory fields of a stage begun with :meth:`begin`."""
+        record = {"rss_mb": current_rss_mb(), "peak_rss_mb": peak_rss_mb()}
+        if self._tracing():
+            traced_peak_mb = tracemalloc.get_traced_memory()[1] / _MB
+            self.traced_peak_mb = max(self.traced_peak_mb, traced_peak_mb)
+            record["traced_peak_mb"] = traced_peak_mb
+            if start_snapshot is not None:
+                record["top_allocators"] = self.allocators_since(start_snapshot)
+        self.check_budget(
+            name,
+            record["rss_mb"] if record["rss_mb"] is not None else record["peak_rss_mb"],
+        )
+        return record
+
+    def allocators_since(self, start_snapshot):
+        """Project lines holding the most memory allocated since ``start_snapshot``.
+
+        Each allocation is attributed to the innermost frame in this project,
+        so an array built inside numpy is charged to the line that asked for it.
+        """
+        snapshot = tracemalloc.take_snapshot().filter_traces(_ALLOCATION_FILTERS)
+        differences = snapshot.compare_to(
+            start_snapshot.filter_traces(_ALLOCATION_FILTERS), "traceback"
+        )
+        by_location = defaultdict(lambda: [0, 0])
+        for stat in differences:
+            totals = by_location[_allocation_site(stat.traceback)]
+            totals[0] += stat.size_diff
+            totals[1] += stat.count_diff
+        top = sorted(by_location.items(), key=lambda item: item[1][0], reverse=True)
+        return [
+            {
+                "location": location,
+                "size_mb": round(size_diff / _MB, 6),
+                "blocks": count_diff,
+            }
+            for location, (size_diff, count_diff) in top[: self.top_allocators]
+            if size_diff > 0
+        ]
+
+    def check_budget(self, name, rss_mb):
+        if (
+            self.budget_mb is None
+            or rss_mb is None
+            or self.budget_warning is not None
+            or rss_mb < self.budget_mb * MEMORY_BUDGET_WARN_FRACTION
+        ):
+            return
+        self.budget_warning = {"stage": name, "rss_mb": round(rss_mb, 1)}
+        logger.warning(
+            "Memory use %.0f MB after stage %s is %.0f%% of the %.0f MB budget",
+            rss_mb,
+            name,
+            100.0 * rss_mb / self.budget_mb,
+            self.budget_mb,
+        )
+
+
+def _allocation_site(traceback):
+    # Frames run from the oldest to the most recent call.
+    for frame in reversed(traceback):
+        filename = os.path.abspath(frame.filename)
+        if filename.startswith(_PROJECT_ROOT + os.sep) and "site-packages" not in filename:
+            return f"{os.path.relpath(filename, _PROJECT_ROOT)}:{frame.lineno}"
+    frame = traceback[-1]
+    return f"{frame.filename}:{frame.lineno}"
+
+
+def memory_tracker_from_config(app_config, enabled=None):
+    """``MemoryTracker`` for memory mode or a memory budget, else ``None``.
+
+    ``enabled`` (from the command line) overrides ``profiling.memory``.
+    """
+    trace = app_config.get("PROFILE_MEMORY", False) if enabled is None else enabled
+    budget_mb = app_config.get("MEMORY_BUDGET_MB")
+    if not (trace or budget_mb):
+        return None
+    return MemoryTracker(
+        trace=bool(trace),
+        budget_mb=budget_mb,
+        top_allocators=app_config.get("MEMORY_TOP_ALLOCATORS", DEFAULT_TOP_ALLOCATORS),
+    )
+
+
+def _merge_memory(entry, record):
+    """Keep the largest value of each memory field over repeated stages."""
+    for key, value in record.items():
+        if key == "top_allocators":
+            entry[key] = value
+        elif value is not None and (entry.get(key) is None or value > entry[key]):
+            entry[key] = value
+        else:
+            entry.setdefault(key, value)
+
+
+class StageTimes:
+    """Wall and CPU seconds accumulated per stage name.
+
+    ``memory`` is an optional ``MemoryTracker``; ``snapshot_stages`` makes
+    each stage also report its top allocators.
+    """
+
+    snapshot_stages = False
+
+    def __init__(self, memory=None):
+        self.stages = {}
+        self.memory = memory
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        memory_token = (
+            self.memory.begin(snapshot=self.snapshot_stages) if self.memory else None
+        )
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            with _hooked(name):
+                yield
+        finally:
+            entry = self.stages.setdefault(name, {"wall_s": 0.0, "cpu_s": 0.0})
+            entry["wall_s"] += time.perf_counter() - wall_start
+            entry["cpu_s"] += time.thread_time() - cpu_start
+            if self.memory is not None:
+                _merge_memory(entry, self.memory.measure(name, memory_token))
+
+
+class LayerProfile(StageTimes):
+    """Stage times and data volume of one layer."""
+
+    def __init__(self, beam_number, layer_index, ptn_file, memory=None):
+        super().__init__(memory)
+        self.beam_number = beam_number
+        self.layer_index = layer_index
+        self.ptn_file = ptn_file
+        self.samples = 0
+        self.bytes = 0
+        self.memory_record = None
+
+    @contextlib.contextmanager
+    def activate(self):
+        """Make :func:`stage` and :func:`count` record into this layer."""
+        token = _active_layer.set(self)
+        start_snapshot = self.memory.begin(snapshot=True) if self.memory else None
+        try:
+            yield self
+        finally:
+            _active_layer.reset(token)
+            if self.memory is not None:
+                name = f"beam {self.beam_number} layer {self.layer_index}"
+                self.memory_record = self.memory.measure(name, start_snapshot)
+                # The stages reset the tracemalloc peak; keep the largest.
+                for entry in self.stages.values():
+                    _merge_memory(
+                        self.memory_record,
+                        {"traced_peak_mb": entry.get("traced_peak_mb")},
+                    )
+
+    def to_dict(self):
+        data = {
+            "beam_number": self.beam_number,
+            "layer_index": self.layer_index,
+            "ptn_file": self.ptn_file,
+            "samples": self.samples,
+            "bytes": self.bytes,
+            "stages": _rounded(self.stages),
+        }
+        if self.memory_record is not None:
+            data["memory"] = _rounded_values(self.memory_record)
+        return data
+
+
+def stage(name):
+    """Time a stage of the active layer; only the stage hook runs when there is none."""
+    layer = _active_layer.get()
+    if layer is None:
+        return _hooked(name)
+    return layer.stage(name)
+
+
+def count(samples=0, nbytes=0):
+    """Add PTN samples and bytes to the active layer, if any."""
+    layer = _active_layer.get()
+    if layer is not None:
+        layer.samples += samples
+        layer.bytes += nbytes
+
+
+def _rounded_values(entry):
+    return {
+        key: round(value, 6) if isinstance(value, float) else value
+        for key, value in entry.items()
+    }
+
+
+def _rounded(stages):
+    return {name: _rounded_values(entry) for name, entry in stages.items()}
+
+
+def _ordered(names):
+    known = [name for name in STAGE_ORDER if name in names]
+    return known + sorted(set(names) - set(STAGE_ORDER))
+
+
+class RunProfile(StageTimes):
+    """Run-level stages plus the ``LayerProfile`` dicts of every layer."""
+
+    snapshot_stages = True
+
+    def __init__(self, workers=1, memory=None):
+        super().__init__(memory)
+        self.workers = workers
+        self.layers = []
+        self._start_snapshot = memory.begin(snapshot=True) if memory else None
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.thread_time()
+        self._wall_s = None
+        self._cpu_s = None
+        self.memory_record = None
+
+    def add_layer(self, layer_profile):
+        self.layers.append(layer_profile)
+
+    def finish(self):
+        self._wall_s = time.perf_counter() - self._wall_start
+        self._cpu_s = time.thread_time() - self._cpu_start
+        if self.memory is not None:
+            # Top allocators of the run are what it still holds at the end,
+            # i.e. mostly the per-sample arrays kept in the report data.
+            self.memory_record = self.memory.measure("run", self._start_snapshot)
+            _merge_memory(
+                self.memory_record,
+                {
+                    "traced_peak_mb": self.memory.traced_peak_mb
+                    if self.memory.trace
+                    else None
+                },
+            )
+            self.memory_record["budget_mb"] = self.memory.budget_mb
+            self.memory_record["budget_warning"] = self.memory.budget_warning
+            self._start_snapshot = None
+
+    def stage_totals(self):
+        """Per-stage wall/CPU seconds with samples/s and bytes/s for layer stages."""
+        totals = {name: dict(entry) for name, entry in self.stages.items()}
+        layer_stages = {}
+        for layer in self.layers:
+            for name, entry in layer["stages"].items():
+                total = layer_stages.setdefault(
+                    name,
+                    {"wall_s": 0.0, "cpu_s": 0.0, "layers": 0, "samples": 0, "bytes": 0},
+                )
+                total["wall_s"] += entry["wall_s"]
+                total["cpu_s"] += entry["cpu_s"]
+                total["layers"] += 1
+                total["samples"] += layer["samples"]
+                total["bytes"] += layer["bytes"]
+                traced_peak_mb = entry.get("traced_peak_mb")
+                if traced_peak_mb is not None and traced_peak_mb > total.get(
+                    "traced_peak_mb", -1.0
+                ):
+                    total["traced_peak_layer"] = [layer["beam_number"], layer["layer_index"]]
+                _merge_memory(
+                    total,
+                    {
+                        key: entry[key]
+                        for key in ("rss_mb", "peak_rss_mb", "traced_peak_mb")
+                        if key in entry
+                    },
+                )
+        for total in layer_stages.values():
+            wall_s = total["wall_s"]
+            total["samples_per_s"] = total["samples"] / wall_s if wall_s > 0 else None
+            total["bytes_per_s"] = total["bytes"] / wall_s if wall_s > 0 else None
+        totals.update(layer_stages)
+        return {name: _rounded_values(totals[name]) for name in _ordered(totals)}
+
+    def to_dict(self, **info):
+        if self._wall_s is None:
+            self.finish()
+        if self.memory_record is not None:
+            info = {**info, "memory": _rounded_values(self.memory_record)}
+        cpu_s = self._cpu_s
+        if self.workers > 1:
+            # Layers ran in worker processes, outside this thread's CPU time.
+            cpu_s += sum(
+                entry["cpu_s"]
+                for layer in self.layers
+                for entry in layer["stages"].values()
+            )
+        return {
+            **info,
+            "workers": self.workers,
+            "wall_s": round(self._wall_s, 6),
+            "cpu_s": round(cpu_s, 6),
+            "layer_count": len(self.layers),
+            "samples": sum(layer["samples"] for layer in self.layers),
+            "bytes": sum(layer["bytes"] for layer in self.layers),
+            "stages": self.stage_totals(),
+            "layers": self.layers,
+        }
+
+    def summary(self, profile_dict=None):
+        """One-line summary of ``to_dict()`` for the log."""
+        data = profile_dict or self.to_dict()
+        parts = []
+        for name, entry in data["stages"].items():
+            text = f"{name} {entry['wall_s']:.2f} s"
+            if name == "ptn_read" and entry.get("bytes_per_s"):
+                text += f" ({entry['bytes_per_s'] / 1e6:.1f} MB/s)"
+            elif entry.get("samples_per_s") and name in ("calculator", "gamma"):
+                text += f" ({entry['samples_per_s'] / 1e6:.2f} M samples/s)"
+            parts.append(text)
+        memory = data.get("memory") or {}
+        if memory.get("peak_rss_mb") is not None:
+            parts.append(f"peak RSS {memory['peak_rss_mb']:.0f} MB")
+        if memory.get("traced_peak_mb") is not None:
+            parts.append(f"traced peak {memory['traced_peak_mb']:.0f} MB")
+        return (
+            f"Run profile: {data['wall_s']:.2f} s wall, {data['cpu_s']:.2f} s CPU, "
+            f"{data['layer_count']} layers; " + ", ".join(parts)
+        )
+
+    def write(self, output_dir, **info):
+        """Write ``run_profile.json`` to ``output_dir``; returns its path."""
+        data = self.to_dict(**info)
+        path = os.path.join(output_dir, RUN_PROFILE_FILENAME)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+        logger.info("%s -> %s", self.summary(data), path)
+        return path
@@ -0,0 +1,272 @@
+"""
+Mergeable streaming statistics for position-difference aggregates.
+
+An :class:`AxisStatsAccumulator` summarises one signed difference axis with
+Welford/Chan running moments, a sum of squares for RMSE, the maximum absolute
+value and a :class:`QuantileSketch` of the absolute differences for
+percentiles.  Accumulators can be updated chunk by chunk and merged across
+layers, beams and worker processes, so beam-level statistics are exact (up to
+the sketch's rank error for percentiles) without keeping any per-sample
+arrays.
+
+:class:`QuantileSketch` is a KLL-style compacting sketch for tail quantiles
+(e.g. p95 of ``|diff|``) with a rank error bounded by roughly ``1.7 / k``
+independent of the value range, mergeable into beam, patient and machine
+level quantiles.
+"""
+
+import numpy as np
+
+DEFAULT_SKETCH_K = 200
+SKETCH_CAPACITY_DECAY = 2.0 / 3.0
+
+
+class AxisStatsAccumulator:
+    """Running mean/variance, RMSE, max-abs and abs-value quantile sketch."""
+
+    def __init__(self, sketch_k=DEFAULT_SKETCH_K):
+        self.abs_sketch = QuantileSketch(k=sketch_k)
+        self.count = 0.0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.sum_sq = 0.0
+        self.max_abs = 0.0
+
+    @classmethod
+    def from_values(cls, values, weights=None, **kwargs):
+        accumulator = cls(**kwargs)
+        accumulator.update(values, weights=weights)
+        return accumulator
+
+    def update(self, values, weights=None):
+        """Fold a chunk of samples into the accumulator.
+
+        ``weights`` must be whole numbers (the adaptive time grid's sample
+        counts), as the quantile sketch stores weights in binary levels.
+        """
+        values = np.asarray(values, dtype=float).ravel()
+        if values.size == 0:
+            return self
+        if weights is None:
+            chunk_count = float(values.size)
+            chunk_mean = float(np.mean(values))
+            chunk_m2 = float(np.sum((values - chunk_mean) ** 2))
+            chunk_sum_sq = float(np.dot(values, values))
+        else:
+            weights = np.asarray(weights, dtype=float).ravel()
+            chunk_count = float(np.sum(weights))
+            if chunk_count <= 0:
+                return self
+            chunk_mean = float(np.dot(weights, values) / chunk_count)
+            chunk_m2 = float(np.dot(weights, (values - chunk_mean) ** 2))
+            chunk_sum_sq = float(np.dot(weights, values * values))
+
+        abs_values = np.abs(values)
+        self.abs_sketch.update(abs_values, weights=weights)
+        self.max_abs = max(self.max_abs, float(np.max(abs_values)))
+        self.sum_sq += chunk_sum_sq
+        self._combine_moments(chunk_count, chunk_mean, chunk_m2)
+        return self
+
+    def _combine_moments(self, other_count, other_mean, other_m2):
+        total = self.count + other_count
+        if total <= 0:
+            return
+        delta = other_mean - self.mean
+        self.mean += delta * other_count / total
+        self.m2 += other_m2 + delta * delta * self.count * other_count / total
+        self.count = total
+
+    def merge(self, other):
+        """Fold another accumulator into this one in place."""
+        if other.count <= 0:
+            return self
+        self.abs_sketch.merge(other.abs_sketch)
+        self.max_abs = max(self.max_abs, other.max_abs)
+        self.sum_sq += other.sum_sq
+        self._combine_moments(other.count, other.mean, other.m2)
+        return self
+
+    @property
+    def std(self):
+        return float(np.sqrt(self.m2 / self.count)) if self.count > 0 else 0.0
+
+    @property
+    def rmse(self):
+        return float(np.sqrt(self.sum_sq / self.count)) if self.count > 0 else 0.0
+
+    def abs_percentile(self, q):
+        """Approximate percentile of ``|diff|`` from the quantile sketch."""
+        if self.count <= 0:
+            return 0.0
+        return self.abs_sketch.percentile(q)
+
+    def to_stats(self):
+        """Return the same keys as ``calculator._calculate_axis_stats``."""
+        return {
+            "mean": float(self.mean) if self.count > 0 else 0.0,
+            "std": self.std,
+            "rmse": self.rmse,
+            "max_abs": float(self.max_abs),
+            "p95_abs": self.abs_percentile(95),
+        }
+
+
+def merge_accumulators(accumulators):
+    """Merge an iterable of accumulators into a new one; ``None`` if empty."""
+    merged = None
+    for accumulator in accumulators:
+        if accumulator is None:
+            continue
+        if merged is None:
+            merged = AxisStatsAccumulator(sketch_k=accumulator.abs_sketch.k)
+        merged.merge(accumulator)
+    return merged
+
+
+class QuantileSketch:
+    """KLL-style mergeable quantile sketch.
+
+    Level ``h`` holds items of weight ``2**h``, so an item of whole-number
+    weight ``w`` is stored once per set bit of ``w``.  When a level exceeds
+    its capacity it is sorted and every other item (random offset) is
+    promoted to the next level; a level holding many times its capacity
+    (one large update) is first compacted in sorted blocks of ``k`` items.  Compaction uses a seeded generator, so a given sequence
+    of updates and merges is reproducible.
+    """
+
+    def __init__(self, k=DEFAULT_SKETCH_K, seed=0):
+        if k < 8:
+            raise ValueError("Quantile sketch k must be at least 8")
+        self.k = int(k)
+        self.levels = [np.zeros(0, dtype=float)]
+        self.count = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self._rng = np.random.default_rng(seed)
+
+    @classmethod
+    def from_values(cls, values, **kwargs):
+        sketch = cls(**kwargs)
+        sketch.update(values)
+        return sketch
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(2, int(np.ceil(self.k * SKETCH_CAPACITY_DECAY ** depth)))
+
+    def _compact_in_blocks(self, level):
+        """Compact a level far over capacity block by block.
+
+        Sorting blocks of ``k`` items costs ``O(n log k)`` instead of sorting
+        the whole chunk, so a large update never does a full sort.
+        """
+        block = 2 * (self.k // 2)
+        items = self.levels[level]
+        if items.size <= 2 * block:
+            return
+        if level + 1 == len(self.levels):
+            self.levels.append(np.zeros(0, dtype=float))
+        whole = items.size - items.size % block
+        blocks = np.sort(items[:whole].reshape(-1, block), axis=1)
+        promoted = blocks[:, int(self._rng.integers(2))::2].ravel()
+        self.levels[level] = items[whole:].copy()
+        self.levels[level + 1] = np.concatenate((self.levels[level + 1], promoted))
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            self._compact_in_blocks(level)
+            level += 1
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if items.size < self._capacity(level):
+                level += 1
+                continue
+            if level + 1 == len(self.levels):
+                self.levels.append(np.zeros(0, dtype=float))
+            items = np.sort(items)
+            keep = items[-1:] if items.size % 2 else items[:0]
+            pairs = items[: items.size - keep.size]
+            promoted = pairs[int(self._rng.integers(2))::2]
+            self.levels[level] = keep.copy()
+            self.levels[level + 1] = np.concatenate((self.levels[level + 1], promoted))
+            # Adding a level shrinks every lower capacity; rescan from the bottom.
+            level = 0
+
+    def update(self, values, weights=None):
+        values = np.asarray(values, dtype=float).ravel()
+        finite = np.isfinite(values)
+        if weights is None:
+            weights = np.ones(values.size, dtype=np.int64)
+        else:
+            weights = np.asarray(weights, dtype=float).ravel()
+            if np.any(weights < 0) or np.any(weights != np.round(weights)):
+                raise ValueError("Quantile sketch weights must be whole numbers")
+            weights = weights.astype(np.int64)
+        keep = finite & (weights > 0)
+        values = values[keep]
+        weights = weights[keep]
+        if values.size == 0:
+            return self
+        self.count += int(np.sum(weights))
+        self.min = min(self.min, float(np.min(values)))
+        self.max = max(self.max, float(np.max(values)))
+        level = 0
+        while np.any(weights):
+            if level == len(self.levels):
+                self.levels.append(np.zeros(0, dtype=float))
+            self.levels[level] = np.concatenate(
+                (self.levels[level], values[(weights & 1) == 1])
+            )
+            weights = weights >> 1
+            level += 1
+        self._compress()
+        return self
+
+    def merge(self, other):
+        """Fold another sketch into this one in place."""
+        if other.count == 0:
+            return self
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.zeros(0, dtype=float))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate((self.levels[level], items))
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    def quantile(self, q):
+        """Approximate ``q``-quantile (``0 <= q <= 1``); ``0.0`` when empty."""
+        if self.count == 0:
+            return 0.0
+        if q <= 0:
+            return float(self.min)
+        if q >= 1:
+            return float(self.max)
+        items = np.concatenate(self.levels)
+        weights = np.concatenate(
+            [np.full(level.size, 2.0 ** h) for h, level in enumerate(self.levels)]
+        )
+        order = np.argsort(items, kind="stable")
+        cumulative = np.cumsum(weights[order])
+        index = int(np.searchsorted(cumulative, float(q) * cumulative[-1], side="left"))
+        return float(items[order][min(index, items.size - 1)])
+
+    def percentile(self, q):
+        return self.quantile(float(q) / 100.0)
+
+
+def merge_sketches(sketches):
+    """Merge an iterable of sketches into a new one; ``None`` if empty."""
+    merged = None
+    for sketch in sketches:
+        if sketch is None:
+            continue
+        if merged is None:
+            merged = QuantileSketch(k=sketch.k)
+        merged.merge(sketch)
+    return merged
@@ -0,0 +1,315 @@
+"""
+Plan/log time alignment.
+
+Estimates the lag between the reconstructed plan trajectory and the rebased
+PTN log time with an FFT cross-correlation of the x, y and dose-rate signals,
+and optionally refines it with an affine time scale fitted by least squares
+on matched spot boundaries.  The resulting mapping is::
+
+    plan_time_s = (log_time_s - time_offset_s) / time_scale
+"""
+
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ALIGNMENT_SAMPLE_INTERVAL_S = 60e-6
+DEFAULT_MAX_LAG_S = 0.05
+DEFAULT_SPOT_TOLERANCE_MM = 1.0
+DEFAULT_MAX_SCALE_DEVIATION = 0.05
+MIN_BOUNDARY_MATCHES = 3
+SPOT_SEARCH_NEIGHBORS = 2
+SCALE_FIT_MAX_ITERATIONS = 6
+SCALE_FIT_CONVERGENCE = 1e-6
+
+
+def _identity_alignment():
+    return {
+        "time_alignment_applied": False,
+        "time_offset_s": 0.0,
+        "time_scale": 1.0,
+        "time_alignment_boundary_matches": 0,
+    }
+
+
+def _standardize(signal):
+    signal = np.asarray(signal, dtype=float)
+    if signal.size == 0:
+        return signal
+    centered = signal - float(np.mean(signal))
+    scale = float(np.std(centered))
+    if scale <= 0 or not np.isfinite(scale):
+        return None
+    return centered / scale
+
+
+def _rate_from_cumulative(cumulative):
+    rate = np.diff(cumulative, prepend=cumulative[0])
+    rate[0] = 0.0
+    return rate
+
+
+def _plan_signals(plan_layer, grid_s):
+    plan_time_s = np.asarray(plan_layer["time_axis_s"], dtype=float)
+    channels = [
+        np.interp(grid_s, plan_time_s, np.asarray(plan_layer["trajectory_x_mm"], dtype=float)),
+        np.interp(grid_s, plan_time_s, np.asarray(plan_layer["trajectory_y_mm"], dtype=float)),
+    ]
+    plan_cumulative_mu = plan_layer.get("cumulative_mu")
+    if plan_cumulative_mu is not None and len(plan_cumulative_mu) == plan_time_s.size:
+        channels.append(
+            _rate_from_cumulative(
+                np.interp(grid_s, plan_time_s, np.asarray(plan_cumulative_mu, dtype=float))
+            )
+        )
+    else:
+        channels.append(None)
+    return channels
+
+
+def _log_signals(log_time_s, log_x, log_y, log_mu, grid_s):
+    channels = [
+        np.interp(grid_s, log_time_s, log_x),
+        np.interp(grid_s, log_time_s, log_y),
+    ]
+    if log_mu is not None and len(log_mu) == log_time_s.size:
+        channels.append(
+            _rate_from_cumulative(
+                np.interp(grid_s, log_time_s, np.asarray(log_mu, dtype=float))
+            )
+        )
+    else:
+        channels.append(None)
+    return channels
+
+
+def _cross_correlation(plan_channels, log_channels):
+    """Sum of per-channel cross-correlations ``c[k] = sum_t log[t + k] * plan[t]``.
+
+    Returns ``(lags, correlation)`` with lags in samples, computed with one
+    zero-padded real FFT per channel (O(n log n)).
+    """
+    pairs = []
+    for plan_signal, log_signal in zip(plan_channels, log_channels):
+        if plan_signal is None or log_signal is None:
+            continue
+        plan_std = _standardize(plan_signal)
+        log_std = _standardize(log_signal)
+        if plan_std is None or log_std is None:
+            continue
+        pairs.append((plan_std, log_std))
+    if not pairs:
+        return None, None
+
+    plan_len = pairs[0][0].size
+    log_len = pairs[0][1].size
+    full_len = plan_len + log_len - 1
+    nfft = 1 << (full_len - 1).bit_length()
+    spectrum = np.zeros(nfft // 2 + 1, dtype=complex)
+    for plan_std, log_std in pairs:
+        spectrum += np.fft.rfft(log_std, nfft) * np.conj(np.fft.rfft(plan_std, nfft))
+    circular = np.fft.irfft(spectrum, nfft)
+    correlation = np.concatenate((circular[nfft - (plan_len - 1):], circular[:log_len]))
+    lags = np.arange(-(plan_len - 1), log_len)
+    return lags, correlation
+
+
+def _parabolic_peak_offset(correlation, index):
+    if index <= 0 or index >= correlation.size - 1:
+        return 0.0
+    left, center, right = correlation[index - 1:index + 2]
+    denominator = left - 2.0 * center + right
+    if denominator == 0:
+        return 0.0
+    return float(0.5 * (left - right) / denominator)
+
+
+def estimate_time_offset_s(
+    plan_layer,
+    log_time_s,
+    log_x,
+    log_y,
+    log_mu=None,
+    *,
+    dt_s=DEFAULT_ALIGNMENT_SAMPLE_INTERVAL_S,
+    max_lag_s=DEFAULT_MAX_LAG_S,
+):
+    """Estimate the log-minus-plan time offset in seconds.
+
+    Returns ``None`` when no channel carries usable signal.
+    """
+    plan_time_s = np.asarray(plan_layer["time_axis_s"], dtype=float)
+    log_time_s = np.asarray(log_time_s, dtype=float)
+    if plan_time_s.size < 2 or log_time_s.size < 2:
+        return None
+
+    plan_grid_s = np.arange(0.0, float(plan_time_s[-1]) + dt_s * 0.5, dt_s)
+    log_grid_s = np.arange(
+        float(log_time_s[0]), float(log_time_s[-1]) + dt_s * 0.5, dt_s
+    )
+    if plan_grid_s.size < 2 or log_grid_s.size < 2:
+        return None
+
+    lags, correlation = _cross_correlation(
+        _plan_signals(plan_layer, plan_grid_s),
+        _log_signals(
+            log_time_s,
+            np.asarray(log_x, dtype=float),
+            np.asarray(log_y, dtype=float),
+            log_mu,
+            log_grid_s,
+        ),
+    )
+    if lags is None:
+        return None
+
+    max_lag_samples = int(np.ceil(float(max_lag_s) / dt_s))
+    window = np.abs(lags) <= max_lag_samples
+    if not np.any(window):
+        return None
+    window_indices = np.flatnonzero(window)
+    best = int(window_indices[np.argmax(correlation[window])])
+    refined_lag = lags[best] + _parabolic_peak_offset(correlation, best)
+    return float(log_grid_s[0] + refined_lag * dt_s)
+
+
+def _match_spot_departures(plan_layer, log_time_s, log_x, log_y, tolerance_mm):
+    """Pair plan spot times with the last log sample dwelling on that spot.
+
+    The current time model only picks candidate spots (within
+    ``SPOT_SEARCH_NEIGHBORS`` indices); the departure itself is taken from the
+    log positions so the fit is not biased towards the model being refined.
+    """
+    plan_time_s = np.asarray(plan_layer["time_axis_s"], dtype=float)
+    spot_x = np.asarray(plan_layer["trajectory_x_mm"], dtype=float)
+    spot_y = np.asarray(plan_layer["trajectory_y_mm"], dtype=float)
+
+    assigned = np.searchsorted(plan_time_s, log_time_s, side="left")
+    dwell_spot = np.full(log_time_s.shape, -1, dtype=int)
+    best_rank = np.full(log_time_s.shape, np.iinfo(int).max, dtype=int)
+    for shift in range(-SPOT_SEARCH_NEIGHBORS, SPOT_SEARCH_NEIGHBORS + 1):
+        candidate = np.clip(assigned + shift, 0, plan_time_s.size - 1)
+        on_spot = (
+            np.hypot(log_x - spot_x[candidate], log_y - spot_y[candidate])
+            < tolerance_mm
+        )
+        better = on_spot & (abs(shift) < best_rank)
+        dwell_spot[better] = candidate[better]
+        best_rank[better] = abs(shift)
+
+    sample_indices = np.flatnonzero(dwell_spot >= 0)
+    if sample_indices.size == 0:
+        return np.zeros(0, dtype=float), np.zeros(0, dtype=int)
+
+    reversed_samples = sample_indices[::-1]
+    unique_spots, first_in_reversed = np.unique(
+        dwell_spot[reversed_samples], return_index=True
+    )
+    departures = reversed_samples[first_in_reversed]
+    # The final spot and anything still dwelling at the end of the log have
+    # no observed departure.
+    observed = (unique_spots < plan_time_s.size - 1) & (departures < log_time_s.size - 1)
+    return plan_time_s[unique_spots[observed]], departures[observed]
+
+
+def fit_time_scale(
+    plan_layer,
+    log_time_s,
+    log_x,
+    log_y,
+    time_offset_s,
+    *,
+    tolerance_mm=DEFAULT_SPOT_TOLERANCE_MM,
+    max_scale_deviation=DEFAULT_MAX_SCALE_DEVIATION,
+):
+    """Fit ``log_time = scale * plan_time + offset`` on matched spot boundaries.
+
+    Returns ``(scale, offset, matches)``; falls back to ``(1.0, time_offset_s, n)``
+    when too few boundaries match or the fitted scale is implausible.
+    """
+    log_time_s = np.asarray(log_time_s, dtype=float)
+    log_x = np.asarray(log_x, dtype=float)
+    log_y = np.asarray(log_y, dtype=float)
+    scale = 1.0
+    offset = float(time_offset_s)
+    matches = 0
+
+    for _ in range(SCALE_FIT_MAX_ITERATIONS):
+        plan_boundary_s, log_indices = _match_spot_departures(
+            plan_layer,
+            (log_time_s - offset) / scale,
+            log_x,
+            log_y,
+            tolerance_mm,
+        )
+        matches = int(plan_boundary_s.size)
+        if matches < MIN_BOUNDARY_MATCHES or np.ptp(plan_boundary_s) <= 0:
+            return 1.0, float(time_offset_s), matches
+
+        design = np.column_stack((plan_boundary_s, np.ones_like(plan_boundary_s)))
+        (fitted_scale, fitted_offset), *_ = np.linalg.lstsq(
+            design, log_time_s[log_indices], rcond=None
+        )
+        if not np.isfinite(fitted_scale) or abs(fitted_scale - 1.0) > max_scale_deviation:
+            return 1.0, float(time_offset_s), matches
+        converged = abs(float(fitted_scale) - scale) < SCALE_FIT_CONVERGENCE
+        scale, offset = float(fitted_scale), float(fitted_offset)
+        if converged:
+            break
+
+    return scale, offset, matches
+
+
+def align_log_time(plan_layer, log_time_s, log_x, log_y, log_mu=None, config=None):
+    """Map rebased log time onto the plan time axis.
+
+    Returns ``(aligned_log_time_s, alignment_info)``.  When alignment is
+    disabled or cannot be estimated, the input time is returned unchanged.
+    """
+    config = config or {}
+    log_time_s = np.asarray(log_time_s, dtype=float)
+    if not bool(config.get("TIME_ALIGNMENT_ENABLED", False)):
+        return log_time_s, _identity_alignment()
+    if len(plan_layer.get("time_axis_s", [])) < 2 or log_time_s.size < 2:
+        return log_time_s, _identity_alignment()
+
+    time_offset_s = estimate_time_offset_s(
+        plan_layer,
+        log_time_s,
+        log_x,
+        log_y,
+        log_mu,
+        max_lag_s=float(config.get("TIME_ALIGNMENT_MAX_LAG_S", DEFAULT_MAX_LAG_S)),
+    )
+    if time_offset_s is None:
+        logger.warning("Time alignment skipped: no usable plan/log signal")
+        return log_time_s, _identity_alignment()
+
+    time_scale = 1.0
+    matches = 0
+    if bool(config.get("TIME_ALIGNMENT_FIT_SCALE", False)):
+        time_scale, time_offset_s, matches = fit_time_scale(
+            plan_layer,
+            log_time_s,
+            log_x,
+            log_y,
+            time_offset_s,
+            tolerance_mm=float(
+                config.get("TIME_ALIGNMENT_SPOT_TOLERANCE_MM", DEFAULT_SPOT_TOLERANCE_MM)
+            ),
+            max_scale_deviation=float(
+                config.get(
+                    "TIME_ALIGNMENT_MAX_SCALE_DEVIATION",
+                    DEFAULT_MAX_SCALE_DEVIATION,
+                )
+            ),
+        )
+
+    return (log_time_s - time_offset_s) / time_scale, {
+        "time_alignment_applied": True,
+        "time_offset_s": float(time_offset_s),
+        "time_scale": float(time_scale),
+        "time_alignment_boundary_matches": int(matches),
+    }
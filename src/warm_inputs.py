@@ -0,0 +1,70 @@
+"""
+In-memory cache of analysis inputs for long-running processes.
+
+``main.run_analysis`` parses ``config.yaml``, the RTPLAN and the machine's
+``scv_init_*.txt`` on every call.  ``WarmInputs`` keeps them between calls and
+re-reads a file only when its mtime changes; a changed ``config.yaml`` drops
+every cached plan, because plans are parsed with its zero-dose settings.  At
+most ``warm_inputs.max_plans`` plans are kept, least recently used first out,
+and callers :meth:`WarmInputs.release` a plan once its case has finished.
+Shared by ``src.watch_daemon`` and ``src.analysis_service``.
+"""
+
+from collections import OrderedDict
+import os
+import threading
+
+from main import app_config_path, load_analysis_inputs, load_app_config
+from src.config_loader import DEFAULT_WARM_INPUTS_CONFIG
+
+
+def _mtime_ns(path):
+    return os.stat(path).st_mtime_ns
+
+
+class WarmInputs:
+    """Thread-safe cache of the app config and ``(plan_data, machine_config)``."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._app_config = None
+        self._plans = OrderedDict()
+
+    def app_config(self):
+        mtime_ns = _mtime_ns(app_config_path())
+        with self._lock:
+            if self._app_config is None or self._app_config[0] != mtime_ns:
+                self._plans.clear()
+                self._app_config = (mtime_ns, load_app_config())
+            return self._app_config[1]
+
+    def plan_inputs(self, dcm_file, app_config=None):
+        """``load_analysis_inputs(dcm_file, app_config)``, cached by mtime."""
+        if app_config is None:
+            app_config = self.app_config()
+        max_plans = app_config.get(
+            "WARM_INPUTS_MAX_PLANS", DEFAULT_WARM_INPUTS_CONFIG["max_plans"]
+        )
+        key = os.path.abspath(dcm_file)
+        mtime_ns = _mtime_ns(dcm_file)
+        with self._lock:
+            cached = self._plans.get(key)
+            if cached is not None:
+                self._plans.move_to_end(key)
+        if cached is None or cached[0] != mtime_ns:
+            cached = (mtime_ns, load_analysis_inputs(dcm_file, app_config))
+            with self._lock:
+                self._plans[key] = cached
+                self._plans.move_to_end(key)
+                while len(self._plans) > max_plans:
+                    self._plans.popitem(last=False)
+        return cached[1]
+
+    def release(self, dcm_file):
+        """Drop the cached plan of ``dcm_file``, e.g. once its case finished."""
+        with self._lock:
+            self._plans.pop(os.path.abspath(dcm_file), None)
+
+    def cached_plan_count(self):
+        with self._lock:
+            return len(self._plans)
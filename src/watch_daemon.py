@@ -0,0 +1,221 @@
+"""
+Watch-folder daemon that analyzes deliveries as they land.
+
+The daemon polls the log root (inotify does not see writes made through most
+network-share clients, so polling is the portable choice).  Every
+subdirectory holding exactly one ``RP*.dcm`` is a case, as for
+``src.batch_runner``.  A case is analyzed once
+
+* its PTN files (names, sizes and mtimes) have not changed for
+  ``stability_s`` seconds, so files still being copied are never read, and
+* it holds at least as many PTN files as its plan has layers.
+
+A case is analyzed again only when its PTN files change afterwards.  Cases
+whose output directory already holds ``run_profile.json`` when they are
+first seen count as analyzed; ``run_analysis`` writes it last, so a run that
+failed or was killed is retried.  Finished cases are not listed again while
+their directories keep their mtimes (``DeliveryIndex.is_current``, one
+``stat`` per directory), so a PTN file rewritten in place without adding,
+removing or renaming files goes unnoticed.  The daemon process keeps the
+analysis modules imported, and keeps ``config.yaml`` and the parsed plans of pending cases with their calibration
+tables in memory (``src.warm_inputs``)::
+
+    python -m src.watch_daemon --root /data/SHI_log --output_root ./output
+"""
+
+import argparse
+import logging
+import os
+import time
+
+from main import derive_report_name, run_analysis
+from src.batch_runner import discover_cases
+from src.delivery_index import DeliveryIndex
+from src.run_profile import RUN_PROFILE_FILENAME
+from src.warm_inputs import WarmInputs
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POLL_INTERVAL_S = 5.0
+DEFAULT_STABILITY_S = 10.0
+
+
+def ptn_snapshot(log_dir, index=None):
+    """Sorted ``(relative path, size, mtime_ns)`` of the PTN files under ``log_dir``."""
+    if index is None:
+        index = DeliveryIndex.scan(log_dir)
+    snapshot = []
+    for path in index.all_ptn_files(log_dir):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            # Removed or renamed between listing and stat: still settling.
+            continue
+        snapshot.append((os.path.relpath(path, log_dir), stat.st_size, stat.st_mtime_ns))
+    return tuple(sorted(snapshot))
+
+
+class WatchDaemon:
+    """Poll ``root`` and run ``run_analysis`` on settled, complete cases."""
+
+    def __init__(
+        self,
+        root,
+        output_root,
+        poll_interval_s=DEFAULT_POLL_INTERVAL_S,
+        stability_s=DEFAULT_STABILITY_S,
+        workers=1,
+        clock=time.monotonic,
+    ):
+        self.root = root
+        self.output_root = output_root
+        self.poll_interval_s = poll_interval_s
+        self.stability_s = stability_s
+        self.workers = workers
+        self._clock = clock
+        self.inputs = WarmInputs()
+        self._seen = {}
+        self._analyzed = {}
+        # Directory index of each analyzed case whose files still match.
+        self._finished = {}
+
+    def _is_ready(self, case, snapshot, now):
+        log_dir = case["log_dir"]
+        seen = self._seen.get(log_dir)
+        # ``run_analysis`` creates the output directory before the first
+        # layer, but writes the run profile only once the run has finished.
+        completed = os.path.join(case["output"], RUN_PROFILE_FILENAME)
+        if seen is None and os.path.isfile(completed):
+            logger.info("Treating %s as analyzed: %s exists", log_dir, completed)
+            self._analyzed[log_dir] = snapshot
+        if seen is None or seen[0] != snapshot:
+            self._seen[log_dir] = (snapshot, now)
+            return False
+        if not snapshot or self._analyzed.get(log_dir) == snapshot:
+            return False
+        return now - seen[1] >= self.stability_s
+
+    def poll_once(self):
+        """Analyze every case that became ready; returns their log directories."""
+        now = self._clock()
+        analyzed = []
+        app_config = None
+        for case in discover_cases(self.root, self.output_root):
+            log_dir = case["log_dir"]
+            finished = self._finished.get(log_dir)
+            if finished is not None and finished.is_current(log_dir):
+                continue
+
+            index = DeliveryIndex.scan(log_dir)
+            snapshot = ptn_snapshot(log_dir, index)
+            ready = self._is_ready(case, snapshot, now)
+            if self._analyzed.get(log_dir) == snapshot:
+                self._finished[log_dir] = index
+            else:
+                self._finished.pop(log_dir, None)
+            if not ready:
+                continue
+
+            try:
+                if app_config is None:
+                    app_config = self.inputs.app_config()
+                plan_inputs = self.inputs.plan_inputs(case["dcm_file"], app_config)
+            except (FileNotFoundError, ValueError) as e:
+                logger.error("Cannot load plan for %s: %s", log_dir, e)
+                self._analyzed[log_dir] = snapshot
+                self._finished[log_dir] = index
+                continue
+
+            expected = sum(
+                len(beam.get("layers", {})) for beam in plan_inputs[0]["beams"].values()
+            )
+            if len(snapshot) < expected:
+                logger.debug(
+                    "Waiting for %s: %d of %d PTN files", log_dir, len(snapshot), expected
+                )
+                continue
+
+            logger.info("Analyzing %s (%d PTN files)", log_dir, len(snapshot))
+            # Recorded before running so a failing case is not retried until
+            # its files change.
+            self._analyzed[log_dir] = snapshot
+            self._finished[log_dir] = index
+            try:
+                run_analysis(
+                    log_dir,
+                    case["dcm_file"],
+                    case["output"],
+                    report_name=derive_report_name(log_dir),
+                    workers=self.workers,
+                    app_config=app_config,
+                    plan_inputs=plan_inputs,
+                )
+            except (FileNotFoundError, ValueError) as e:
+                logger.error("Analysis of %s failed: %s", log_dir, e)
+                continue
+            except Exception:
+                # One bad delivery must not stop the daemon.
+                logger.exception("Analysis of %s failed", log_dir)
+                continue
+            finally:
+                # The case is done; a rerun after its files change reloads the plan.
+                self.inputs.release(case["dcm_file"])
+            analyzed.append(log_dir)
+        return analyzed
+
+    def run_forever(self):
+        logger.info(
+            "Watching %s every %.1f s (stability window %.1f s)",
+            self.root,
+            self.poll_interval_s,
+            self.stability_s,
+        )
+        while True:
+            started = self._clock()
+            self.poll_once()
+            time.sleep(max(0.0, self.poll_interval_s - (self._clock() - started)))
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(
+        description="Watch a log root and analyze deliveries as soon as they are complete."
+    )
+    parser.add_argument("--root", required=True, help="Log root holding one directory per case")
+    parser.add_argument(
+        "--output_root", default="output", help="Output parent directory (default: output)"
+    )
+    parser.add_argument(
+        "--poll_interval",
+        type=float,
+        default=DEFAULT_POLL_INTERVAL_S,
+        help=f"Seconds between scans (default: {DEFAULT_POLL_INTERVAL_S})",
+    )
+    parser.add_argument(
+        "--stability",
+        type=float,
+        default=DEFAULT_STABILITY_S,
+        help=f"Seconds PTN files must stay unchanged before analysis (default: {DEFAULT_STABILITY_S})",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1, help="Layer worker processes per case"
+    )
+    args = parser.parse_args()
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    daemon = WatchDaemon(
+        args.root,
+        args.output_root,
+        poll_interval_s=args.poll_interval,
+        stability_s=args.stability,
+        workers=args.workers,
+    )
+    try:
+        daemon.run_forever()
+    except KeyboardInterrupt:
+        logger.info("Stopped.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+from concurrent.futures.process import BrokenProcessPool
+import json
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+import urllib.error
+import urllib.request
+
+from src import analysis_service, warm_inputs
+from src.analysis_client import _request, analyze, status
+from src.analysis_service import AnalysisService, read_token_file, serve
+
+
+class TestAnalysisService(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.dcm_file = os.path.join(self.tmpdir.name, "RP.plan.dcm")
+        open(self.dcm_file, "wb").close()
+        app_config_file = os.path.join(self.tmpdir.name, "config.yaml")
+        open(app_config_file, "w").close()
+
+        self.load_inputs = mock.Mock(return_value=({"beams": {}}, {}))
+        self.run_analysis = mock.Mock(
+            return_value={
+                "_report_paths": ["out/report.pdf"],
+                "Beam 1": {"beam_number": 1, "layers": [{}, {}]},
+            }
+        )
+        patches = [
+            mock.patch.object(warm_inputs, "app_config_path", return_value=app_config_file),
+            mock.patch.object(warm_inputs, "load_app_config", return_value={}),
+            mock.patch.object(warm_inputs, "load_analysis_inputs", self.load_inputs),
+            mock.patch.object(analysis_service, "run_analysis", self.run_analysis),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+        self.service = AnalysisService()
+        self.token_file = os.path.join(self.tmpdir.name, "service.token")
+        self.server = serve(self.service, port=0, token_file=self.token_file)
+        self.token = read_token_file(self.token_file)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.service.shutdown()
+        self.tmpdir.cleanup()
+
+    def test_analyze_waits_for_result_and_reuses_cached_plan(self):
+        log_dir = os.path.join(self.tmpdir.name, "55758663")
+
+        first = analyze(self.url, log_dir, self.dcm_file, "out", token=self.token)
+        second = analyze(self.url, log_dir, self.dcm_file, "out", workers=2, token=self.token)
+
+        self.assertEqual("done", first["status"])
+        self.assertEqual(["out/report.pdf"], first["report_paths"])
+        self.assertEqual({"Beam 1": 2}, first["layers"])
+        self.assertEqual("2", second["id"])
+        self.load_inputs.assert_called_once()
+        kwargs = self.run_analysis.call_args.kwargs
+        self.assertEqual(2, kwargs["workers"])
+        self.assertEqual(self.load_inputs.return_value, kwargs["plan_inputs"])
+        self.assertTrue(kwargs["report_name"].startswith("PTN_report_55758663_"))
+
+        service_status = status(self.url, token=self.token)
+        self.assertEqual(1, service_status["cached_plans"])
+        self.assertEqual(["done", "done"], [job["status"] for job in service_status["jobs"]])
+
+    def test_failed_job_and_bad_requests_report_errors(self):
+        self.run_analysis.side_effect = ValueError("No analysis results were generated.")
+
+        failed = analyze(self.url, self.tmpdir.name, self.dcm_file, "out", token=self.token)
+        queued = analyze(
+            self.url, self.tmpdir.name, self.dcm_file, "out", wait=False, token=self.token
+        )
+        self.service.wait(queued["id"])
+
+        self.assertEqual("failed", failed["status"])
+        self.assertIn("No analysis results", failed["error"])
+        self.assertEqual("queued", queued["status"])
+        self.assertEqual("failed", status(self.url, queued["id"], token=self.token)["status"])
+        self.assertIn("error", status(self.url, "999", token=self.token))
+        self.assertIn(
+            "log_dir",
+            _request(f"{self.url}/analyze", {"dcm_file": "x"}, token=self.token)["error"],
+        )
+
+    def test_requests_need_the_token_and_a_json_body(self):
+        job = {"log_dir": "a", "dcm_file": self.dcm_file, "output": "out"}
+
+        def post(headers):
+            request = urllib.request.Request(
+                f"{self.url}/analyze", data=json.dumps(job).encode("utf-8"), headers=headers
+            )
+            with self.assertRaises(urllib.error.HTTPError) as raised:
+                urllib.request.urlopen(request)
+            return raised.exception.code
+
+        authorization = {"Authorization": f"Bearer {self.token}"}
+        self.assertEqual(0o600, os.stat(self.token_file).st_mode & 0o777)
+        self.assertEqual(401, post({"Content-Type": "application/json"}))
+        self.assertEqual(
+            401,
+            post({"Content-Type": "application/json", "Authorization": "Bearer guess"}),
+        )
+        self.assertEqual(415, post({"Content-Type": "text/plain", **authorization}))
+        self.assertIn("error", status(self.url, token="guess"))
+        self.run_analysis.assert_not_called()
+
+    def test_layer_pool_is_shared_by_jobs_and_replaced_when_broken(self):
+        pools = [mock.Mock(name="pool"), mock.Mock(name="replacement")]
+        with mock.patch.object(analysis_service, "start_layer_worker_pool", side_effect=pools):
+            service = AnalysisService(workers=2)
+            request = {"log_dir": "a", "dcm_file": self.dcm_file, "output": "out"}
+            for _ in range(2):
+                service.wait(service.submit(request)["id"])
+            self.run_analysis.side_effect = BrokenProcessPool("worker died")
+            broken = service.wait(service.submit(request)["id"])
+            self.run_analysis.side_effect = None
+            service.wait(service.submit(request)["id"])
+            service.shutdown()
+
+        executors = [call.kwargs["layer_executor"] for call in self.run_analysis.call_args_list]
+        self.assertEqual(pools[:1] * 3 + pools[1:], executors)
+        self.assertEqual("failed", broken["status"])
+        pools[0].shutdown.assert_called_once_with(wait=False)
+        pools[1].shutdown.assert_called_once_with(wait=True)
+
+    def test_memory_mode_jobs_run_alone(self):
+        running = []
+        overlaps = []
+        lock = threading.Lock()
+
+        def run_analysis(*args, **kwargs):
+            with lock:
+                running.append(args[0])
+                overlaps.append(len(running))
+            threading.Event().wait(0.05)
+            with lock:
+                running.remove(args[0])
+            return self.run_analysis.return_value
+
+        service = AnalysisService(max_jobs=2)
+        self.addCleanup(service.shutdown)
+        with mock.patch.object(warm_inputs, "load_app_config", return_value={"PROFILE_MEMORY": True}), \
+                mock.patch.object(analysis_service, "run_analysis", side_effect=run_analysis):
+            job_ids = [
+                service.submit({"log_dir": log_dir, "dcm_file": self.dcm_file, "output": "out"})["id"]
+                for log_dir in ("a", "b", "c")
+            ]
+            jobs = [service.wait(job_id) for job_id in job_ids]
+
+        self.assertEqual(["done"] * 3, [job["status"] for job in jobs])
+        self.assertEqual([1, 1, 1], overlaps)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+import numpy as np
+
+from src.async_ptn_loader import load_ptn_files
+from src.log_parser import parse_ptn_file, read_ptn_raw
+from src.ptn_prefetch import PtnPrefetcher
+
+READ_DELAY_S = 0.05
+CONFIG = {
+    "TIMEGAIN": 10.0,
+    "XPOSOFFSET": 500.0,
+    "YPOSOFFSET": 1500.0,
+    "XPOSGAIN": 0.1,
+    "YPOSGAIN": 0.2,
+}
+
+
+class SlowFileSystem:
+    """``read_ptn_raw`` with a fixed per-file latency, like a remote share."""
+
+    def __init__(self, delay_s=READ_DELAY_S):
+        self.delay_s = delay_s
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, path):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.delay_s)
+            return read_ptn_raw(path)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+class TestAsyncPtnLoader(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.paths = []
+        for idx in range(16):
+            path = os.path.join(self.tmpdir.name, f"layer_{idx:03d}.ptn")
+            np.array(
+                [1000 + idx, 2000, 300, 400, 50, 60, 1, 50000] * 2, dtype=">u2"
+            ).tofile(path)
+            self.paths.append(path)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_concurrent_loads_match_parse_ptn_file_in_order(self):
+        slow_fs = SlowFileSystem()
+        paths = self.paths + [os.path.join(self.tmpdir.name, "missing.ptn")]
+
+        start = time.perf_counter()
+        results = load_ptn_files(paths, CONFIG, concurrency=8, reader=slow_fs)
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(8, slow_fs.max_in_flight)
+        self.assertLess(elapsed, len(paths) * READ_DELAY_S / 2)
+        for path, log_data in zip(self.paths, results):
+            expected = parse_ptn_file(path, CONFIG)
+            np.testing.assert_array_equal(expected["x_raw"], log_data["x_raw"])
+        self.assertIsInstance(results[-1], FileNotFoundError)
+
+    def test_prefetcher_keeps_concurrent_reads_within_window(self):
+        slow_fs = SlowFileSystem()
+
+        start = time.perf_counter()
+        with PtnPrefetcher(
+            self.paths, depth=7, reader=slow_fs, concurrency=4
+        ) as prefetcher:
+            words = [(path, raw.result()) for path, raw in prefetcher]
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(self.paths, [path for path, _ in words])
+        self.assertEqual(4, slow_fs.max_in_flight)
+        self.assertLess(elapsed, len(self.paths) * READ_DELAY_S / 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import csv
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from src import batch_runner
+from src.batch_runner import discover_cases, load_manifest, run_batch
+
+
+def _read_rows(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+
+class TestBatchRunner(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = self.tmpdir.name
+        self.status_path = os.path.join(self.root, "out", "batch_status.csv")
+        self.cases = [
+            {
+                "log_dir": os.path.join(self.root, name),
+                "dcm_file": os.path.join(self.root, name, "RP.plan.dcm"),
+                "output": os.path.join(self.root, "out", name),
+            }
+            for name in ("case_a", "case_b", "case_c")
+        ]
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_load_manifest_reads_csv_and_yaml(self):
+        csv_path = os.path.join(self.root, "cases.csv")
+        with open(csv_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=["log_dir", "dcm_file", "output"])
+            writer.writeheader()
+            writer.writerows(self.cases)
+        yaml_path = os.path.join(self.root, "cases.yaml")
+        with open(yaml_path, "w", encoding="utf-8") as f:
+            f.write("cases:\n")
+            for case in self.cases:
+                f.write(f"  - log_dir: {case['log_dir']}\n")
+                f.write(f"    dcm_file: {case['dcm_file']}\n")
+                f.write(f"    output: {case['output']}\n")
+
+        self.assertEqual(self.cases, load_manifest(csv_path))
+        self.assertEqual(self.cases, load_manifest(yaml_path))
+
+    def test_discover_cases_uses_subdirectories_with_one_rtplan(self):
+        for case in self.cases:
+            os.makedirs(case["log_dir"])
+            open(case["dcm_file"], "wb").close()
+        open(os.path.join(self.root, "case_c", "RP.other.dcm"), "wb").close()
+        os.makedirs(os.path.join(self.root, "no_plan"))
+
+        cases = discover_cases(self.root, os.path.join(self.root, "out"))
+
+        self.assertEqual(self.cases[:2], cases)
+
+    def test_run_batch_records_status_and_skips_completed_cases_on_restart(self):
+        def fake_run_analysis(log_dir, dcm_file, output_dir, report_name=None, workers=1):
+            if log_dir.endswith("case_b"):
+                raise ValueError("No analysis results were generated.")
+            return {"_report_paths": [os.path.join(output_dir, f"{report_name}.pdf")]}
+
+        with mock.patch.object(
+            batch_runner, "run_analysis", side_effect=fake_run_analysis
+        ) as run_mock:
+            run_batch(self.cases, self.status_path)
+
+        rows = _read_rows(self.status_path)
+        self.assertEqual(["done", "failed", "done"], [row["status"] for row in rows])
+        self.assertIn("ValueError", rows[1]["error"])
+        self.assertTrue(rows[0]["report_paths"].endswith(".pdf"))
+        self.assertTrue(all(float(row["elapsed_s"]) >= 0.0 for row in rows))
+        self.assertEqual(3, run_mock.call_count)
+
+        with mock.patch.object(
+            batch_runner, "run_analysis", return_value={"_report_paths": []}
+        ) as rerun_mock:
+            rows = run_batch(self.cases, self.status_path)
+
+        self.assertEqual(
+            [call.args[0] for call in rerun_mock.call_args_list],
+            [self.cases[1]["log_dir"]],
+        )
+        self.assertEqual(["done", "done", "done"], [row["status"] for row in rows])
+        self.assertEqual(
+            ["done", "done", "done"],
+            [row["status"] for row in _read_rows(self.status_path)],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
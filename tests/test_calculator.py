@@ -47,6 +47,11 @@ class TestCalculator(unittest.TestCase):
             'hist_fit_x', 'hist_fit_y',
         ):
             self.assertIn(key, results, f"Missing key: {key}")
+        self.assertEqual(3, results['stats_accumulator_x'].count)
+        self.assertEqual(
+            results['stats_accumulator_y'].abs_percentile(95),
+            results['p95_abs_diff_y'],
+        )
 
     def test_calculator_reports_time_overlap_fraction(self):
         plan_layer = {
@@ -121,6 +121,10 @@ class TestConfigLoader(unittest.TestCase):
         config = parse_yaml_config(yaml_path)
 
         self.assertEqual(config["ANALYSIS_MODE"], "point_gamma")
+        self.assertEqual(config["GAMMA_SEARCH_MODE"], "time_locked")
+        self.assertEqual(config["GAMMA_SEARCH_RADIUS_FACTOR"], 2.0)
+        self.assertEqual(config["GAMMA_TIME_GRID"], "fixed")
+        self.assertEqual(config["GAMMA_ADAPTIVE_COARSE_FACTOR"], 16)
         self.assertEqual(config["GAMMA_FLUENCE_PERCENT_THRESHOLD"], 5.0)
         self.assertEqual(config["GAMMA_DISTANCE_MM_THRESHOLD"], 2.0)
         self.assertNotIn("GAMMA_SPOT_TOLERANCE_MM", config)
@@ -147,6 +151,24 @@ class TestConfigLoader(unittest.TestCase):
 
         self.assertEqual(config["ANALYSIS_MODE"], "point_gamma")
 
+    def test_parse_yaml_config_validates_debug_output_format(self):
+        yaml_path = os.path.join(self.test_dir, "config.yaml")
+        for value, expected in (("NPZ", "npz"), ("parquet", None)):
+            with open(yaml_path, "w", encoding="utf-8") as f:
+                f.write("app:\n")
+                f.write("  report_style_summary: true\n")
+                f.write("  export_pdf_report: false\n")
+                f.write("  export_report_csv: false\n")
+                f.write("  save_debug_csv: true\n")
+                f.write("  report_detail_pdf: false\n")
+                f.write(f"  debug_output_format: {value}\n")
+
+            if expected is None:
+                with self.assertRaises(ValueError):
+                    parse_yaml_config(yaml_path)
+            else:
+                self.assertEqual(expected, parse_yaml_config(yaml_path)["DEBUG_OUTPUT_FORMAT"])
+
     def test_parse_yaml_config_maps_machine_specific_normalization_factors(self):
         yaml_path = os.path.join(self.test_dir, "config.yaml")
         with open(yaml_path, "w", encoding="utf-8") as f:
@@ -254,6 +276,189 @@ class TestConfigLoader(unittest.TestCase):
         self.assertNotIn("GAMMA_SPOT_TOLERANCE_MM", config)
         self.assertNotIn("GAMMA_GAUSSIAN_SIGMA_MM", config)
 
+    def test_parse_yaml_config_maps_time_alignment_settings(self):
+        yaml_path = os.path.join(self.test_dir, "config.yaml")
+        with open(yaml_path, "w", encoding="utf-8") as f:
+            f.write("app:\n")
+            f.write("  report_style_summary: true\n")
+            f.write("  export_pdf_report: false\n")
+            f.write("  export_report_csv: false\n")
+            f.write("  save_debug_csv: false\n")
+            f.write("  report_detail_pdf: false\n")
+            f.write("time_alignment:\n")
+            f.write("  enabled: true\n")
+            f.write("  max_lag_s: 0.02\n")
+            f.write("  fit_time_scale: true\n")
+
+        config = parse_yaml_config(yaml_path)
+
+        self.assertTrue(config["TIME_ALIGNMENT_ENABLED"])
+        self.assertEqual(config["TIME_ALIGNMENT_MAX_LAG_S"], 0.02)
+        self.assertTrue(config["TIME_ALIGNMENT_FIT_SCALE"])
+        self.assertEqual(config["TIME_ALIGNMENT_SPOT_TOLERANCE_MM"], 1.0)
+
+    def test_parse_yaml_config_maps_directory_index_cache_setting(self):
+        yaml_path = os.path.join(self.test_dir, "config.yaml")
+        with open(yaml_path, "w", encoding="utf-8") as f:
+            f.write("app:\n")
+            f.write("  report_style_summary: true\n")
+            f.write("  export_pdf_report: false\n")
+            f.write("  export_report_csv: false\n")
+            f.write("  save_debug_csv: false\n")
+            f.write("  report_detail_pdf: false\n")
+            f.write("cache:\n")
+            f.write("  directory_index: true\n")
+
+        config = parse_yaml_config(yaml_path)
+
+        self.assertTrue(config["DIRECTORY_INDEX_CACHE_ENABLED"])
+        self.assertFalse(config["LAYER_CACHE_ENABLED"])
+        self.assertIsNone(config["LAYER_CACHE_DIR"])
+
+    def test_parse_yaml_config_maps_and_validates_io_settings(self):
+        yaml_path = os.path.join(self.test_dir, "config.yaml")
+        for depth, expected in (("2", 2), ("-1", None)):
+            with open(yaml_path, "w", encoding="utf-8") as f:
+                f.write("app:\n")
+                f.write("  report_style_summary: true\n")
+                f.write("  export_pdf_report: false\n")
+                f.write("  export_report_csv: false\n")
+                f.write("  save_debug_csv: false\n")
+                f.write("  report_detail_pdf: false\n")
+                f.write("io:\n")
+                f.write(f"  prefetch_depth: {depth}\n")
+
+            if expected is None:
+                with self.assertRaises(ValueError):
+                    parse_yaml_config(yaml_path)
+                continue
+            config = parse_yaml_config(yaml_path)
+            self.assertEqual(config["PTN_PREFETCH_DEPTH"], expected)
+            self.assertEqual(config["PTN_PREFETCH_MAX_MB"], 256.0)
+            self.assertEqual(config["PTN_READ_CONCURRENCY"], 1)
+
+    def test_parse_yaml_config_maps_and_validates_warm_inputs_settings(self):
+        yaml_path = os.path.join(self.test_dir, "config.yaml")
+        for max_plans, expected in (("3", 3), ("0", None)):
+            with open(yaml_path, "w", encoding="utf-8") as f:
+                f.write("app:\n")
+                f.write("  report_style_summary: true\n")
+                f.write("  export_pdf_report: false\n")
+                f.write("  export_report_csv: false\n")
+                f.write("  save_debug_csv: false\n")
+                f.write("  report_detail_pdf: false\n")
+                f.write("warm_inputs:\n")
+                f.write(f"  max_plans: {max_plans}\n")
+
+            if expected is None:
+                with self.assertRaisesRegex(ValueError, "WARM_INPUTS_MAX_PLANS"):
+                    parse_yaml_config(yaml_path)
+                continue
+            self.assertEqual(parse_yaml_config(yaml_path)["WARM_INPUTS_MAX_PLANS"], expected)
+
+    def test_parse_yaml_config_maps_and_validates_profiling_settings(self):
+        yaml_path = os.path.join(self.test_dir, "config.yaml")
+        for stages, expected in (
+            ("[Gamma, ptn_read]", ("gamma", "ptn_read")),
+            ("[calculate_point_gamma_for_layer]", None),
+        ):
+            with open(yaml_path, "w", encoding="utf-8") as f:
+                f.write("app:\n")
+                f.write("  report_style_summary: true\n")
+                f.write("  export_pdf_report: false\n")
+                f.write("  export_report_csv: false\n")
+                f.write("  save_debug_csv: false\n")
+                f.write("  report_detail_pdf: false\n")
+                f.write("profiling:\n")
+                f.write("  enabled: true\n")
+                f.write(f"  stages: {stages}\n")
+
+            if expected is None:
+                with self.assertRaises(ValueError):
+                    parse_yaml_config(yaml_path)
+                continue
+            config = parse_yaml_config(yaml_path)
+            self.assertTrue(config["PROFILE_ENABLED"])
+            self.assertEqual(config["PROFILE_STAGES"], expected)
+            self.assertFalse(config["PROFILE_MEMORY"])
+            self.assertIsNone(config["MEMORY_BUDGET_MB"])
+            self.assertEqual(config["MEMORY_TOP_ALLOCATORS"], 5)
+
+        with open(yaml_path, "w", encoding="utf-8") as f:
+            f.write("app:\n")
+            f.write("  report_style_summary: true\n")
+            f.write("  export_pdf_report: false\n")
+            f.write("  export_report_csv: false\n")
+            f.write("  save_debug_csv: false\n")
+            f.write("  report_detail_pdf: false\n")
+            f.write("profiling:\n")
+            f.write("  memory_budget_mb: 0\n")
+        with self.assertRaisesRegex(ValueError, "MEMORY_BUDGET_MB"):
+            parse_yaml_config(yaml_path)
+
+    def test_parse_yaml_config_maps_point_gamma_criteria(self):
+        yaml_path = os.path.join(self.test_dir, "config.yaml")
+        for normalization, valid in (("LOCAL", True), ("relative", False)):
+            with open(yaml_path, "w", encoding="utf-8") as f:
+                f.write("app:\n")
+                f.write("  report_style_summary: true\n")
+                f.write("  export_pdf_report: false\n")
+                f.write("  export_report_csv: false\n")
+                f.write("  save_debug_csv: false\n")
+                f.write("  report_detail_pdf: false\n")
+                f.write("  analysis_mode: point_gamma\n")
+                f.write("point_gamma:\n")
+                f.write("  criteria:\n")
+                f.write("    - {fluence_percent_threshold: 1, distance_mm_threshold: 1}\n")
+                f.write(
+                    "    - {fluence_percent_threshold: 2, distance_mm_threshold: 2, "
+                    f"normalization: {normalization}}}\n"
+                )
+
+            if not valid:
+                with self.assertRaisesRegex(ValueError, "normalization"):
+                    parse_yaml_config(yaml_path)
+                continue
+            config = parse_yaml_config(yaml_path)
+            self.assertEqual(
+                [
+                    {
+                        "fluence_percent_threshold": 1.0,
+                        "distance_mm_threshold": 1.0,
+                        "normalization": "global",
+                    },
+                    {
+                        "fluence_percent_threshold": 2.0,
+                        "distance_mm_threshold": 2.0,
+                        "normalization": "local",
+                    },
+                ],
+                config["GAMMA_CRITERIA"],
+            )
+
+    def test_parse_yaml_config_maps_fluence_gamma_settings(self):
+        yaml_path = os.path.join(self.test_dir, "config.yaml")
+        for sigma_line, expected_sigma in (("", None), ("  spot_sigma_mm: 4\n", 4.0)):
+            with open(yaml_path, "w", encoding="utf-8") as f:
+                f.write("app:\n")
+                f.write("  report_style_summary: true\n")
+                f.write("  export_pdf_report: false\n")
+                f.write("  export_report_csv: false\n")
+                f.write("  save_debug_csv: false\n")
+                f.write("  report_detail_pdf: false\n")
+                f.write("  analysis_mode: fluence_gamma\n")
+                f.write("fluence_gamma:\n")
+                f.write("  distance_mm: 3.0\n")
+                f.write(sigma_line)
+
+            config = parse_yaml_config(yaml_path)
+
+            self.assertEqual(config["ANALYSIS_MODE"], "fluence_gamma")
+            self.assertEqual(config["FLUENCE_GAMMA_DISTANCE_MM"], 3.0)
+            self.assertEqual(config["FLUENCE_GAMMA_DOSE_PERCENT"], 3.0)
+            self.assertEqual(config["FLUENCE_GAMMA_GRID_RESOLUTION_MM"], 0.5)
+            self.assertEqual(config["FLUENCE_GAMMA_SPOT_SIGMA_MM"], expected_sigma)
+
 
 if __name__ == "__main__":
     unittest.main()
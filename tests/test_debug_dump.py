@@ -0,0 +1,106 @@
+import os
+import tempfile
+import unittest
+import zipfile
+
+import numpy as np
+
+from src.calculator import DEBUG_COLUMNS, calculate_differences_for_layer
+from src.debug_dump import (
+    DebugDumpWriter,
+    debug_dump_path,
+    export_layer_csv,
+    open_member_memmap,
+    read_debug_layer,
+)
+
+
+def _layer_inputs(offset):
+    plan_layer = {
+        "time_axis_s": np.array([0.0, 1.0, 2.0]),
+        "trajectory_x_mm": np.array([0.0, 3.0, 6.0]),
+        "trajectory_y_mm": np.array([0.0, 4.0, 4.0]),
+        "cumulative_mu": np.array([1.0, 3.0, 6.0]),
+    }
+    log_data = {
+        "time_ms": np.array([0.0, 1000.0, 2000.0]),
+        "x": np.array([0.0, 3.0, 6.0]) + offset,
+        "y": np.array([0.0, 4.0, 4.0]),
+        "x_raw": np.array([10.0, 11.0, 12.0]),
+        "y_raw": np.array([20.0, 21.0, 22.0]),
+        "layer_num": np.array([2.0, 2.0, 2.0]),
+        "beam_on_off": np.array([50000.0, 50000.0, 50000.0]),
+        "mu": np.array([0.5, 2.5, 5.0]),
+    }
+    return plan_layer, log_data
+
+
+class TestDebugDump(unittest.TestCase):
+    def test_beam_dump_round_trips_layers_and_matches_legacy_csv(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            dump_path = debug_dump_path(tmpdir, 1)
+            writer = DebugDumpWriter(dump_path)
+            for layer_number, offset in ((1, 0.0), (2, 0.25)):
+                plan_layer, log_data = _layer_inputs(offset)
+                calculate_differences_for_layer(
+                    plan_layer,
+                    log_data,
+                    debug_sink=writer.layer_sink(layer_number),
+                )
+            self.assertEqual(dump_path, writer.close())
+
+            legacy_csv = os.path.join(tmpdir, "legacy.csv")
+            plan_layer, log_data = _layer_inputs(0.25)
+            calculate_differences_for_layer(
+                plan_layer, log_data, save_to_csv=True, csv_filename=legacy_csv
+            )
+            converted_csv = export_layer_csv(dump_path, 2)
+
+            layer_two = read_debug_layer(dump_path, 2)
+            with open(legacy_csv, encoding="utf-8") as legacy, open(
+                converted_csv, encoding="utf-8"
+            ) as converted:
+                self.assertEqual(legacy.read(), converted.read())
+
+        self.assertEqual(set(DEBUG_COLUMNS), set(layer_two))
+        np.testing.assert_allclose([0.25, 3.25, 6.25], layer_two["log_x"])
+
+    def test_columns_are_memory_mapped_from_the_zip(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            writer = DebugDumpWriter(debug_dump_path(tmpdir, 2))
+            for layer_number, length in ((1, 5), (3, 40000)):
+                writer.add_layer(
+                    layer_number,
+                    {name: np.arange(length, dtype=float) + layer_number for name in DEBUG_COLUMNS},
+                )
+            dump_path = writer.close()
+
+            with zipfile.ZipFile(dump_path) as zip_file:
+                column = open_member_memmap(dump_path, zip_file, "log_x")
+                self.assertIsInstance(column, np.memmap)
+                with np.load(dump_path) as dump:
+                    np.testing.assert_array_equal(dump["log_x"], column)
+                del column
+            layer_one = read_debug_layer(dump_path, 1)
+
+        np.testing.assert_array_equal(np.arange(5, dtype=float) + 1, layer_one["log_x"])
+
+    def test_missing_layer_raises_key_error(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            writer = DebugDumpWriter(debug_dump_path(tmpdir, 3))
+            writer.add_layer(1, {name: np.zeros(2) for name in DEBUG_COLUMNS})
+            dump_path = writer.close()
+
+            with self.assertRaises(KeyError):
+                read_debug_layer(dump_path, 5)
+
+    def test_close_without_layers_writes_nothing(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            writer = DebugDumpWriter(debug_dump_path(tmpdir, 1))
+
+            self.assertIsNone(writer.close())
+            self.assertEqual([], os.listdir(tmpdir))
+
+
+if __name__ == "__main__":
+    unittest.main()
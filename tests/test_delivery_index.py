@@ -0,0 +1,142 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from src import delivery_index
+from src.delivery_index import DeliveryIndex, load_delivery_index
+from src.planrange_parser import parse_planrange_for_directory
+
+PLANRANGE_HEADER = (
+    "RESULT_ID,LAYER_NO,LAYER_ENERGY,PATIENT_ID,FLD_NO,DOSE1_RANGE,"
+    "DOSE2_RANGE,PLAN_DOSE1_RANGE,PLAN_DOSE2_RANGE,SCAN_OUT_FL_NM\n"
+)
+
+
+def _touch(path, content=b"ptn"):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as handle:
+        handle.write(content)
+
+
+class TestDeliveryIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.log_dir = os.path.join(self.tmpdir.name, "case")
+        self.cache_dir = os.path.join(self.tmpdir.name, "cache")
+        _touch(os.path.join(self.log_dir, "direct.ptn"))
+        for name in ("b.ptn", "a.ptn"):
+            _touch(os.path.join(self.log_dir, "0722", "run", name))
+        _touch(os.path.join(self.log_dir, "0721", "c.ptn"))
+        os.makedirs(os.path.join(self.log_dir, "empty"))
+        _touch(
+            os.path.join(self.log_dir, "0721", "PlanRange.txt"),
+            (PLANRANGE_HEADER + "1,1,150.0,P,1,2,3,4,3,c.ptn\n").encode(),
+        )
+        _touch(
+            os.path.join(self.log_dir, "0721", "PlanInfo.txt"),
+            b"DICOM_BEAM_NUMBER,3\n",
+        )
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    @unittest.skipUnless(hasattr(os, "symlink"), "needs symlinks")
+    def test_symlinks_are_followed_like_the_previous_os_walk(self):
+        linked_group = os.path.join(self.tmpdir.name, "linked_group")
+        linked_run = os.path.join(self.tmpdir.name, "linked_run")
+        _touch(os.path.join(linked_group, "x.ptn"))
+        _touch(os.path.join(linked_run, "y.ptn"))
+        os.symlink(linked_group, os.path.join(self.log_dir, "0723"))
+        os.symlink(linked_run, os.path.join(self.log_dir, "0722", "link"))
+
+        groups = DeliveryIndex.scan(self.log_dir).delivery_groups(self.log_dir)
+
+        # Each group directory is walked with os.walk, which lists a
+        # symlinked group directory but does not descend into symlinks below it.
+        for group in groups[1:]:
+            walked = sorted(
+                os.path.join(root, name)
+                for root, _, files in os.walk(group["source_dir"])
+                for name in files
+                if name.endswith(".ptn")
+            )
+            self.assertEqual(walked, group["ptn_files"])
+        self.assertEqual(
+            [os.path.join(self.log_dir, "0723", "x.ptn")], groups[3]["ptn_files"]
+        )
+        self.assertNotIn(
+            os.path.join(self.log_dir, "0722", "link", "y.ptn"), groups[2]["ptn_files"]
+        )
+
+    def test_delivery_groups_follow_directory_order(self):
+        groups = DeliveryIndex.scan(self.log_dir).delivery_groups(self.log_dir)
+
+        self.assertEqual(
+            [self.log_dir, os.path.join(self.log_dir, "0721"), os.path.join(self.log_dir, "0722")],
+            [group["source_dir"] for group in groups],
+        )
+        self.assertEqual(
+            [
+                os.path.join(self.log_dir, "0722", "run", "a.ptn"),
+                os.path.join(self.log_dir, "0722", "run", "b.ptn"),
+            ],
+            groups[2]["ptn_files"],
+        )
+        self.assertEqual(3, groups[1]["beam_number"])
+        self.assertIsNone(groups[0]["beam_number"])
+        subdir = os.path.join(self.log_dir, "0721")
+        self.assertEqual(
+            parse_planrange_for_directory(subdir), groups[1]["planrange_lookup"]
+        )
+        self.assertEqual(
+            parse_planrange_for_directory(self.log_dir),
+            groups[0]["planrange_lookup"],
+        )
+
+    def test_cached_index_is_reused_without_listing_directories(self):
+        first = load_delivery_index(self.log_dir, cache_dir=self.cache_dir)
+
+        with mock.patch.object(
+            delivery_index.os, "scandir", side_effect=AssertionError("rescanned")
+        ):
+            cached = load_delivery_index(self.log_dir, cache_dir=self.cache_dir)
+
+        self.assertEqual(
+            first.delivery_groups(self.log_dir), cached.delivery_groups(self.log_dir)
+        )
+
+    def test_cached_index_is_rebuilt_after_directory_change(self):
+        load_delivery_index(self.log_dir, cache_dir=self.cache_dir)
+        new_file = os.path.join(self.log_dir, "0722", "run", "c.ptn")
+        _touch(new_file)
+        run_dir = os.path.dirname(new_file)
+        stat = os.stat(run_dir)
+        # Guard against coarse filesystem timestamps.
+        os.utime(run_dir, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+        groups = load_delivery_index(
+            self.log_dir, cache_dir=self.cache_dir
+        ).delivery_groups(self.log_dir)
+
+        self.assertIn(new_file, groups[2]["ptn_files"])
+
+    def test_cached_index_is_rebuilt_after_planrange_edit(self):
+        load_delivery_index(self.log_dir, cache_dir=self.cache_dir)
+        _touch(
+            os.path.join(self.log_dir, "0721", "PlanRange.txt"),
+            (PLANRANGE_HEADER + "1,1,170.25,P,1,2,3,4,3,c.ptn\n").encode(),
+        )
+
+        groups = load_delivery_index(
+            self.log_dir, cache_dir=self.cache_dir
+        ).delivery_groups(self.log_dir)
+
+        range_info = groups[1]["planrange_lookup"][
+            os.path.abspath(os.path.join(self.log_dir, "0721", "c.ptn"))
+        ]
+        self.assertEqual(170.25, range_info.energy)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,164 @@
+import unittest
+
+import numpy as np
+
+from src.fluence_gamma import (
+    _deposit,
+    _gaussian_convolve,
+    calculate_fluence_gamma_for_layer,
+    fluence_gamma_map,
+    prepare_fluence_gamma_intermediates,
+)
+
+SAMPLES_PER_SPOT = 10
+
+
+def _synthetic_layer(shift_x_mm=0.0, corrected=True):
+    grid = np.arange(-10.0, 15.0, 5.0)
+    xx, yy = np.meshgrid(grid, grid)
+    positions = np.column_stack((xx.ravel(), yy.ravel()))
+    spot_mu = np.linspace(0.5, 1.5, positions.shape[0])
+    plan_layer = {
+        "positions": positions,
+        "mu": spot_mu,
+        "cumulative_mu": np.cumsum(spot_mu),
+        "time_axis_s": np.arange(positions.shape[0]) * 0.001,
+        "trajectory_x_mm": positions[:, 0],
+        "trajectory_y_mm": positions[:, 1],
+    }
+    log_x = np.repeat(positions[:, 0], SAMPLES_PER_SPOT) + shift_x_mm
+    log_y = np.repeat(positions[:, 1], SAMPLES_PER_SPOT)
+    per_sample = np.repeat(spot_mu / SAMPLES_PER_SPOT, SAMPLES_PER_SPOT)
+    log_data = {
+        "time_ms": np.arange(log_x.size) * 0.1,
+        "x": log_x,
+        "y": log_y,
+        "x_mm": log_x,
+        "y_mm": log_y,
+        "x_size_mm": np.full(log_x.size, 4.0),
+        "y_size_mm": np.full(log_x.size, 4.0),
+    }
+    if corrected:
+        log_data["mu_per_sample_corrected"] = per_sample
+        log_data["mu"] = np.cumsum(per_sample)
+    else:
+        # Raw monitor counts: proportional to MU but on another scale.
+        log_data["mu"] = np.cumsum(per_sample * 1000.0)
+    return plan_layer, log_data
+
+
+CONFIG = {
+    "FLUENCE_GAMMA_DISTANCE_MM": 2.0,
+    "FLUENCE_GAMMA_DOSE_PERCENT": 3.0,
+    "FLUENCE_GAMMA_LOWER_PERCENT_CUTOFF": 10.0,
+    "FLUENCE_GAMMA_GRID_RESOLUTION_MM": 0.5,
+    "FLUENCE_GAMMA_SPOT_SIGMA_MM": None,
+}
+
+
+def _reference_fluence(rows, cols):
+    return 100.0 * np.exp(-((rows - 11.0) ** 2 + (cols - 12.0) ** 2) / 40.0)
+
+
+def _evaluated_fluence(rows, cols):
+    return 103.0 * np.exp(-((rows - 12.0) ** 2 + (cols - 12.5) ** 2) / 38.0)
+
+
+def _brute_force_gamma(mask, distance_mm, dose_threshold, supersample=8):
+    """Exhaustive gamma against the evaluated fluence sampled 8x finer."""
+    fine = np.arange(0.0, mask.shape[0] - 1 + 1e-9, 1.0 / supersample)
+    fine_rows, fine_cols = np.meshgrid(fine, fine, indexing="ij")
+    evaluated = _evaluated_fluence(fine_rows, fine_cols)
+    gamma = np.full(mask.shape, np.nan)
+    for row, col in zip(*np.nonzero(mask)):
+        distance_sq = (fine_rows - row) ** 2 + (fine_cols - col) ** 2
+        gamma[row, col] = np.sqrt(
+            np.min(
+                distance_sq / distance_mm**2
+                + (evaluated - _reference_fluence(row, col)) ** 2 / dose_threshold**2
+            )
+        )
+    return gamma
+
+
+class TestFluenceGamma(unittest.TestCase):
+    def test_deposit_and_convolution_conserve_total_weight(self):
+        rng = np.random.default_rng(0)
+        x = rng.uniform(15.0, 25.0, 200)
+        y = rng.uniform(15.0, 25.0, 200)
+        weights = rng.uniform(0.0, 1.0, 200)
+
+        grid = _deposit(x, y, weights, np.array([0.0, 0.0]), (81, 81), 0.5)
+        smoothed = _gaussian_convolve(grid, 2.0, 3.0)
+
+        self.assertAlmostEqual(grid.sum(), weights.sum(), places=9)
+        self.assertAlmostEqual(smoothed.sum(), weights.sum(), places=6)
+
+    def test_distance_transform_gamma_matches_brute_force_search(self):
+        rows, cols = np.indices((24, 24))
+        reference = _reference_fluence(rows, cols)
+        evaluated = _evaluated_fluence(rows, cols)
+        mask = reference >= 10.0
+
+        gamma_map, dose_step = fluence_gamma_map(
+            reference,
+            evaluated,
+            resolution_mm=1.0,
+            distance_mm=2.0,
+            dose_threshold=3.0,
+            evaluate_mask=mask,
+        )
+        expected = _brute_force_gamma(mask, 2.0, 3.0)
+
+        self.assertTrue(np.all(np.isnan(gamma_map[~mask])))
+        error = np.abs(gamma_map[mask] - expected[mask])
+        self.assertLess(np.mean(error), 0.1)
+        self.assertLess(np.max(error), 0.5 * dose_step / 3.0 + 0.25)
+
+    def test_matching_delivery_passes_everywhere(self):
+        plan_layer, log_data = _synthetic_layer()
+
+        results = calculate_fluence_gamma_for_layer(plan_layer, log_data, CONFIG)
+
+        self.assertEqual(results["normalization_mode"], "fluence_gamma")
+        self.assertAlmostEqual(results["pass_rate"], 1.0)
+        self.assertLessEqual(results["gamma_max"], 0.15)
+        self.assertGreater(results["evaluated_point_count"], 0)
+        self.assertEqual(results["fluence_spot_sigma_x_mm"], 4.0)
+        self.assertFalse(results["used_relative_normalization"])
+        self.assertIn("stats_accumulator_x", results)
+        self.assertEqual(results["gamma_map"].ndim, 2)
+
+    def test_shifted_delivery_fails_beyond_distance_criterion(self):
+        plan_layer, log_data = _synthetic_layer(shift_x_mm=4.0)
+
+        results = calculate_fluence_gamma_for_layer(plan_layer, log_data, CONFIG)
+
+        self.assertLess(results["pass_rate"], 0.9)
+        self.assertGreater(results["gamma_max"], 1.0)
+        self.assertGreater(results["position_error_mean_mm"], 3.0)
+
+    def test_uncorrected_counts_are_scaled_to_plan_mu(self):
+        plan_layer, log_data = _synthetic_layer(corrected=False)
+
+        intermediates = prepare_fluence_gamma_intermediates(plan_layer, log_data, CONFIG)
+        results = calculate_fluence_gamma_for_layer(
+            plan_layer, None, CONFIG, intermediates=intermediates
+        )
+
+        self.assertFalse(intermediates["log_mu_corrected"])
+        self.assertTrue(results["used_relative_normalization"])
+        self.assertAlmostEqual(results["pass_rate"], 1.0)
+
+    def test_spot_sigma_override_takes_precedence(self):
+        plan_layer, log_data = _synthetic_layer()
+
+        results = calculate_fluence_gamma_for_layer(
+            plan_layer, log_data, {**CONFIG, "FLUENCE_GAMMA_SPOT_SIGMA_MM": 6.0}
+        )
+
+        self.assertEqual(results["fluence_spot_sigma_y_mm"], 6.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import os
+import subprocess
+import sys
+import unittest
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# Cumulative `-X importtime` budget for `import main`.  Eager matplotlib and
+# scipy imports took about 2 s here; without them it is about 0.4 s.
+STARTUP_BUDGET_US = 1_000_000
+HEAVY_PACKAGES = ("matplotlib", "scipy")
+
+
+def _import_times(module_name):
+    """``{module: cumulative microseconds}`` from a fresh interpreter."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module_name}"],
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+class TestImportTime(unittest.TestCase):
+    def test_entrypoints_do_not_import_matplotlib_or_scipy(self):
+        for module_name in (
+            "main",
+            "src.layer_normalization_values",
+            "src.report_csv_exporter",
+        ):
+            with self.subTest(module=module_name):
+                heavy = [
+                    name
+                    for name in _import_times(module_name)
+                    if name.split(".")[0] in HEAVY_PACKAGES
+                ]
+                self.assertEqual([], heavy)
+
+    def test_main_import_stays_within_startup_budget(self):
+        self.assertLess(_import_times("main")["main"], STARTUP_BUDGET_US)
+
+    def test_package_entrypoints_resolve_lazily(self):
+        import src
+        from src.report_generator import generate_report
+
+        self.assertIs(generate_report, src.generate_report)
+        self.assertIn("parse_ptn_file", dir(src))
+        with self.assertRaises(AttributeError):
+            src.not_an_entrypoint
+
+
+if __name__ == "__main__":
+    unittest.main()
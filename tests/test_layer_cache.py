@@ -0,0 +1,105 @@
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+
+from src.calculator import (
+    calculate_differences_for_layer,
+    prepare_difference_intermediates,
+)
+from src.layer_cache import LayerCache
+
+
+def _plan_layer():
+    return {
+        "time_axis_s": np.array([0.0, 1.0, 2.0]),
+        "trajectory_x_mm": np.array([0.0, 3.0, 6.0]),
+        "trajectory_y_mm": np.array([0.0, 4.0, 4.0]),
+        "cumulative_mu": np.array([1.0, 3.0, 6.0]),
+        "mu": np.array([1.0, 2.0, 3.0]),
+    }
+
+
+def _log_data():
+    return {
+        "time_ms": np.array([0.0, 500.0, 1000.0, 1500.0, 2000.0]),
+        "x": np.array([0.1, 1.6, 3.1, 4.4, 6.2]),
+        "y": np.array([0.0, 2.1, 4.0, 4.1, 3.9]),
+        "mu": np.array([0.5, 1.5, 2.5, 4.0, 5.0]),
+    }
+
+
+class TestLayerCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache = LayerCache(os.path.join(self.tmpdir.name, "cache"))
+        self.ptn_file = os.path.join(self.tmpdir.name, "layer.ptn")
+        with open(self.ptn_file, "wb") as handle:
+            handle.write(b"\x00" * 16)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _key(self, **overrides):
+        kwargs = {
+            "ptn_file": self.ptn_file,
+            "plan_layer": _plan_layer(),
+            "machine_config": {"XPOSGAIN": 1.0},
+            "analysis_config": {"TIME_ALIGNMENT_ENABLED": False},
+            "analysis_mode": "trajectory",
+            "range_info": SimpleNamespace(energy=150.0, dose1_range_code=2),
+        }
+        kwargs.update(overrides)
+        return self.cache.key(**kwargs)
+
+    def test_cached_intermediates_reproduce_results_with_new_thresholds(self):
+        intermediates = prepare_difference_intermediates(_plan_layer(), _log_data())
+        self.cache.store(self._key(), intermediates)
+        cached = self.cache.load(self._key())
+        config = {"SETTLING_THRESHOLD_MM": 0.2, "SETTLING_CONSECUTIVE_SAMPLES": 2}
+
+        expected = calculate_differences_for_layer(
+            _plan_layer(), _log_data(), config=config
+        )
+        reused = calculate_differences_for_layer(
+            _plan_layer(), None, config=config, intermediates=cached
+        )
+
+        np.testing.assert_allclose(expected["diff_x"], reused["diff_x"])
+        self.assertEqual(expected["settling_index"], reused["settling_index"])
+        self.assertEqual(expected["rmse_y"], reused["rmse_y"])
+        self.assertEqual(expected["time_scale"], reused["time_scale"])
+
+    def test_key_ignores_thresholds_but_tracks_inputs(self):
+        base = self._key()
+
+        self.assertEqual(
+            base,
+            self._key(
+                analysis_config={
+                    "TIME_ALIGNMENT_ENABLED": False,
+                    "SETTLING_THRESHOLD_MM": 0.9,
+                    "ZERO_DOSE_BOUNDARY_HOLDOFF_S": 0.002,
+                }
+            ),
+        )
+        self.assertNotEqual(
+            base, self._key(analysis_config={"TIME_ALIGNMENT_ENABLED": True})
+        )
+        self.assertNotEqual(base, self._key(range_info=None))
+        shifted_plan = _plan_layer()
+        shifted_plan["trajectory_x_mm"] = shifted_plan["trajectory_x_mm"] + 0.5
+        self.assertNotEqual(base, self._key(plan_layer=shifted_plan))
+
+        with open(self.ptn_file, "ab") as handle:
+            handle.write(b"\x00" * 16)
+        self.assertNotEqual(base, self._key())
+
+    def test_load_misses_for_unknown_key(self):
+        self.assertIsNone(self.cache.load("0" * 64))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -27,6 +27,13 @@ class TestLayerNormalizationValues(unittest.TestCase):
                 with open(path, "wb") as f:
                     f.write(b"ptn")
                 ptn_paths.append(path)
+            with open(os.path.join(log_dir, "PlanRange.txt"), "w", encoding="utf-8") as f:
+                f.write(
+                    "RESULT_ID,LAYER_NO,LAYER_ENERGY,PATIENT_ID,FLD_NO,DOSE1_RANGE,"
+                    "DOSE2_RANGE,PLAN_DOSE1_RANGE,PLAN_DOSE2_RANGE,SCAN_OUT_FL_NM\n"
+                    "1,1,150.0,P,1,2,3,4,3,001.ptn\n"
+                    "2,2,150.0,P,1,2,2,2,2,002.ptn\n"
+                )
 
             plan_data = {
                 "machine_name": "G1",
@@ -47,25 +54,6 @@ class TestLayerNormalizationValues(unittest.TestCase):
 
             with mock.patch.object(
                 layer_normalization_values, "load_plan_and_machine_config", return_value=(plan_data, {})
-            ), mock.patch.object(
-                layer_normalization_values,
-                "parse_planrange_for_directory",
-                return_value={
-                    os.path.abspath(ptn_paths[0]): mock.Mock(
-                        energy=150.0,
-                        dose1_range_code=2,
-                        dose2_range_code=3,
-                        plan_dose1_range_code=4,
-                        plan_dose2_range_code=3,
-                    ),
-                    os.path.abspath(ptn_paths[1]): mock.Mock(
-                        energy=150.0,
-                        dose1_range_code=2,
-                        dose2_range_code=2,
-                        plan_dose1_range_code=2,
-                        plan_dose2_range_code=2,
-                    ),
-                },
             ), mock.patch.object(
                 layer_normalization_values,
                 "parse_ptn_with_optional_mu_correction",
@@ -107,6 +95,34 @@ class TestLayerNormalizationValues(unittest.TestCase):
             self.assertAlmostEqual(9.0 / 7.0, float(summary_rows[0]["total_ratio"]))
             self.assertAlmostEqual(1.5, float(summary_rows[1]["layer_ratio_mean"]))
 
+    def test_main_honours_the_profiling_section_of_config_yaml(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            argv = [
+                "layer_normalization_values",
+                "--log_dir",
+                temp_dir,
+                "--dcm_file",
+                os.path.join(temp_dir, "plan.dcm"),
+                "--output",
+                temp_dir,
+            ]
+            for app_config, expect_profile in (
+                ({"PROFILE_ENABLED": True, "PROFILE_STAGES": ()}, True),
+                ({"PROFILE_ENABLED": False, "PROFILE_STAGES": ()}, False),
+            ):
+                with mock.patch("sys.argv", argv), mock.patch.object(
+                    layer_normalization_values, "_app_config", return_value=app_config
+                ), mock.patch.object(
+                    layer_normalization_values,
+                    "run_analysis",
+                    return_value=("layers.csv", "summary.csv"),
+                ), mock.patch("builtins.print"):
+                    layer_normalization_values.main()
+                profile_path = os.path.join(temp_dir, "profile.pstats")
+                self.assertEqual(expect_profile, os.path.exists(profile_path))
+                if expect_profile:
+                    os.remove(profile_path)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -4,7 +4,7 @@ import numpy as np
 import tempfile
 import shutil
 
-from src.log_parser import parse_ptn_file
+from src.log_parser import parse_ptn_data, parse_ptn_file, read_ptn_raw
 
 
 class TestCorrectLogParser(unittest.TestCase):
@@ -94,6 +94,15 @@ class TestCorrectLogParser(unittest.TestCase):
         with self.assertRaises(KeyError):
             parse_ptn_file(self.ptn_file_path, incomplete_config)
 
+    def test_parse_ptn_data_matches_parse_ptn_file(self):
+        """Parsing words read separately gives the same arrays as parsing the file."""
+        from_file = parse_ptn_file(self.ptn_file_path, self.config)
+        from_words = parse_ptn_data(read_ptn_raw(self.ptn_file_path), self.config)
+
+        self.assertEqual(from_file.keys(), from_words.keys())
+        for key in from_file:
+            np.testing.assert_array_equal(from_file[key], from_words[key])
+
     def test_nonexistent_file(self):
         """Test that a non-existent file raises FileNotFoundError."""
         with self.assertRaises(FileNotFoundError):
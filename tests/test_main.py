@@ -3,11 +3,16 @@ import os
 import tempfile
 import shutil
 import csv
+import json
+import pstats
 from datetime import date
+import multiprocessing
+import threading
 import numpy as np
 from unittest import mock
 
 import main
+from src import time_alignment
 from tests.conftest import create_dummy_dcm_file
 from main import find_ptn_files, run_analysis
 
@@ -171,6 +176,58 @@ class TestMain(unittest.TestCase):
             mock_generate_report.call_args.kwargs["report_style"], "classic"
         )
 
+    def test_run_analysis_writes_run_profile(self):
+        output_dir = os.path.join(self.test_dir, "output_profile")
+
+        with mock.patch.object(main, "generate_report", return_value=None):
+            report_data = run_analysis(self.test_dir, self.dcm_file, output_dir)
+
+        with open(report_data["_run_profile_path"], "r", encoding="utf-8") as f:
+            profile = json.load(f)
+        self.assertEqual(os.path.join(output_dir, "run_profile.json"), report_data["_run_profile_path"])
+        self.assertEqual(self.dcm_file, profile["dcm_file"])
+        self.assertLessEqual(
+            {"directory_scan", "dicom_parse", "ptn_read", "calculator", "pdf_render"},
+            set(profile["stages"]),
+        )
+        self.assertEqual(profile["layer_count"], len(profile["layers"]))
+        self.assertGreater(profile["bytes"], 0)
+        self.assertGreater(profile["stages"]["calculator"]["samples_per_s"], 0)
+
+    def test_run_analysis_profiles_selected_stages(self):
+        output_dir = os.path.join(self.test_dir, "output_cprofile")
+
+        with mock.patch.object(main, "generate_report", return_value=None):
+            report_data = run_analysis(
+                self.test_dir, self.dcm_file, output_dir, profile_stages="calculator"
+            )
+
+        stats_path, collapsed_path = report_data["_profile_paths"]
+        self.assertEqual(os.path.join(output_dir, "profile.pstats"), stats_path)
+        self.assertTrue(os.path.getsize(collapsed_path))
+        names = {name for _, _, name in pstats.Stats(stats_path).stats}
+        self.assertIn("calculate_differences_for_layer", names)
+        self.assertNotIn("load_analysis_inputs", names)
+
+    def test_run_analysis_records_memory_per_stage_and_layer(self):
+        output_dir = os.path.join(self.test_dir, "output_memory")
+
+        with mock.patch.object(main, "generate_report", return_value=None):
+            report_data = run_analysis(
+                self.test_dir, self.dcm_file, output_dir, profile_memory=True
+            )
+
+        with open(report_data["_run_profile_path"], "r", encoding="utf-8") as f:
+            profile = json.load(f)
+        self.assertIn("top_allocators", profile["stages"]["dicom_parse"])
+        self.assertIn("traced_peak_layer", profile["stages"]["calculator"])
+        for layer in profile["layers"]:
+            self.assertGreater(layer["memory"]["traced_peak_mb"], 0)
+        self.assertIsNone(profile["memory"]["budget_warning"])
+        self.assertTrue(
+            all(entry["location"] for entry in profile["memory"]["top_allocators"])
+        )
+
     def test_run_analysis_writes_debug_csv_only_when_enabled(self):
         output_dir = os.path.join(self.test_dir, "output_debug")
         os.makedirs(output_dir)
@@ -188,6 +245,35 @@ class TestMain(unittest.TestCase):
             run_analysis(self.test_dir, self.dcm_file, output_dir)
         self.assertTrue(any(name.endswith(".csv") for name in os.listdir(output_dir)))
 
+    def test_run_analysis_reuses_cached_layer_intermediates(self):
+        output_dir = os.path.join(self.test_dir, "output_cache")
+        os.makedirs(output_dir)
+        self.create_dummy_yaml_config_file(self.yaml_config_path)
+        with open(self.yaml_config_path, "a", encoding="utf-8") as f:
+            f.write("cache:\n")
+            f.write("  enabled: true\n")
+
+        with mock.patch.object(main, "generate_report"):
+            first = run_analysis(self.test_dir, self.dcm_file, output_dir)
+        with mock.patch.object(main, "generate_report"), mock.patch.object(
+            main,
+            "parse_ptn_with_optional_mu_correction",
+            side_effect=AssertionError("PTN should not be parsed on a cache hit"),
+        ):
+            second = run_analysis(self.test_dir, self.dcm_file, output_dir)
+
+        self.assertTrue(os.listdir(os.path.join(output_dir, ".layer_cache")))
+        for beam_name, beam in first.items():
+            if beam_name.startswith("_"):
+                continue
+            for first_layer, second_layer in zip(
+                beam["layers"], second[beam_name]["layers"]
+            ):
+                np.testing.assert_allclose(
+                    first_layer["results"]["diff_x"],
+                    second_layer["results"]["diff_x"],
+                )
+
     def test_run_analysis_writes_debug_csv_for_each_layer_when_enabled(self):
         output_dir = os.path.join(self.test_dir, "output_debug_all_layers")
         os.makedirs(output_dir)
@@ -208,10 +294,6 @@ class TestMain(unittest.TestCase):
                 }
             },
         }
-        fake_ptn_files = [
-            os.path.join(self.test_dir, "layer0.ptn"),
-            os.path.join(self.test_dir, "layer1.ptn"),
-        ]
         csv_calls = []
 
         def fake_calculate_differences_for_layer(
@@ -250,11 +332,7 @@ class TestMain(unittest.TestCase):
             }
 
         with mock.patch.object(main, "load_plan_and_machine_config", return_value=(plan_data, {})), mock.patch.object(
-            main, "find_ptn_files", return_value=fake_ptn_files
-        ), mock.patch.object(
             main, "parse_ptn_with_optional_mu_correction", return_value={"time_ms": np.array([0.0]), "x": np.array([0.0]), "y": np.array([0.0])}
-        ), mock.patch.object(
-            main, "parse_planrange_for_directory", return_value={}
         ), mock.patch.object(
             main, "calculate_differences_for_layer", side_effect=fake_calculate_differences_for_layer
         ), mock.patch.object(main, "generate_report"):
@@ -535,6 +613,209 @@ class TestMain(unittest.TestCase):
             generate_report_mock.call_args.kwargs["report_detail_pdf"]
         )
 
+    def test_run_analysis_routes_fluence_gamma_mode_to_fluence_calculator(self):
+        output_dir = os.path.join(self.test_dir, "output_fluence_gamma")
+        os.makedirs(output_dir)
+
+        plan_data = {
+            "patient_id": "123456",
+            "patient_name": "Test^FluenceGamma",
+            "machine_name": "G1",
+            "beams": {
+                1: {
+                    "name": "Beam 1",
+                    "layers": {
+                        0: {
+                            "positions": np.array([[0.0, 0.0], [4.0, 0.0]]),
+                            "mu": np.array([1.0, 1.0]),
+                            "time_axis_s": np.array([0.0, 0.00024]),
+                            "trajectory_x_mm": np.array([0.0, 4.0]),
+                            "trajectory_y_mm": np.array([0.0, 0.0]),
+                            "cumulative_mu": np.array([1.0, 2.0]),
+                        }
+                    },
+                }
+            },
+        }
+        fluence_gamma_config = {
+            "REPORT_STYLE_SUMMARY": True,
+            "REPORT_STYLE": "summary",
+            "EXPORT_PDF_REPORT": True,
+            "EXPORT_REPORT_CSV": True,
+            "SAVE_DEBUG_CSV": False,
+            "REPORT_DETAIL_PDF": False,
+            "ZERO_DOSE_REPORT_MODE": "filtered",
+            "ANALYSIS_MODE": "fluence_gamma",
+            "GAMMA_FLUENCE_PERCENT_THRESHOLD": 5.0,
+            "GAMMA_DISTANCE_MM_THRESHOLD": 2.0,
+            "GAMMA_LOWER_PERCENT_FLUENCE_CUTOFF": 10.0,
+            "FLUENCE_GAMMA_DISTANCE_MM": 3.0,
+            "FLUENCE_GAMMA_DOSE_PERCENT": 3.0,
+            "FLUENCE_GAMMA_LOWER_PERCENT_CUTOFF": 20.0,
+            "FLUENCE_GAMMA_GRID_RESOLUTION_MM": 0.5,
+            "FLUENCE_GAMMA_SPOT_SIGMA_MM": None,
+        }
+        fluence_gamma_results = {
+            "pass_rate": 1.0,
+            "gamma_mean": 0.0,
+            "gamma_max": 0.0,
+            "evaluated_point_count": 3,
+            "gamma_map": np.zeros((2, 2)),
+            "normalization_mode": "fluence_gamma",
+        }
+        fluence_calculator_mock = mock.Mock(return_value=fluence_gamma_results)
+
+        with mock.patch.object(
+            main, "parse_yaml_config", return_value=fluence_gamma_config
+        ), mock.patch.object(
+            main, "load_plan_and_machine_config", return_value=(plan_data, {})
+        ), mock.patch.object(
+            main, "collect_ptn_delivery_groups",
+            return_value=[
+                {
+                    "source_dir": self.test_dir,
+                    "ptn_files": [os.path.join(self.test_dir, "fluence_layer.ptn")],
+                    "planrange_lookup": {},
+                    "beam_number": 1,
+                }
+            ],
+        ), mock.patch.object(
+            main,
+            "parse_ptn_with_optional_mu_correction",
+            return_value={
+                "time_ms": np.array([0.0, 0.12, 0.24]),
+                "x": np.array([0.0, 2.0, 4.0]),
+                "y": np.zeros(3),
+                "mu": np.array([0.5, 1.0, 2.0]),
+            },
+        ), mock.patch.object(
+            main,
+            "calculate_point_gamma_for_layer",
+            side_effect=lambda *args, **kwargs: self.fail(
+                "fluence_gamma mode should not call the point gamma calculator"
+            ),
+        ), mock.patch.object(
+            main, "calculate_fluence_gamma_for_layer", fluence_calculator_mock
+        ), mock.patch.object(
+            main, "generate_report"
+        ) as generate_report_mock, mock.patch.object(
+            main, "export_report_csv"
+        ) as csv_export_mock:
+            run_analysis(self.test_dir, self.dcm_file, output_dir)
+
+        self.assertEqual(1, fluence_calculator_mock.call_count)
+        csv_export_mock.assert_not_called()
+        report_kwargs = generate_report_mock.call_args.kwargs
+        self.assertEqual("point_gamma", report_kwargs["analysis_mode"])
+        self.assertEqual(
+            3.0, report_kwargs["analysis_config"]["GAMMA_DISTANCE_MM_THRESHOLD"]
+        )
+        self.assertEqual(
+            20.0,
+            report_kwargs["analysis_config"]["GAMMA_LOWER_PERCENT_FLUENCE_CUTOFF"],
+        )
+
+    def test_run_analysis_both_mode_fills_trajectory_and_point_gamma_results(self):
+        output_dir = os.path.join(self.test_dir, "output_both")
+        os.makedirs(output_dir)
+
+        plan_data = {
+            "patient_id": "123456",
+            "patient_name": "Test^Both",
+            "machine_name": "G1",
+            "beams": {
+                1: {
+                    "name": "Beam 1",
+                    "layers": {
+                        0: {
+                            "positions": np.array([[0.0, 0.0], [4.0, 0.0]]),
+                            "mu": np.array([1.0, 1.0]),
+                            "time_axis_s": np.array([0.0, 0.00024]),
+                            "trajectory_x_mm": np.array([0.0, 4.0]),
+                            "trajectory_y_mm": np.array([0.0, 0.0]),
+                            "cumulative_mu": np.array([0.0, 4.0]),
+                        }
+                    },
+                }
+            },
+        }
+        both_config = {
+            "REPORT_STYLE_SUMMARY": True,
+            "REPORT_STYLE": "summary",
+            "EXPORT_PDF_REPORT": True,
+            "EXPORT_REPORT_CSV": True,
+            "SAVE_DEBUG_CSV": False,
+            "REPORT_DETAIL_PDF": False,
+            "ZERO_DOSE_REPORT_MODE": "raw",
+            "ANALYSIS_MODE": "both",
+            "GAMMA_FLUENCE_PERCENT_THRESHOLD": 5.0,
+            "GAMMA_DISTANCE_MM_THRESHOLD": 2.0,
+            "GAMMA_LOWER_PERCENT_FLUENCE_CUTOFF": 10.0,
+        }
+        log_x = np.array([0.0, 1.0, 2.0, 3.0, 4.0])
+        log_data = {
+            "time_ms": np.arange(5) * 0.06,
+            "x": log_x,
+            "y": np.zeros(5),
+            "x_mm": log_x,
+            "y_mm": np.zeros(5),
+            "mu": np.array([0.0, 1.0, 2.0, 3.0, 4.0]),
+            "dose1_au": np.array([0.0, 1.0, 1.0, 1.0, 1.0]),
+        }
+        with mock.patch.object(
+            main, "parse_yaml_config", return_value=both_config
+        ), mock.patch.object(
+            main, "load_plan_and_machine_config", return_value=(plan_data, {})
+        ), mock.patch.object(
+            main, "collect_ptn_delivery_groups",
+            return_value=[
+                {
+                    "source_dir": self.test_dir,
+                    "ptn_files": [os.path.join(self.test_dir, "both_layer.ptn")],
+                    "planrange_lookup": {},
+                    "beam_number": 1,
+                }
+            ],
+        ), mock.patch.object(
+            main, "parse_ptn_with_optional_mu_correction", return_value=log_data
+        ), mock.patch(
+            "src.calculator.align_log_time", wraps=time_alignment.align_log_time
+        ) as align_mock, mock.patch(
+            "src.point_gamma_workflow.align_log_time"
+        ) as point_gamma_align_mock, mock.patch.object(
+            main, "generate_report", return_value=[]
+        ) as generate_report_mock, mock.patch.object(
+            main, "export_report_csv"
+        ) as csv_export_mock, mock.patch.object(
+            main, "export_point_gamma_report_csv"
+        ) as point_gamma_csv_mock:
+            report_data = run_analysis(self.test_dir, self.dcm_file, output_dir)
+
+        self.assertEqual(1, align_mock.call_count)
+        point_gamma_align_mock.assert_not_called()
+        trajectory_results = report_data["Beam 1"]["layers"][0]["results"]
+        self.assertIn("hist_fit_x", trajectory_results)
+        point_gamma_results = report_data["_point_gamma"]["Beam 1"]["layers"][0][
+            "results"
+        ]
+        self.assertEqual("point_gamma", point_gamma_results["normalization_mode"])
+        self.assertAlmostEqual(1.0, point_gamma_results["pass_rate"])
+
+        csv_export_mock.assert_called_once()
+        point_gamma_csv_data = point_gamma_csv_mock.call_args.args[0]
+        self.assertEqual("Test^Both", point_gamma_csv_data["_patient_name"])
+        self.assertIs(
+            point_gamma_results,
+            point_gamma_csv_data["Beam 1"]["layers"][0]["results"],
+        )
+        self.assertEqual(
+            ["point_gamma", "trajectory"],
+            [
+                call.kwargs.get("analysis_mode", "trajectory")
+                for call in generate_report_mock.call_args_list
+            ],
+        )
+
     def test_run_analysis_routes_point_gamma_mode_to_summary_and_detail_reports_when_enabled(self):
         output_dir = os.path.join(self.test_dir, "output_point_gamma_detail")
         os.makedirs(output_dir)
@@ -990,8 +1271,6 @@ class TestMain(unittest.TestCase):
 
         with mock.patch.object(main, "load_plan_and_machine_config", return_value=(plan_data, {})), mock.patch.object(
             main, "parse_ptn_with_optional_mu_correction", return_value={"time_ms": np.array([0.0]), "x": np.array([0.0]), "y": np.array([0.0])}
-        ), mock.patch.object(
-            main, "parse_planrange_for_directory", return_value={}
         ), mock.patch.object(
             main, "calculate_differences_for_layer", side_effect=fake_calculate_differences_for_layer
         ), mock.patch.object(main, "generate_report") as mock_generate_report:
@@ -1072,8 +1351,6 @@ class TestMain(unittest.TestCase):
 
         with mock.patch.object(main, "load_plan_and_machine_config", return_value=(plan_data, {})), mock.patch.object(
             main, "parse_ptn_with_optional_mu_correction", side_effect=fake_parse_ptn_file
-        ), mock.patch.object(
-            main, "parse_planrange_for_directory", return_value={}
         ), mock.patch.object(
             main, "calculate_differences_for_layer", side_effect=fake_calculate_differences_for_layer
         ), mock.patch.object(main, "generate_report") as mock_generate_report:
@@ -1091,6 +1368,107 @@ class TestMain(unittest.TestCase):
         self.assertTrue(parsed_files[34].startswith(os.path.join(day_dir, "2025072222175500")))
         self.assertTrue(parsed_files[69].startswith(os.path.join(day_dir, "2025072222232700")))
 
+    @unittest.skipUnless(
+        "fork" in multiprocessing.get_all_start_methods(),
+        "patched calculators reach the workers only through fork",
+    )
+    def test_run_analysis_workers_keep_sequential_layer_order(self):
+        delivery_dir = os.path.join(self.test_dir, "delivery")
+        os.makedirs(delivery_dir)
+        for idx in range(1, 7):
+            open(os.path.join(delivery_dir, f"layer_{idx:03d}.ptn"), "wb").close()
+
+        plan_data = {
+            "patient_id": "123456",
+            "patient_name": "Test^Patient",
+            "machine_name": "G1",
+            "beams": {
+                1: {
+                    "name": "Beam 1",
+                    "layers": {
+                        i * 2: {"time_axis_s": np.array([float(i)])} for i in range(6)
+                    },
+                },
+            },
+        }
+
+        def fake_parse_ptn_file(file_path, config, planrange_lookup):
+            layer = int(os.path.basename(file_path)[6:9])
+            return {"time_ms": np.array([float(layer)])}
+
+        def fake_calculate_differences_for_layer(
+            plan_layer, log_data, save_to_csv=False, csv_filename="", config=None
+        ):
+            if log_data["time_ms"][0] == 4.0:
+                raise ValueError("bad layer")
+            return {
+                "plan_time": float(plan_layer["time_axis_s"][0]),
+                "log_layer": float(log_data["time_ms"][0]),
+                "pid": os.getpid(),
+            }
+
+        def layers_of(report_data):
+            return [
+                (layer["layer_index"], layer["results"]["plan_time"], layer["results"]["log_layer"])
+                for layer in report_data["Beam 1"]["layers"]
+            ]
+
+        runs = {}
+        with mock.patch.object(
+            main, "load_plan_and_machine_config", return_value=(plan_data, {})
+        ), mock.patch.object(
+            main, "parse_ptn_with_optional_mu_correction", side_effect=fake_parse_ptn_file
+        ), mock.patch.object(
+            main,
+            "calculate_differences_for_layer",
+            side_effect=fake_calculate_differences_for_layer,
+        ), mock.patch.object(main, "generate_report"):
+            for workers in (1, 3):
+                output_dir = os.path.join(self.test_dir, f"output_workers_{workers}")
+                runs[workers] = run_analysis(delivery_dir, self.dcm_file, output_dir, workers=workers)
+            pool = main.start_layer_worker_pool(2)
+            self.addCleanup(pool.shutdown)
+            pool_pids = set(pool._processes)
+            for run in ("pool_1", "pool_2"):
+                runs[run] = run_analysis(
+                    delivery_dir,
+                    self.dcm_file,
+                    os.path.join(self.test_dir, f"output_{run}"),
+                    workers=2,
+                    layer_executor=pool,
+                )
+
+        self.assertEqual(
+            [(0, 0.0, 1.0), (2, 1.0, 2.0), (4, 2.0, 3.0), (8, 4.0, 5.0), (10, 5.0, 6.0)],
+            layers_of(runs[1]),
+        )
+        self.assertEqual(layers_of(runs[1]), layers_of(runs[3]))
+        self.assertTrue(
+            any(layer["results"]["pid"] != os.getpid() for layer in runs[3]["Beam 1"]["layers"])
+        )
+        for run in ("pool_1", "pool_2"):
+            self.assertEqual(layers_of(runs[1]), layers_of(runs[run]))
+            self.assertLessEqual(
+                {layer["results"]["pid"] for layer in runs[run]["Beam 1"]["layers"]},
+                pool_pids,
+            )
+
+    @unittest.skipUnless(
+        {"fork", "forkserver"} <= set(multiprocessing.get_all_start_methods()),
+        "needs fork and forkserver",
+    )
+    def test_layer_pool_forks_only_single_threaded_processes(self):
+        self.assertEqual("fork", main._layer_pool_context().get_start_method())
+
+        release = threading.Event()
+        thread = threading.Thread(target=release.wait)
+        thread.start()
+        try:
+            self.assertEqual("forkserver", main._layer_pool_context().get_start_method())
+        finally:
+            release.set()
+            thread.join()
+
     def test_run_analysis_writes_report_csv_without_pdf_when_enabled(self):
         output_dir = os.path.join(self.test_dir, "output_report_csv")
         os.makedirs(output_dir)
@@ -1126,10 +1504,6 @@ class TestMain(unittest.TestCase):
                 }
             },
         }
-        fake_ptn_files = [
-            os.path.join(self.test_dir, "layer0.ptn"),
-            os.path.join(self.test_dir, "layer1.ptn"),
-        ]
 
         results_queue = [
             {
@@ -1225,11 +1599,7 @@ class TestMain(unittest.TestCase):
             return results_queue.pop(0)
 
         with mock.patch.object(main, "load_plan_and_machine_config", return_value=(plan_data, {})), mock.patch.object(
-            main, "find_ptn_files", return_value=fake_ptn_files
-        ), mock.patch.object(
             main, "parse_ptn_with_optional_mu_correction", return_value={"time_ms": np.array([0.0]), "x": np.array([0.0]), "y": np.array([0.0])}
-        ), mock.patch.object(
-            main, "parse_planrange_for_directory", return_value={}
         ), mock.patch.object(
             main, "calculate_differences_for_layer", side_effect=fake_calculate_differences_for_layer
         ), mock.patch.object(main, "generate_report") as mock_generate_report:
@@ -1276,7 +1646,16 @@ class TestMain(unittest.TestCase):
 
         expected_report_name = f"PTN_report_55758663_{date.today().isoformat()}"
         self.assertEqual(
-            mock.call(case_dir, self.dcm_file, self.test_dir, report_name=expected_report_name),
+            mock.call(
+                case_dir,
+                self.dcm_file,
+                self.test_dir,
+                report_name=expected_report_name,
+                workers=1,
+                profile=None,
+                profile_stages=None,
+                profile_memory=None,
+            ),
             mock_run_analysis.call_args,
         )
 
@@ -1294,6 +1673,26 @@ class TestMain(unittest.TestCase):
         self.assertIn("SETTLING_THRESHOLD_MM", passed_config)
         self.assertTrue(passed_config["ZERO_DOSE_FILTER_ENABLED"])
 
+    def test_run_analysis_reads_ahead_ptn_files_when_prefetch_enabled(self):
+        output_dir = os.path.join(self.test_dir, "output_prefetch")
+        with open(self.yaml_config_path, "a", encoding="utf-8") as f:
+            f.write("io:\n")
+            f.write("  prefetch_depth: 2\n")
+
+        with mock.patch.object(
+            main,
+            "parse_ptn_with_optional_mu_correction",
+            wraps=main.parse_ptn_with_optional_mu_correction,
+        ) as parse_mock, mock.patch.object(main, "generate_report"):
+            report_data = run_analysis(self.test_dir, self.dcm_file, output_dir)
+
+        self.assertTrue(parse_mock.called)
+        for call in parse_mock.call_args_list:
+            self.assertIsInstance(call.kwargs["raw_data"], np.ndarray)
+        self.assertTrue(
+            any(data["layers"] for key, data in report_data.items() if not key.startswith("_"))
+        )
+
     def test_derive_report_name_uses_case_directory_basename(self):
         report_name = main.derive_report_name("/tmp/55758663")
         self.assertEqual(f"PTN_report_55758663_{date.today().isoformat()}", report_name)
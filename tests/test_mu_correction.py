@@ -1,7 +1,14 @@
 import unittest
 import numpy as np
 
-from src.mu_correction import apply_mu_correction, get_monitor_range_factor
+from src.mu_correction import (
+    MU_COUNT_DOSE_INTERPOLATOR,
+    PROTON_DOSE_INTERPOLATOR,
+    _cached_mu_correction_factor,
+    apply_mu_correction,
+    get_monitor_range_factor,
+    mu_correction_factor,
+)
 
 
 class TestMuCorrection(unittest.TestCase):
@@ -26,6 +33,33 @@ class TestMuCorrection(unittest.TestCase):
             np.cumsum(corrected["mu_per_sample_corrected"]),
         )
 
+    def test_mu_correction_factor_is_memoized_and_matches_correction_chain(self):
+        _cached_mu_correction_factor.cache_clear()
+        dose1_au = np.array([0.0, 7.0, 1234.0], dtype=np.float32)
+        expected = dose1_au.astype(np.float64)
+        expected *= PROTON_DOSE_INTERPOLATOR(172.5)
+        expected *= MU_COUNT_DOSE_INTERPOLATOR(172.5)
+        expected *= get_monitor_range_factor(3)
+        expected /= 10.0
+
+        for _ in range(3):
+            corrected = apply_mu_correction(
+                {"dose1_au": dose1_au}, np.float32(172.5), 3
+            )
+
+        self.assertEqual(1, _cached_mu_correction_factor.cache_info().misses)
+        self.assertEqual(2, _cached_mu_correction_factor.cache_info().hits)
+        self.assertEqual(np.float32, corrected["mu_per_sample_corrected"].dtype)
+        np.testing.assert_array_equal(
+            expected.astype(np.float32), corrected["mu_per_sample_corrected"]
+        )
+        np.testing.assert_allclose(
+            np.cumsum(expected), corrected["mu"], rtol=1e-6
+        )
+        self.assertAlmostEqual(
+            mu_correction_factor(172.5, 3), float(expected[1] / 7.0)
+        )
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,128 @@
+import unittest
+
+import numpy as np
+
+from src.calculator import calculate_differences_for_layer, prepare_difference_intermediates
+from src.parameter_sweep import parse_grid, settling_indices, sweep_layer
+from src.point_gamma_workflow import (
+    calculate_point_gamma_for_layer,
+    prepare_point_gamma_intermediates,
+)
+from src.calculator import _detect_settling
+
+
+def _plan_layer():
+    time_axis_s = np.arange(12, dtype=float) * 0.0004
+    return {
+        "time_axis_s": time_axis_s,
+        "trajectory_x_mm": np.linspace(0.0, 11.0, 12),
+        "trajectory_y_mm": np.zeros(12),
+        "cumulative_mu": np.linspace(0.0, 1.2, 12),
+        "mu": np.full(12, 0.1),
+        "spot_is_transit_min_dose": np.array([False, False, True, True] + [False] * 8),
+    }
+
+
+def _log_data():
+    rng = np.random.default_rng(2)
+    time_ms = np.arange(0.0, 4.6, 0.06)
+    plan = _plan_layer()
+    x = np.interp(time_ms / 1000.0, plan["time_axis_s"], plan["trajectory_x_mm"])
+    x = x + rng.normal(0.0, 0.2, time_ms.size)
+    x[:4] += 2.0
+    return {
+        "time_ms": time_ms,
+        "x": x,
+        "y": rng.normal(0.0, 0.1, time_ms.size),
+        "mu": np.interp(time_ms / 1000.0, plan["time_axis_s"], plan["cumulative_mu"]),
+        "dose1_au": np.full(time_ms.size, 0.0072),
+    }
+
+
+def _grids():
+    return {
+        "zero_dose_boundary_holdoff_s": parse_grid("0,0.0003"),
+        "zero_dose_post_minimal_dose_boundary_s": parse_grid("0,0.0006"),
+        "settling_threshold_mm": parse_grid("0.5,3.0"),
+        "gamma_distance_mm": parse_grid("1,2"),
+        "gamma_fluence_percent": parse_grid("5"),
+    }
+
+
+class TestParameterSweep(unittest.TestCase):
+    def test_settling_indices_match_scalar_detection(self):
+        log_data = _log_data()
+        log_time_s = log_data["time_ms"] / 1000.0
+        thresholds = np.array([0.1, 0.5, 3.0])
+
+        vectorized = settling_indices(
+            log_data["x"], log_data["y"], log_time_s, 0.0, 0.0, thresholds, 3
+        )
+
+        expected = [
+            _detect_settling(
+                log_data["x"], log_data["y"], log_time_s, 0.0, 0.0, threshold, 3
+            )[0]
+            for threshold in thresholds
+        ]
+        np.testing.assert_array_equal(expected, vectorized)
+
+    def test_trajectory_rows_match_per_combination_runs(self):
+        plan_layer = _plan_layer()
+        intermediates = prepare_difference_intermediates(plan_layer, _log_data())
+        base_config = {"ZERO_DOSE_FILTER_ENABLED": True, "SETTLING_CONSECUTIVE_SAMPLES": 3}
+
+        rows = sweep_layer(plan_layer, intermediates, base_config, _grids(), "trajectory")
+
+        self.assertEqual(8, len(rows))
+        for row in rows:
+            expected = calculate_differences_for_layer(
+                plan_layer,
+                _log_data(),
+                config={
+                    **base_config,
+                    "SETTLING_THRESHOLD_MM": row["settling_threshold_mm"],
+                    "ZERO_DOSE_BOUNDARY_HOLDOFF_S": row["zero_dose_boundary_holdoff_s"],
+                    "ZERO_DOSE_POST_MINIMAL_DOSE_BOUNDARY_S": row[
+                        "zero_dose_post_minimal_dose_boundary_s"
+                    ],
+                },
+            )
+            self.assertEqual(expected["num_included_samples"], row["num_included_samples"])
+            for key in ("filtered_mean_diff_x", "filtered_std_diff_x", "filtered_p95_abs_diff_y"):
+                self.assertAlmostEqual(expected[key], row[key.removeprefix("filtered_")])
+
+    def test_point_gamma_rows_match_per_combination_runs(self):
+        plan_layer = _plan_layer()
+        config = {
+            "ZERO_DOSE_FILTER_ENABLED": True,
+            "SETTLING_CONSECUTIVE_SAMPLES": 3,
+            "GAMMA_LOWER_PERCENT_FLUENCE_CUTOFF": 10.0,
+        }
+        intermediates = prepare_point_gamma_intermediates(plan_layer, _log_data(), config)
+
+        rows = sweep_layer(plan_layer, intermediates, config, _grids(), "point_gamma")
+
+        self.assertEqual(16, len(rows))
+        for row in rows:
+            expected = calculate_point_gamma_for_layer(
+                plan_layer,
+                _log_data(),
+                {
+                    **config,
+                    "SETTLING_THRESHOLD_MM": row["settling_threshold_mm"],
+                    "ZERO_DOSE_BOUNDARY_HOLDOFF_S": row["zero_dose_boundary_holdoff_s"],
+                    "ZERO_DOSE_POST_MINIMAL_DOSE_BOUNDARY_S": row[
+                        "zero_dose_post_minimal_dose_boundary_s"
+                    ],
+                    "GAMMA_DISTANCE_MM_THRESHOLD": row["gamma_distance_mm"],
+                    "GAMMA_FLUENCE_PERCENT_THRESHOLD": row["gamma_fluence_percent"],
+                },
+            )
+            self.assertAlmostEqual(expected["pass_rate"], row["gamma_pass_rate"])
+            self.assertEqual(expected["evaluated_point_count"], row["evaluated_point_count"])
+            self.assertAlmostEqual(expected["rmse_x"], row["rmse_x"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,140 @@
+import os
+import pstats
+import tempfile
+import threading
+import unittest
+
+from src import run_profile
+from src.pipeline_profiler import (
+    PipelineProfiler,
+    collapsed_stacks,
+    pipeline_profiler_from_config,
+)
+from src.run_profile import LayerProfile
+
+
+def _gamma_work():
+    return sum(i * i for i in range(2000))
+
+
+def _calculator_work():
+    return sum(range(2000))
+
+
+def _function_names(stats_path):
+    return {name for _, _, name in pstats.Stats(stats_path).stats}
+
+
+class TestPipelineProfiler(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def test_whole_run_writes_pstats_and_collapsed_stacks(self):
+        profiler = PipelineProfiler()
+        with profiler.activate():
+            _gamma_work()
+        stats_path, collapsed_path = profiler.write(self.tmpdir.name)
+
+        self.assertIn("_gamma_work", _function_names(stats_path))
+        with open(collapsed_path, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        self.assertTrue(lines)
+        for line in lines:
+            stack, microseconds = line.rsplit(" ", 1)
+            self.assertGreater(int(microseconds), 0)
+        self.assertTrue(any("_gamma_work (test_pipeline_profiler.py:" in line for line in lines))
+
+    def test_selected_stages_only_are_profiled(self):
+        profiler = PipelineProfiler(stages="gamma")
+        layer = LayerProfile(1, 0, "layer.ptn")
+        with profiler.activate(), layer.activate():
+            with run_profile.stage("calculator"):
+                _calculator_work()
+            with run_profile.stage("gamma"):
+                _gamma_work()
+        with run_profile.stage("gamma"):
+            _gamma_work()
+        stats_path, _ = profiler.write(self.tmpdir.name)
+
+        call_counts = {
+            func[2]: func_stats[1]
+            for func, func_stats in pstats.Stats(stats_path).stats.items()
+        }
+        # The gamma stage after deactivation is not profiled.
+        self.assertEqual(1, call_counts["_gamma_work"])
+        self.assertNotIn("_calculator_work", call_counts)
+        self.assertEqual({"calculator", "gamma"}, set(layer.stages))
+
+    def test_concurrent_jobs_keep_their_own_stage_hooks(self):
+        first_done = threading.Event()
+        stats_paths = {}
+
+        def job(name, wait_for_other):
+            profiler = PipelineProfiler(stages="gamma")
+            with profiler.activate():
+                if wait_for_other:
+                    # The other job's activate() has exited by now.
+                    first_done.wait(5)
+                with run_profile.stage("gamma"):
+                    _gamma_work()
+            if not wait_for_other:
+                first_done.set()
+            stats_paths[name] = profiler.write(os.path.join(self.tmpdir.name, name))[0]
+
+        threads = [
+            threading.Thread(target=job, args=("slow", True)),
+            threading.Thread(target=job, args=("fast", False)),
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for name in ("slow", "fast"):
+            self.assertIn("_gamma_work", _function_names(stats_paths[name]))
+
+    def test_collapsed_stacks_split_own_time_across_callers(self):
+        root_a = ("a.py", 1, "root_a")
+        root_b = ("b.py", 1, "root_b")
+        leaf = ("c.py", 1, "leaf")
+        stats = {
+            root_a: (1, 1, 0.1, 1.1, {}),
+            root_b: (1, 1, 0.2, 0.5, {}),
+            # leaf: 1.2 s own time, 1.0 s under root_a and 0.2 s under root_b.
+            leaf: (2, 2, 1.2, 1.2, {root_a: (1, 1, 1.0, 1.0), root_b: (1, 1, 0.2, 0.2)}),
+        }
+
+        paths = collapsed_stacks(stats)
+
+        self.assertAlmostEqual(0.1, paths[(root_a,)])
+        self.assertAlmostEqual(1.0, paths[(root_a, leaf)])
+        self.assertAlmostEqual(0.2, paths[(root_b, leaf)])
+
+    def test_profiler_from_config(self):
+        self.assertIsNone(pipeline_profiler_from_config({}))
+        self.assertIsNone(
+            pipeline_profiler_from_config({"PROFILE_ENABLED": True}, enabled=False)
+        )
+        self.assertEqual(
+            frozenset(),
+            pipeline_profiler_from_config({"PROFILE_ENABLED": True}).stages,
+        )
+        self.assertEqual(
+            frozenset({"gamma", "ptn_read"}),
+            pipeline_profiler_from_config({}, stages="gamma, ptn_read").stages,
+        )
+        with self.assertRaisesRegex(ValueError, "calculate_point_gamma"):
+            PipelineProfiler(stages=["calculate_point_gamma"])
+
+    def test_write_without_profiled_calls(self):
+        profiler = PipelineProfiler(stages=["pdf_render"])
+        with profiler.activate():
+            pass
+        _, collapsed_path = profiler.write(os.path.join(self.tmpdir.name, "out"))
+        with open(collapsed_path, "r", encoding="utf-8") as f:
+            self.assertEqual("", f.read())
+
+
+if __name__ == "__main__":
+    unittest.main()
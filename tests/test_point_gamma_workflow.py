@@ -2,10 +2,18 @@ import unittest
 
 import numpy as np
 
+from src.point_gamma_report_layout import _safe_grid
 from src.point_gamma_workflow import (
+    SparseGammaMap,
+    _build_direct_gamma_map,
+    _calculate_direct_gamma_results,
     _build_time_aligned_series,
+    _native_log_index,
     _normalize_log_counts,
     calculate_point_gamma_for_layer,
+    prepare_combined_intermediates,
+    prepare_point_gamma_intermediates,
+    split_combined_intermediates,
 )
 
 
@@ -48,6 +56,73 @@ class TestPointGammaWorkflow(unittest.TestCase):
             np.array([0.0, 1.0, 1.0, 1.0, 1.0], dtype=float),
         )
 
+    def test_native_log_grid_reads_log_samples_without_interpolation(self):
+        log_time_s = np.arange(6) * 60e-6
+
+        self.assertEqual(slice(None), _native_log_index(log_time_s, slice(0, 6)))
+        np.testing.assert_array_equal(
+            [0, 2, 5, 5], _native_log_index(log_time_s, np.array([0, 2, 5, 7]))
+        )
+        self.assertIsNone(_native_log_index(log_time_s * 1.05, slice(0, 6)))
+
+        plan_layer = {
+            "time_axis_s": np.array([0.0, 0.00024, 0.00042], dtype=float),
+            "trajectory_x_mm": np.array([0.0, 4.0, 4.0], dtype=float),
+            "trajectory_y_mm": np.zeros(3, dtype=float),
+            "cumulative_mu": np.array([0.0, 4.0, 6.0], dtype=float),
+        }
+        log_data = {
+            "time_ms": log_time_s * 1000.0,
+            "x_mm": np.array([0.0, 1.1, 1.9, 3.2, 4.0, 4.1], dtype=float),
+            "y_mm": np.zeros(6, dtype=float),
+            "dose1_au": np.array([0.0, 1.0, 1.0, 1.0, 1.0, 1.0], dtype=float),
+        }
+
+        aligned = _build_time_aligned_series(plan_layer, log_data, {})
+
+        # The plan runs two samples past the log; those repeat the last sample.
+        self.assertEqual(8, aligned["time_s"].size)
+        np.testing.assert_allclose(
+            aligned["log_x"],
+            np.interp(aligned["time_s"], log_time_s, log_data["x_mm"]),
+        )
+        np.testing.assert_allclose(
+            aligned["plan_x"],
+            np.interp(
+                aligned["time_s"],
+                plan_layer["time_axis_s"],
+                plan_layer["trajectory_x_mm"],
+            ),
+        )
+
+    def test_combined_intermediates_match_separate_preparation(self):
+        plan_layer = {
+            "time_axis_s": np.array([0.0, 0.00024], dtype=float),
+            "trajectory_x_mm": np.array([0.0, 4.0], dtype=float),
+            "trajectory_y_mm": np.zeros(2, dtype=float),
+            "cumulative_mu": np.array([0.0, 4.0], dtype=float),
+        }
+        log_x = np.array([0.0, 1.1, 1.9, 3.2, 4.0], dtype=float)
+        log_data = {
+            "time_ms": np.arange(5) * 0.06,
+            "x": log_x,
+            "y": np.zeros(5, dtype=float),
+            "x_mm": log_x,
+            "y_mm": np.zeros(5, dtype=float),
+            "dose1_au": np.array([0.0, 1.0, 1.0, 1.0, 1.0], dtype=float),
+        }
+
+        trajectory, point_gamma = split_combined_intermediates(
+            prepare_combined_intermediates(plan_layer, log_data, {})
+        )
+        separate = prepare_point_gamma_intermediates(plan_layer, log_data, {})
+
+        self.assertIn("log_velocity_mm_s", trajectory)
+        self.assertNotIn("log_count", trajectory)
+        self.assertEqual(set(separate), set(point_gamma))
+        for key in ("time_s", "plan_x", "plan_count", "log_x", "log_count"):
+            np.testing.assert_allclose(separate[key], point_gamma[key])
+
     def test_calculate_point_gamma_for_layer_returns_pass_fail_metrics(self):
         plan_layer = {
             "time_axis_s": np.array([0.0, 0.00012, 0.00024], dtype=float),
@@ -114,6 +189,9 @@ class TestPointGammaWorkflow(unittest.TestCase):
             "p95_abs_diff_y",
         ):
             self.assertIn(key, results)
+        self.assertEqual(
+            results["stats_accumulator_x"].abs_percentile(95), results["p95_abs_diff_x"]
+        )
 
         self.assertEqual(results["normalization_mode"], "point_gamma")
         self.assertGreater(results["diff_x"].size, 0)
@@ -184,5 +262,209 @@ class TestPointGammaWorkflow(unittest.TestCase):
         self.assertAlmostEqual(1.0, results["pass_rate"])
 
 
+    def test_build_direct_gamma_map_matches_per_sample_accumulation(self):
+        rng = np.random.default_rng(4)
+        x_mm = rng.uniform(-20.0, 20.0, 5000)
+        y_mm = rng.uniform(-10.0, 10.0, 5000)
+        gamma = rng.uniform(0.0, 2.0, 5000)
+        gamma[::97] = np.nan
+
+        gamma_map = _build_direct_gamma_map(x_mm, y_mm, gamma, resolution_mm=0.5)
+
+        x_idx = np.round((x_mm - x_mm.min()) / 0.5).astype(int)
+        y_idx = np.round((y_mm - y_mm.min()) / 0.5).astype(int)
+        accum = np.zeros(gamma_map.shape)
+        counts = np.zeros(gamma_map.shape)
+        for xi, yi, value in zip(x_idx, y_idx, gamma):
+            if np.isfinite(value):
+                accum[yi, xi] += value
+                counts[yi, xi] += 1.0
+        expected = np.full(gamma_map.shape, np.nan)
+        expected[counts > 0] = accum[counts > 0] / counts[counts > 0]
+        np.testing.assert_array_equal(expected, gamma_map)
+
+    def test_build_direct_gamma_map_returns_sparse_map_for_large_fields(self):
+        x_mm = np.array([0.0, 0.1, 150.0])
+        y_mm = np.array([0.0, 0.0, 150.0])
+        gamma = np.array([0.5, 1.5, 2.0])
+
+        dense = _build_direct_gamma_map(x_mm, y_mm, gamma)
+        sparse = _build_direct_gamma_map(x_mm, y_mm, gamma, sparse_cell_limit=100)
+
+        self.assertIsInstance(sparse, SparseGammaMap)
+        self.assertEqual(2, sparse.values.size)
+        np.testing.assert_array_equal(dense, sparse.to_dense())
+        np.testing.assert_array_equal(dense, sparse.coarsened(1024))
+
+        coarse = sparse.coarsened(100)
+        self.assertEqual((76, 76), coarse.shape)
+        self.assertEqual(1.0, coarse[0, 0])
+        self.assertEqual(2.0, coarse[75, 75])
+        self.assertEqual(2, np.count_nonzero(np.isfinite(coarse)))
+        np.testing.assert_array_equal(dense, _safe_grid(sparse))
+
+    def test_spatial_search_gamma_tolerates_timing_offset(self):
+        rng = np.random.default_rng(9)
+        spots = rng.uniform(-30.0, 30.0, size=(60, 2))
+        time_s = np.arange(60 * 20) * 60e-6
+        plan_spot = np.arange(time_s.size) // 20
+        log_spot = np.clip((np.arange(time_s.size) - 5) // 20, 0, 59)
+        aligned = {
+            "plan_x": spots[plan_spot, 0],
+            "plan_y": spots[plan_spot, 1],
+            "plan_count": np.ones(time_s.size),
+            "log_x": spots[log_spot, 0],
+            "log_y": spots[log_spot, 1],
+            "log_count": np.ones(time_s.size),
+        }
+        config = {
+            "GAMMA_LOWER_PERCENT_FLUENCE_CUTOFF": 10.0,
+            "GAMMA_FLUENCE_PERCENT_THRESHOLD": 5.0,
+            "GAMMA_DISTANCE_MM_THRESHOLD": 2.0,
+        }
+
+        time_locked = _calculate_direct_gamma_results(aligned, config)
+        spatial = _calculate_direct_gamma_results(
+            aligned, {**config, "GAMMA_SEARCH_MODE": "spatial"}
+        )
+
+        self.assertLess(time_locked["pass_rate"], 0.9)
+        self.assertAlmostEqual(1.0, spatial["pass_rate"])
+        self.assertEqual("spatial", spatial["gamma_search_mode"])
+        self.assertTrue(np.all(spatial["gamma_values"] <= time_locked["gamma_values"]))
+
+    def test_gamma_criteria_match_single_criterion_runs(self):
+        rng = np.random.default_rng(4)
+        samples = 400
+        plan_x = rng.uniform(-20.0, 20.0, samples)
+        plan_y = rng.uniform(-20.0, 20.0, samples)
+        plan_count = rng.uniform(0.2, 1.0, samples)
+        aligned = {
+            "plan_x": plan_x,
+            "plan_y": plan_y,
+            "plan_count": plan_count,
+            "log_x": plan_x + rng.normal(0.0, 1.0, samples),
+            "log_y": plan_y + rng.normal(0.0, 1.0, samples),
+            "log_count": plan_count * rng.normal(1.0, 0.03, samples),
+        }
+        base_config = {
+            "GAMMA_LOWER_PERCENT_FLUENCE_CUTOFF": 10.0,
+            "GAMMA_FLUENCE_PERCENT_THRESHOLD": 5.0,
+            "GAMMA_DISTANCE_MM_THRESHOLD": 2.0,
+        }
+        criteria = [
+            {"fluence_percent_threshold": 1.0, "distance_mm_threshold": 1.0, "normalization": "global"},
+            {"fluence_percent_threshold": 3.0, "distance_mm_threshold": 3.0, "normalization": "global"},
+            {"fluence_percent_threshold": 2.0, "distance_mm_threshold": 2.0, "normalization": "local"},
+        ]
+
+        for search_mode in ("time_locked", "spatial"):
+            config = {
+                **base_config,
+                "GAMMA_SEARCH_MODE": search_mode,
+                "GAMMA_CRITERIA": criteria,
+            }
+            results = _calculate_direct_gamma_results(aligned, config)
+
+            self.assertEqual(
+                ["1%/1mm global", "3%/3mm global", "2%/2mm local"],
+                [entry["label"] for entry in results["gamma_criteria"]],
+            )
+            for entry in results["gamma_criteria"][:2]:
+                single = _calculate_direct_gamma_results(
+                    aligned,
+                    {
+                        **base_config,
+                        "GAMMA_SEARCH_MODE": search_mode,
+                        "GAMMA_FLUENCE_PERCENT_THRESHOLD": entry["fluence_percent_threshold"],
+                        "GAMMA_DISTANCE_MM_THRESHOLD": entry["distance_mm_threshold"],
+                    },
+                )
+                self.assertAlmostEqual(single["pass_rate"], entry["pass_rate"])
+                self.assertAlmostEqual(single["gamma_mean"], entry["gamma_mean"])
+                self.assertAlmostEqual(single["gamma_max"], entry["gamma_max"])
+
+        local = _calculate_direct_gamma_results(
+            aligned, {**base_config, "GAMMA_CRITERIA": criteria}
+        )["gamma_criteria"][2]
+        position_error = np.hypot(
+            aligned["log_x"] - plan_x, aligned["log_y"] - plan_y
+        )
+        expected_local = np.sqrt(
+            (position_error / 2.0) ** 2
+            + ((aligned["log_count"] - plan_count) / (0.02 * plan_count)) ** 2
+        )
+        self.assertAlmostEqual(np.mean(expected_local <= 1.0), local["pass_rate"])
+        self.assertAlmostEqual(np.max(expected_local), local["gamma_max"])
+
+    def test_adaptive_time_grid_matches_fixed_grid_metrics(self):
+        rng = np.random.default_rng(3)
+        spot_x = np.arange(40) * 5.0
+        time_axis_s, trajectory_x, cumulative_mu = [0.0], [spot_x[0]], [0.0]
+        for index, x in enumerate(spot_x):
+            if index:
+                # Short transit with almost no dose, then a 3 ms dwell.
+                time_axis_s.append(time_axis_s[-1] + 0.0002)
+                trajectory_x.append(x)
+                cumulative_mu.append(cumulative_mu[-1] + 0.001)
+            time_axis_s.append(time_axis_s[-1] + 0.003)
+            trajectory_x.append(x)
+            cumulative_mu.append(cumulative_mu[-1] + rng.uniform(0.5, 1.5))
+        plan_layer = {
+            "time_axis_s": np.array(time_axis_s),
+            "trajectory_x_mm": np.array(trajectory_x),
+            "trajectory_y_mm": np.zeros(len(time_axis_s)),
+            "cumulative_mu": np.array(cumulative_mu),
+        }
+        log_time_ms = np.arange(0.0, time_axis_s[-1] * 1000.0, 0.06)
+        log_x = np.interp(
+            log_time_ms / 1000.0, plan_layer["time_axis_s"], plan_layer["trajectory_x_mm"]
+        ) + rng.normal(0.0, 0.1, log_time_ms.size)
+        log_x[(log_time_ms > 20.0) & (log_time_ms < 26.0)] += 2.5
+        log_cumulative = np.interp(
+            log_time_ms / 1000.0, plan_layer["time_axis_s"], plan_layer["cumulative_mu"]
+        )
+        log_data = {
+            "time_ms": log_time_ms,
+            "x_mm": log_x,
+            "y_mm": rng.normal(0.0, 0.1, log_time_ms.size),
+            "dose1_au": np.diff(log_cumulative, prepend=0.0)
+            * rng.normal(1.0, 0.01, log_time_ms.size),
+        }
+        config = {
+            "GAMMA_FLUENCE_PERCENT_THRESHOLD": 5.0,
+            "GAMMA_DISTANCE_MM_THRESHOLD": 2.0,
+            "GAMMA_LOWER_PERCENT_FLUENCE_CUTOFF": 10.0,
+            "GAMMA_NORMALIZATION_FACTOR": 1.0,
+        }
+
+        fixed_series = prepare_point_gamma_intermediates(plan_layer, log_data, config)
+        adaptive_config = {**config, "GAMMA_TIME_GRID": "adaptive"}
+        adaptive_series = prepare_point_gamma_intermediates(
+            plan_layer, log_data, adaptive_config
+        )
+        fixed = calculate_point_gamma_for_layer(
+            plan_layer, None, config, intermediates=fixed_series
+        )
+        adaptive = calculate_point_gamma_for_layer(
+            plan_layer, None, adaptive_config, intermediates=adaptive_series
+        )
+
+        self.assertLess(adaptive_series["time_s"].size, 0.7 * fixed_series["time_s"].size)
+        self.assertEqual(
+            fixed_series["time_s"].size, int(np.sum(adaptive_series["sample_weight"]))
+        )
+        self.assertLess(fixed["pass_rate"], 0.97)
+        self.assertAlmostEqual(fixed["pass_rate"], adaptive["pass_rate"], delta=0.005)
+        self.assertAlmostEqual(fixed["gamma_mean"], adaptive["gamma_mean"], delta=0.01)
+        self.assertAlmostEqual(fixed["gamma_max"], adaptive["gamma_max"], places=6)
+        self.assertAlmostEqual(
+            fixed["evaluated_point_count"],
+            adaptive["evaluated_point_count"],
+            delta=0.01 * fixed["evaluated_point_count"],
+        )
+        self.assertAlmostEqual(fixed["rmse_x"], adaptive["rmse_x"], delta=0.02)
+
+
 if __name__ == "__main__":
     unittest.main()
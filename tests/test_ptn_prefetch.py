@@ -0,0 +1,87 @@
+import os
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+
+from src.ptn_prefetch import PtnPrefetcher
+
+
+class TestPtnPrefetcher(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.paths = []
+        for idx in range(6):
+            path = os.path.join(self.tmpdir.name, f"layer_{idx:03d}.ptn")
+            np.full(8 * (idx + 1), idx, dtype=">u2").tofile(path)
+            self.paths.append(path)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_files_are_yielded_in_order_with_their_words(self):
+        with PtnPrefetcher(self.paths, depth=2) as prefetcher:
+            items = [(path, raw.result()) for path, raw in prefetcher]
+
+        self.assertEqual(self.paths, [path for path, _ in items])
+        for idx, (_, words) in enumerate(items):
+            np.testing.assert_array_equal(np.full(8 * (idx + 1), idx, dtype=">u2"), words)
+
+    def test_read_errors_are_raised_by_the_future(self):
+        paths = [self.paths[0], os.path.join(self.tmpdir.name, "missing.ptn")]
+
+        with PtnPrefetcher(paths, depth=1) as prefetcher:
+            futures = [raw for _, raw in prefetcher]
+
+        self.assertEqual(8, futures[0].result().size)
+        with self.assertRaises(FileNotFoundError):
+            futures[1].result()
+
+    def test_read_ahead_is_bounded_by_depth_and_bytes(self):
+        reads = []
+        read_done = threading.Condition()
+
+        def recording_reader(path):
+            words = np.fromfile(path, dtype=">u2")
+            with read_done:
+                reads.append(path)
+                read_done.notify_all()
+            return words
+
+        def reads_ahead_while_consuming(prefetcher, expected_ahead):
+            ahead = []
+            for consumed, (_, raw) in enumerate(prefetcher, start=1):
+                raw.result()
+                target = min(consumed + expected_ahead, len(self.paths))
+                with read_done:
+                    read_done.wait_for(lambda: len(reads) >= target, timeout=5.0)
+                    # Give an unbounded reader the chance to overshoot.
+                    read_done.wait(timeout=0.02)
+                    ahead.append(len(reads) - consumed)
+            return ahead
+
+        with PtnPrefetcher(self.paths, depth=2, reader=recording_reader) as prefetcher:
+            ahead = reads_ahead_while_consuming(prefetcher, 2)
+        self.assertEqual([2, 2, 2, 2, 1, 0], ahead)
+
+        reads.clear()
+        # The files are 16, 32, 48, ... bytes: no two fit under a 40-byte cap,
+        # but each one alone is still read.
+        with PtnPrefetcher(
+            self.paths, depth=4, max_bytes=40, reader=recording_reader
+        ) as prefetcher:
+            ahead = reads_ahead_while_consuming(prefetcher, 0)
+        self.assertEqual([0] * len(self.paths), ahead)
+
+    def test_closing_early_stops_the_reader(self):
+        with PtnPrefetcher(self.paths, depth=1) as prefetcher:
+            for _, raw in prefetcher:
+                raw.result()
+                break
+
+        self.assertFalse(prefetcher._thread.is_alive())
+
+
+if __name__ == "__main__":
+    unittest.main()
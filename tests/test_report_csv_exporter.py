@@ -5,7 +5,7 @@ import unittest
 
 import numpy as np
 
-from src.report_csv_exporter import export_report_csv
+from src.report_csv_exporter import export_point_gamma_report_csv, export_report_csv
 
 
 class TestReportCsvExporter(unittest.TestCase):
@@ -128,3 +128,54 @@ class TestReportCsvExporter(unittest.TestCase):
         self.assertEqual("0", rows[0]["num_filtered_samples"])
         self.assertEqual("2", rows[0]["total_spots"])
         self.assertEqual("2", rows[0]["passed_spots"])
+
+    def test_export_point_gamma_report_csv_adds_columns_per_criterion(self):
+        report_data = {
+            "_patient_id": "123456",
+            "Beam 1": {
+                "beam_number": 1,
+                "layers": [
+                    {
+                        "layer_index": 0,
+                        "results": {
+                            "pass_rate": 0.97,
+                            "gamma_mean": 0.4,
+                            "gamma_max": 1.2,
+                            "evaluated_point_count": 100,
+                            "gamma_search_mode": "time_locked",
+                            "gamma_criteria": [
+                                {
+                                    "label": "1%/1mm global",
+                                    "fluence_percent_threshold": 1.0,
+                                    "distance_mm_threshold": 1.0,
+                                    "normalization": "global",
+                                    "pass_rate": 0.5,
+                                    "gamma_mean": 1.1,
+                                    "gamma_max": 3.0,
+                                },
+                                {
+                                    "label": "2.5%/2mm local",
+                                    "fluence_percent_threshold": 2.5,
+                                    "distance_mm_threshold": 2.0,
+                                    "normalization": "local",
+                                    "pass_rate": 0.9,
+                                    "gamma_mean": 0.6,
+                                    "gamma_max": 1.5,
+                                },
+                            ],
+                        },
+                    }
+                ],
+            },
+        }
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            written_files = export_point_gamma_report_csv(report_data, output_dir)
+            with open(written_files[0], "r", encoding="utf-8", newline="") as handle:
+                rows = list(csv.DictReader(handle))
+
+        self.assertTrue(written_files[0].endswith("Beam_1_point_gamma_layers.csv"))
+        self.assertEqual(1, len(rows))
+        self.assertAlmostEqual(97.0, float(rows[0]["gamma_pass_rate_percent"]))
+        self.assertAlmostEqual(50.0, float(rows[0]["1pct_1mm_global_pass_rate_percent"]))
+        self.assertAlmostEqual(1.5, float(rows[0]["2p5pct_2mm_local_gamma_max"]))
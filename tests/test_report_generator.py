@@ -1,3 +1,4 @@
+import copy
 import unittest
 import os
 import numpy as np
@@ -205,6 +206,49 @@ class TestReportGenerator(unittest.TestCase):
         self.assertEqual("bold", summary_title.get_fontweight())
         plt.close(fig)
 
+    def test_generate_point_gamma_summary_page_lists_each_gamma_criterion(self):
+        beam_data = copy.deepcopy(self.point_gamma_report_data["Beam 1"])
+        beam_data["layers"][0]["results"]["gamma_criteria"] = [
+            {
+                "label": "1%/1mm global",
+                "pass_rate": 0.62,
+                "gamma_mean": 0.9,
+                "gamma_max": 2.4,
+                "evaluated_point_count": 12,
+            },
+            {
+                "label": "3%/3mm local",
+                "pass_rate": 0.99,
+                "gamma_mean": 0.2,
+                "gamma_max": 1.1,
+                "evaluated_point_count": 12,
+            },
+        ]
+
+        fig = _generate_point_gamma_summary_page(
+            "Beam 1",
+            beam_data,
+            analysis_config={
+                "GAMMA_FLUENCE_PERCENT_THRESHOLD": 5.0,
+                "GAMMA_DISTANCE_MM_THRESHOLD": 2.0,
+                "GAMMA_LOWER_PERCENT_FLUENCE_CUTOFF": 10.0,
+            },
+        )
+
+        gamma_table = next(
+            table
+            for ax in fig.axes
+            if ax.get_title() == "Gamma Summary"
+            for table in ax.tables
+        )
+        cells = gamma_table.get_celld()
+        self.assertEqual("Criteria", cells[0, 0].get_text().get_text())
+        self.assertEqual("5%/2mm global", cells[1, 0].get_text().get_text())
+        self.assertEqual("1%/1mm global", cells[2, 0].get_text().get_text())
+        self.assertEqual("62.0%", cells[2, 1].get_text().get_text())
+        self.assertEqual("3%/3mm local", cells[3, 0].get_text().get_text())
+        plt.close(fig)
+
     def test_generate_point_gamma_summary_page_uses_stacked_top_summary_tables(self):
         beam_data = self.point_gamma_report_data["Beam 1"]
 
@@ -0,0 +1,143 @@
+import json
+import os
+import tempfile
+import threading
+import tracemalloc
+import unittest
+
+import numpy as np
+
+from src import run_profile
+from src.run_profile import LayerProfile, MemoryTracker, RunProfile, memory_tracker_from_config
+
+
+class TestRunProfile(unittest.TestCase):
+    def test_stage_records_only_into_the_active_layer(self):
+        layer = LayerProfile(1, 0, "layer.ptn")
+
+        with run_profile.stage("ptn_read"):
+            run_profile.count(samples=5, nbytes=80)
+        with layer.activate():
+            with run_profile.stage("ptn_read"):
+                run_profile.count(samples=10, nbytes=160)
+            with run_profile.stage("ptn_read"):
+                pass
+
+        data = layer.to_dict()
+        self.assertEqual((10, 160), (data["samples"], data["bytes"]))
+        self.assertEqual({"ptn_read"}, set(data["stages"]))
+        self.assertGreaterEqual(data["stages"]["ptn_read"]["wall_s"], 0.0)
+
+    def test_totals_include_throughput_and_are_written_next_to_reports(self):
+        profile = RunProfile()
+        with profile.stage("directory_scan"):
+            pass
+        profile.add_layer(
+            {
+                "samples": 1000,
+                "bytes": 16000,
+                "stages": {
+                    "ptn_read": {"wall_s": 0.5, "cpu_s": 0.1},
+                    "calculator": {"wall_s": 2.0, "cpu_s": 2.0},
+                },
+            }
+        )
+        profile.add_layer(
+            {
+                "samples": 3000,
+                "bytes": 48000,
+                "stages": {"ptn_read": {"wall_s": 1.5, "cpu_s": 0.3}},
+            }
+        )
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            path = profile.write(output_dir, log_dir="logs")
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+
+        self.assertEqual("run_profile.json", os.path.basename(path))
+        self.assertEqual("logs", data["log_dir"])
+        self.assertEqual(["directory_scan", "ptn_read", "calculator"], list(data["stages"]))
+        read = data["stages"]["ptn_read"]
+        self.assertEqual((2, 4000, 64000), (read["layers"], read["samples"], read["bytes"]))
+        self.assertAlmostEqual(32000.0, read["bytes_per_s"])
+        self.assertAlmostEqual(500.0, data["stages"]["calculator"]["samples_per_s"])
+        self.assertIn("ptn_read 2.00 s (0.0 MB/s)", profile.summary(data))
+
+
+class TestMemoryTracking(unittest.TestCase):
+    def test_stages_and_layers_record_peaks_and_top_allocators(self):
+        tracker = MemoryTracker(trace=True, top_allocators=3)
+        with tracker.tracing():
+            profile = RunProfile(memory=tracker)
+            with profile.stage("csv_export"):
+                kept = np.ones(1_000_000)  # 8 MB held past the stage
+            layer = LayerProfile(1, 4, "layer.ptn", memory=tracker)
+            with layer.activate():
+                with run_profile.stage("calculator"):
+                    np.ones(2_000_000).sum()  # 16 MB temporary
+            profile.add_layer(layer.to_dict())
+            data = profile.to_dict()
+
+        export = data["stages"]["csv_export"]
+        self.assertGreaterEqual(export["traced_peak_mb"], 7.5)
+        self.assertIn("test_run_profile.py", export["top_allocators"][0]["location"])
+        self.assertGreaterEqual(export["top_allocators"][0]["size_mb"], 7.5)
+        calculator = data["stages"]["calculator"]
+        self.assertGreaterEqual(calculator["traced_peak_mb"], 15.0)
+        self.assertEqual([1, 4], calculator["traced_peak_layer"])
+        self.assertGreaterEqual(data["layers"][0]["memory"]["traced_peak_mb"], 15.0)
+        self.assertGreaterEqual(data["memory"]["traced_peak_mb"], 15.0)
+        self.assertTrue(
+            any("test_run_profile.py" in entry["location"] for entry in data["memory"]["top_allocators"])
+        )
+        self.assertIsNotNone(data["memory"]["peak_rss_mb"])
+        del kept
+
+    def test_budget_warning_is_logged_once(self):
+        tracker = MemoryTracker(budget_mb=1.0)
+        profile = StageOnly(tracker)
+
+        with self.assertLogs("src.run_profile", level="WARNING") as logs:
+            with profile.stage("directory_scan"):
+                pass
+            with profile.stage("dicom_parse"):
+                pass
+
+        self.assertEqual(1, len(logs.output))
+        self.assertIn("directory_scan", logs.output[0])
+        self.assertEqual("directory_scan", tracker.budget_warning["stage"])
+        self.assertNotIn("traced_peak_mb", profile.stages["dicom_parse"])
+
+    def test_tracker_from_config(self):
+        self.assertIsNone(memory_tracker_from_config({}))
+        self.assertFalse(memory_tracker_from_config({"MEMORY_BUDGET_MB": 4096.0}).trace)
+        tracker = memory_tracker_from_config(
+            {"PROFILE_MEMORY": False, "MEMORY_TOP_ALLOCATORS": 3}, enabled=True
+        )
+        self.assertEqual((True, 3), (tracker.trace, tracker.top_allocators))
+
+    def test_tracing_runs_are_serialized(self):
+        order = []
+
+        def second_run():
+            with MemoryTracker(trace=True).tracing():
+                order.append(("second", tracemalloc.is_tracing()))
+
+        with MemoryTracker(trace=True).tracing():
+            thread = threading.Thread(target=second_run)
+            thread.start()
+            thread.join(0.05)
+            order.append(("first", tracemalloc.is_tracing()))
+        thread.join()
+
+        self.assertEqual([("first", True), ("second", True)], order)
+        self.assertFalse(tracemalloc.is_tracing())
+
+
+class StageOnly(run_profile.StageTimes):
+    pass
+
+
+if __name__ == "__main__":
+    unittest.main()
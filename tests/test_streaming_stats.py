@@ -0,0 +1,130 @@
+import pickle
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from src.calculator import _calculate_axis_stats
+from src.report_metrics import merged_axis_stats
+from src.streaming_stats import (
+    AxisStatsAccumulator,
+    QuantileSketch,
+    merge_accumulators,
+    merge_sketches,
+)
+
+
+class TestAxisStatsAccumulator(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(11)
+        self.values = rng.normal(0.2, 0.4, size=5000)
+
+    def test_chunked_updates_match_exact_stats(self):
+        accumulator = AxisStatsAccumulator()
+        for chunk in np.array_split(self.values, 7):
+            accumulator.update(chunk)
+
+        stats = accumulator.to_stats()
+        expected = _calculate_axis_stats(self.values)
+        for key in ("mean", "std", "rmse", "max_abs"):
+            self.assertAlmostEqual(expected[key], stats[key], places=10)
+        for p95_abs in (stats["p95_abs"], expected["p95_abs"]):
+            rank = np.mean(np.abs(self.values) <= p95_abs)
+            self.assertAlmostEqual(0.95, rank, delta=0.02)
+
+    def test_merge_across_layers_matches_concatenated_samples(self):
+        parts = np.array_split(self.values, [100, 2500])
+        merged = merge_accumulators(
+            pickle.loads(pickle.dumps(AxisStatsAccumulator.from_values(part)))
+            for part in parts
+        )
+
+        expected = _calculate_axis_stats(self.values)
+        self.assertEqual(self.values.size, merged.count)
+        self.assertAlmostEqual(expected["mean"], merged.mean, places=10)
+        self.assertAlmostEqual(expected["std"], merged.std, places=10)
+
+    def test_weighted_update_matches_repeated_samples(self):
+        weighted = AxisStatsAccumulator.from_values([1.0, -2.0], weights=[3.0, 1.0])
+        repeated = AxisStatsAccumulator.from_values([1.0, 1.0, 1.0, -2.0])
+
+        self.assertAlmostEqual(repeated.mean, weighted.mean)
+        self.assertAlmostEqual(repeated.std, weighted.std)
+        self.assertAlmostEqual(repeated.rmse, weighted.rmse)
+        for q in (25, 50, 75, 95):
+            self.assertEqual(repeated.abs_percentile(q), weighted.abs_percentile(q))
+
+    def test_merged_axis_stats_weights_layers_by_sample_count(self):
+        layers = [
+            {
+                "results": {
+                    "stats_accumulator_x": AxisStatsAccumulator.from_values(np.zeros(90)),
+                    "stats_accumulator_y": AxisStatsAccumulator.from_values(np.zeros(90)),
+                }
+            },
+            {
+                "results": {
+                    "stats_accumulator_x": AxisStatsAccumulator.from_values(np.ones(10)),
+                    "stats_accumulator_y": AxisStatsAccumulator.from_values(np.ones(10)),
+                }
+            },
+        ]
+
+        stats_x, _ = merged_axis_stats(layers)
+
+        self.assertAlmostEqual(0.1, stats_x["mean"])
+        self.assertAlmostEqual(1.0, stats_x["max_abs"])
+        self.assertIsNone(merged_axis_stats([{"results": {}}]))
+
+
+class TestQuantileSketch(unittest.TestCase):
+    def test_p95_within_rank_error_bound(self):
+        rng = np.random.default_rng(3)
+        values = np.abs(rng.standard_t(3, size=200000))
+
+        sketch = QuantileSketch.from_values(values)
+
+        rank = np.mean(values <= sketch.percentile(95))
+        self.assertAlmostEqual(0.95, rank, delta=0.02)
+        self.assertLess(sum(level.size for level in sketch.levels), 2000)
+
+    def test_large_update_is_compacted_in_blocks(self):
+        sketch = QuantileSketch(k=16)
+        with mock.patch.object(np, "sort", wraps=np.sort) as sort:
+            sketch.update(np.arange(10000.0))
+
+        # Only rows of a few ``k`` items are ever sorted, never the whole chunk.
+        self.assertTrue(all(call.args[0].shape[-1] <= 4 * sketch.k for call in sort.call_args_list))
+        self.assertAlmostEqual(9500.0, sketch.percentile(95), delta=500.0)
+
+    def test_merged_layer_sketches_track_concatenated_tail(self):
+        rng = np.random.default_rng(5)
+        layers = [np.abs(rng.normal(0.0, scale, size=3000)) for scale in np.linspace(0.1, 2.0, 40)]
+        merged = merge_sketches(
+            pickle.loads(pickle.dumps(QuantileSketch.from_values(layer))) for layer in layers
+        )
+
+        all_values = np.concatenate(layers)
+        self.assertEqual(all_values.size, merged.count)
+        rank = np.mean(all_values <= merged.percentile(95))
+        self.assertAlmostEqual(0.95, rank, delta=0.02)
+        self.assertIsNone(merge_sketches([None]))
+
+    def test_whole_number_weights_count_as_repeated_samples(self):
+        rng = np.random.default_rng(7)
+        values = rng.exponential(1.0, size=20000)
+        weights = rng.integers(1, 17, size=values.size)
+
+        sketch = QuantileSketch().update(values, weights=weights)
+
+        self.assertEqual(int(weights.sum()), sketch.count)
+        order = np.argsort(values)
+        cumulative = np.cumsum(weights[order]) / weights.sum()
+        rank = cumulative[np.searchsorted(values[order], sketch.percentile(95))]
+        self.assertAlmostEqual(0.95, rank, delta=0.02)
+        with self.assertRaises(ValueError):
+            QuantileSketch().update([1.0], weights=[0.5])
+
+
+if __name__ == "__main__":
+    unittest.main()
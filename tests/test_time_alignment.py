@@ -0,0 +1,115 @@
+import unittest
+
+import numpy as np
+
+from src.calculator import calculate_differences_for_layer
+from src.time_alignment import align_log_time, estimate_time_offset_s, fit_time_scale
+
+
+def _plan_layer(num_spots=40, spot_duration_s=0.002):
+    rng = np.random.default_rng(7)
+    positions = rng.uniform(-40.0, 40.0, size=(num_spots, 2))
+    time_axis_s = np.arange(num_spots, dtype=float) * spot_duration_s
+    mu = rng.uniform(0.5, 1.5, size=num_spots)
+    return {
+        "time_axis_s": time_axis_s,
+        "trajectory_x_mm": positions[:, 0],
+        "trajectory_y_mm": positions[:, 1],
+        "cumulative_mu": np.cumsum(mu),
+    }
+
+
+def _log_for_plan(plan_layer, *, offset_s=0.0, scale=1.0, dt_s=60e-6):
+    plan_time_s = plan_layer["time_axis_s"]
+    log_time_s = np.arange(0.0, plan_time_s[-1] * scale + offset_s + 0.004, dt_s)
+    plan_equivalent_s = (log_time_s - offset_s) / scale
+    spot = np.clip(
+        np.searchsorted(plan_time_s, plan_equivalent_s, side="left"),
+        0,
+        plan_time_s.size - 1,
+    )
+    log_mu = np.interp(plan_equivalent_s, plan_time_s, plan_layer["cumulative_mu"])
+    return {
+        "time_ms": log_time_s * 1000.0,
+        "x": plan_layer["trajectory_x_mm"][spot],
+        "y": plan_layer["trajectory_y_mm"][spot],
+        "mu": log_mu,
+    }
+
+
+class TestTimeAlignment(unittest.TestCase):
+    def test_estimate_time_offset_tracks_log_delay(self):
+        plan_layer = _plan_layer()
+        reference = _log_for_plan(plan_layer)
+        delayed = _log_for_plan(plan_layer, offset_s=0.0036)
+
+        reference_offset = estimate_time_offset_s(
+            plan_layer,
+            reference["time_ms"] / 1000.0,
+            reference["x"],
+            reference["y"],
+            reference["mu"],
+        )
+        delayed_offset = estimate_time_offset_s(
+            plan_layer,
+            delayed["time_ms"] / 1000.0,
+            delayed["x"],
+            delayed["y"],
+            delayed["mu"],
+        )
+
+        self.assertAlmostEqual(0.0036, delayed_offset - reference_offset, delta=60e-6)
+
+    def test_fit_time_scale_recovers_affine_mapping(self):
+        plan_layer = _plan_layer()
+        log_data = _log_for_plan(plan_layer, offset_s=0.001, scale=1.02)
+
+        scale, offset, matches = fit_time_scale(
+            plan_layer,
+            log_data["time_ms"] / 1000.0,
+            log_data["x"],
+            log_data["y"],
+            0.001,
+        )
+
+        self.assertGreaterEqual(matches, 10)
+        self.assertAlmostEqual(1.02, scale, delta=0.002)
+        self.assertAlmostEqual(0.001, offset, delta=2e-4)
+
+    def test_align_log_time_is_identity_when_disabled(self):
+        plan_layer = _plan_layer()
+        log_data = _log_for_plan(plan_layer, offset_s=0.002)
+        log_time_s = log_data["time_ms"] / 1000.0
+
+        aligned, info = align_log_time(
+            plan_layer, log_time_s, log_data["x"], log_data["y"], log_data["mu"], {}
+        )
+
+        np.testing.assert_array_equal(aligned, log_time_s)
+        self.assertFalse(info["time_alignment_applied"])
+        self.assertEqual(1.0, info["time_scale"])
+
+    def test_calculator_applies_alignment_before_differencing(self):
+        plan_layer = _plan_layer()
+        config = {"TIME_ALIGNMENT_ENABLED": True, "TIME_ALIGNMENT_FIT_SCALE": True}
+        reference = calculate_differences_for_layer(
+            plan_layer, _log_for_plan(plan_layer), config=config
+        )
+        delayed = calculate_differences_for_layer(
+            plan_layer, _log_for_plan(plan_layer, offset_s=0.006), config=config
+        )
+        unaligned = calculate_differences_for_layer(
+            plan_layer, _log_for_plan(plan_layer, offset_s=0.006)
+        )
+
+        self.assertTrue(delayed["time_alignment_applied"])
+        self.assertAlmostEqual(
+            0.006,
+            delayed["time_offset_s"] - reference["time_offset_s"],
+            delta=2e-4,
+        )
+        self.assertLess(delayed["rmse_x"], unaligned["rmse_x"])
+
+
+if __name__ == "__main__":
+    unittest.main()
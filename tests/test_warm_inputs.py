@@ -0,0 +1,52 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from src import warm_inputs
+from src.warm_inputs import WarmInputs
+
+
+class TestWarmInputs(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.plans = []
+        for name in ("a", "b", "c"):
+            path = os.path.join(self.tmpdir.name, f"RP.{name}.dcm")
+            open(path, "wb").close()
+            self.plans.append(path)
+        self.load_inputs = mock.Mock(side_effect=lambda dcm_file, app_config: (dcm_file, {}))
+        patch = mock.patch.object(warm_inputs, "load_analysis_inputs", self.load_inputs)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.inputs = WarmInputs()
+        self.app_config = {"WARM_INPUTS_MAX_PLANS": 2}
+
+    def test_least_recently_used_plan_is_evicted(self):
+        a, b, c = self.plans
+        self.inputs.plan_inputs(a, self.app_config)
+        self.inputs.plan_inputs(b, self.app_config)
+        self.inputs.plan_inputs(a, self.app_config)
+        self.inputs.plan_inputs(c, self.app_config)
+        self.assertEqual(2, self.inputs.cached_plan_count())
+        self.assertEqual(3, self.load_inputs.call_count)
+
+        self.inputs.plan_inputs(a, self.app_config)
+        self.assertEqual(3, self.load_inputs.call_count)
+        self.inputs.plan_inputs(b, self.app_config)
+        self.assertEqual(4, self.load_inputs.call_count)
+
+    def test_released_plan_is_reloaded(self):
+        a = self.plans[0]
+        self.inputs.plan_inputs(a, self.app_config)
+        self.inputs.release(a)
+        self.inputs.release(a)
+        self.assertEqual(0, self.inputs.cached_plan_count())
+
+        self.inputs.plan_inputs(a, self.app_config)
+        self.assertEqual(2, self.load_inputs.call_count)
+
+
+if __name__ == "__main__":
+    unittest.main()
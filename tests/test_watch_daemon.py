@@ -0,0 +1,137 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from src import warm_inputs, watch_daemon
+from src.watch_daemon import WatchDaemon
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestWatchDaemon(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.tmpdir.name, "logs")
+        self.output_root = os.path.join(self.tmpdir.name, "out")
+        self.case_dir = os.path.join(self.root, "55758663")
+        os.makedirs(os.path.join(self.case_dir, "delivery"))
+        self.dcm_file = os.path.join(self.case_dir, "RP.plan.dcm")
+        open(self.dcm_file, "wb").close()
+        self.app_config_file = os.path.join(self.tmpdir.name, "config.yaml")
+        open(self.app_config_file, "w").close()
+
+        plan_data = {"beams": {1: {"layers": {0: {}, 2: {}, 4: {}}}}}
+        self.load_inputs = mock.Mock(return_value=(plan_data, {"TIMEGAIN": 0.001}))
+        self.run_analysis = mock.Mock(return_value={})
+        patches = [
+            mock.patch.object(warm_inputs, "app_config_path", return_value=self.app_config_file),
+            mock.patch.object(warm_inputs, "load_app_config", return_value={"APP": True}),
+            mock.patch.object(warm_inputs, "load_analysis_inputs", self.load_inputs),
+            mock.patch.object(watch_daemon, "run_analysis", self.run_analysis),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+        self.clock = FakeClock()
+        self.daemon = WatchDaemon(
+            self.root, self.output_root, stability_s=10.0, clock=self.clock
+        )
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _write_layer(self, index, size=16):
+        path = os.path.join(self.case_dir, "delivery", f"layer_{index:03d}.ptn")
+        with open(path, "wb") as handle:
+            handle.write(b"\0" * size)
+
+    def _poll_at(self, now):
+        self.clock.now = now
+        return self.daemon.poll_once()
+
+    def test_case_is_analyzed_once_files_are_complete_and_stable(self):
+        self._write_layer(1)
+        self._write_layer(2)
+        self.assertEqual([], self._poll_at(0.0))
+        self.assertEqual([], self._poll_at(20.0))  # stable but only 2 of 3 layers
+
+        self._write_layer(3, size=8)  # still being copied
+        self.assertEqual([], self._poll_at(21.0))
+        self._write_layer(3)
+        self.assertEqual([], self._poll_at(22.0))
+        self.assertEqual([], self._poll_at(31.0))
+        self.assertEqual([self.case_dir], self._poll_at(32.0))
+        self.assertEqual([], self._poll_at(60.0))
+
+        self.run_analysis.assert_called_once()
+        kwargs = self.run_analysis.call_args.kwargs
+        self.assertEqual({"APP": True}, kwargs["app_config"])
+        self.assertEqual(self.load_inputs.return_value, kwargs["plan_inputs"])
+        self.assertEqual(
+            os.path.join(self.output_root, "55758663"), self.run_analysis.call_args.args[2]
+        )
+        # The plan was parsed once and kept warm across polls.
+        self.load_inputs.assert_called_once()
+        # ...and dropped once the case was analyzed.
+        self.assertEqual(0, self.daemon.inputs.cached_plan_count())
+
+    def test_completed_output_counts_as_analyzed_until_files_change(self):
+        for index in (1, 2, 3):
+            self._write_layer(index)
+        output_dir = os.path.join(self.output_root, "55758663")
+        os.makedirs(output_dir)
+        open(os.path.join(output_dir, "run_profile.json"), "w").close()
+
+        self.assertEqual([], self._poll_at(0.0))
+        self.assertEqual([], self._poll_at(30.0))
+
+        self._write_layer(4)
+        self.assertEqual([], self._poll_at(31.0))
+        self.assertEqual([self.case_dir], self._poll_at(41.0))
+
+    def test_output_of_an_interrupted_run_does_not_count_as_analyzed(self):
+        for index in (1, 2, 3):
+            self._write_layer(index)
+        os.makedirs(os.path.join(self.output_root, "55758663", ".layer_cache"))
+
+        self.assertEqual([], self._poll_at(0.0))
+        self.assertEqual([self.case_dir], self._poll_at(10.0))
+
+    def test_finished_case_is_not_rescanned_until_its_directories_change(self):
+        for index in (1, 2, 3):
+            self._write_layer(index)
+        self._poll_at(0.0)
+        self.assertEqual([self.case_dir], self._poll_at(10.0))
+
+        with mock.patch.object(
+            watch_daemon, "ptn_snapshot", wraps=watch_daemon.ptn_snapshot
+        ) as snapshot:
+            self.assertEqual([], self._poll_at(20.0))
+            snapshot.assert_not_called()
+
+            self._write_layer(4)
+            self.assertEqual([], self._poll_at(30.0))
+            self.assertEqual([self.case_dir], self._poll_at(40.0))
+            self.assertEqual(2, snapshot.call_count)
+
+    def test_failed_analysis_does_not_stop_polling(self):
+        for index in (1, 2, 3):
+            self._write_layer(index)
+        self.run_analysis.side_effect = RuntimeError("boom")
+
+        self._poll_at(0.0)
+        self.assertEqual([], self._poll_at(10.0))
+        self.assertEqual([], self._poll_at(20.0))
+        self.run_analysis.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()